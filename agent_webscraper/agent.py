@@ -1,117 +1,189 @@
 import os
 import re
+import uuid
 from typing import TypedDict, List
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.graph import StateGraph, END
+from llm_backend import get_chat_model
 from agent_webscraper.tools import (
     search_urls, extract_text_from_url, chunk_text, save_chunks,
-    check_target_reached, reset_counter, set_llm_instance, chunk_counter,
-    extract_topic_and_chunk
+    extract_topic_and_chunk, ScrapeRun
 )
+from agent_webscraper.frontier import EMPTY, FAILED, HARVESTED, IRRELEVANT, Frontier, canonical_url
+from metrics import metrics
 
 load_dotenv()
 
-# Initialize LLM
-try:
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.0-flash-lite",
-        google_api_key=os.environ["GOOGLE_API_KEY"],
-        temperature=0.3,
-        max_output_tokens=1200,
-    )
-    print("✅ LLM initialized")
-except Exception as e:
-    print(f"❌ LLM error: {e}")
-    llm = None
+MAX_CHUNKS_PER_URL = 10
+CHUNK_CHARS = 2000      # chunk_text's default max_chars
+TEXT_HEADROOM = 3       # extra text for chunks the relevance check rejects
+RESULTS_PER_PAGE = 10
+MAX_SEARCH_PAGES = int(os.getenv("SCRAPER_MAX_SEARCH_PAGES", "3"))  # result pages per topic before giving up
 
+_frontier = None
+
+def get_frontier():
+    """Search cache and per-URL outcomes shared by every run of this process"""
+    global _frontier
+    if _frontier is None:
+        _frontier = Frontier()
+    return _frontier
+
+async def search_page(topic, max_results, start):
+    return await search_urls.ainvoke({"topic": topic, "max_results": max_results, "start": start})
+
+def init_llm():
+    """Create the scraper LLM; returns None if it cannot be initialized"""
+    try:
+        llm = get_chat_model(
+            "gemini-2.0-flash-lite",
+            temperature=0.3,
+            max_output_tokens=1200,
+        )
+        print("✅ LLM initialized")
+    except Exception as e:
+        print(f"❌ LLM error: {e}")
+        llm = None
+    return llm
+
+# Everything a run counts or writes lives in its state, so concurrent runs on one
+# LangGraph server never share a counter or a chunk file name
 class AgentState(TypedDict):
     user_request: str
+    run_id: str
     topic: str
     target_chunks: int
     urls: List[str]
+    chunks_saved: int
+    chunk_files: List[str]
     completed: bool
 
 class WebScrapingAgent:
     def __init__(self, model):
         self.model = model
-        set_llm_instance(model)
 
-    def generate_urls(self, state: AgentState):
+    async def generate_urls(self, state: AgentState):
         """Extract topic and chunk count, then generate URLs."""
         user_request = state['user_request']
+        run_id = state.get("run_id") or uuid.uuid4().hex[:12]
         
         # Extract topic and chunk count using LLM
-        result = extract_topic_and_chunk.invoke({"user_request": user_request})
+        result = await extract_topic_and_chunk(self.model, user_request)
         
-        # Search for URLs using the extracted topic (max 10 URLs)
-        urls = search_urls.invoke({"topic": result["topic"], "max_results": 10})
+        # Search for URLs using the extracted topic (cached per normalised topic)
+        frontier = get_frontier()
+        urls, fetched = await frontier.asearch(result["topic"], search_page, per_page=RESULTS_PER_PAGE)
+        metrics.inc("pipeline_scraper_search_cache_total", result="miss" if fetched else "hit")
         
-        reset_counter.invoke({})
+        # Already harvested, irrelevant or known-bad URLs are skipped
+        pending = frontier.pending(urls)
+        print(f"[{run_id}] {'Searched' if fetched else 'Cached search'}: "
+              f"{len(pending)} of {len(urls)} URLs not scraped yet")
         
         return {
+            "run_id": run_id,
             "topic": result["topic"],
             "target_chunks": result["target_chunks"],
-            "urls": urls,
+            "urls": pending,
+            "chunks_saved": 0,
+            "chunk_files": [],
             "completed": False
         }
 
-    def scrape_and_save(self, state: AgentState):
-        """Scrape URLs and save chunks (max 10 chunks per URL)."""
-        urls = state["urls"]
-        user_request = state["user_request"]
-        target = state.get('target_chunks', 100)  # max 100 chunks (10 URLs x 10 chunks)
+    async def scrape_url(self, run, url, user_request):
+        """Scrape one URL; returns (frontier status, chunks saved, error)"""
+        print(f"  - [{run.run_id}] Processing: {url}")
+        # Only read as much of a document as the chunks still needed can use
+        needed = min(MAX_CHUNKS_PER_URL, run.remaining)
+        metrics.inc("pipeline_scraper_fetches_total")
+        text = await extract_text_from_url.ainvoke({"url": url, "max_chars": needed * CHUNK_CHARS * TEXT_HEADROOM})
+        
+        if str(text).startswith("Error"):
+            print(f"  - ⚠️ Failed to extract text")
+            return FAILED, 0, text
+        if len(text.strip()) < 100:
+            print(f"  - ⚠️ Failed to extract text")
+            return EMPTY, 0, None
         
-        print(f"📊 Target: {target} chunks from {len(urls)} URLs")
+        chunks = await chunk_text.ainvoke({"text": text})
+        if not chunks:
+            print(f"  - ⚠️ No chunks generated")
+            return EMPTY, 0, None
         
-        for url in urls:
-            if check_target_reached.invoke({"target": target}):
+        # Save max 10 chunks per URL
+        url_chunk_count = 0
+        errors = []
+        for chunk in chunks:
+            if url_chunk_count >= MAX_CHUNKS_PER_URL or run.reached:
                 break
             
-            print(f"  - Processing: {url}")
-            text = extract_text_from_url.invoke({"url": url})
-            
-            if "Error" in str(text) or len(text.strip()) < 100:
-                print(f"  - ⚠️ Failed to extract text")
-                continue
+            saved = await save_chunks(self.model, run, [chunk], url, user_request, errors)  # Pass single chunk
             
-            chunks = chunk_text.invoke({"text": text})
-            if not chunks:
-                print(f"  - ⚠️ No chunks generated")
-                continue
-            
-            # Save max 10 chunks per URL
-            url_chunk_count = 0
-            for chunk in chunks:
-                if url_chunk_count >= 10 or check_target_reached.invoke({"target": target}):
+            if saved:  # If chunk was saved (relevant)
+                url_chunk_count += 1
+        
+        if errors and not url_chunk_count:
+            # The LLM never answered, so nothing is known about relevance: retry after the cooldown
+            print(f"  - ⚠️ Relevance checks failed ({len(errors)} errors)")
+            return FAILED, 0, f"Relevance check failed: {errors[-1]}"
+        print(f"  - ✅ Saved {url_chunk_count} chunks from this URL")
+        return (HARVESTED if url_chunk_count else IRRELEVANT), url_chunk_count, None
+
+    async def scrape_and_save(self, state: AgentState):
+        """Scrape URLs and save chunks (max 10 chunks per URL)."""
+        urls = state["urls"]
+        user_request = state["user_request"]
+        target = state.get('target_chunks') or 100  # max 100 chunks (10 URLs x 10 chunks)
+        run = ScrapeRun(state["run_id"], target, count=state.get("chunks_saved", 0))
+        run.files = list(state.get("chunk_files", []))
+        frontier = get_frontier()
+        
+        print(f"📊 [{run.run_id}] Target: {target} chunks from {len(urls)} URLs")
+        
+        tried, pages = set(), 1
+        while True:
+            for url in urls:
+                if run.reached:
                     break
-                
-                saved = save_chunks.invoke({
-                    "chunks": [chunk],  # Pass single chunk
-                    "source_url": url,
-                    "user_request": user_request,
-                    "target_count": target
-                })
-                
-                if saved:  # If chunk was saved (relevant)
-                    url_chunk_count += 1
+                tried.add(canonical_url(url))
+                status, saved, error = await self.scrape_url(run, url, user_request)
+                frontier.record(url, status, chunks=saved, error=error, topic=state["topic"])
             
-            print(f"  - ✅ Saved {url_chunk_count} chunks from this URL")
+            if run.reached or pages >= MAX_SEARCH_PAGES:
+                break
+            # Cached results used up: ask the search API for the next page
+            more, fetched = await frontier.asearch(state["topic"], search_page, per_page=RESULTS_PER_PAGE, more=True)
+            if not fetched:
+                break
+            pages += 1
+            urls = [url for url in frontier.pending(more) if canonical_url(url) not in tried]
+            print(f"📄 [{run.run_id}] Search page {pages}: {len(urls)} new URLs")
         
-        completed = check_target_reached.invoke({"target": target})
-        print(f"\n✅ Complete: {chunk_counter['count']}/{target} chunks")
+        print(f"\n✅ [{run.run_id}] Complete: {run.count}/{target} chunks")
         
-        return {"completed": completed}
+        return {"completed": run.reached, "chunks_saved": run.count, "chunk_files": run.files}
+
+def build_graph(llm=None):
+    """Build the LLM (unless one is given) and compile the scraping graph (run it with ainvoke)"""
+    agent = WebScrapingAgent(model=llm if llm is not None else init_llm())
+
+    graph = StateGraph(AgentState)
+    graph.add_node("generate_urls", agent.generate_urls)
+    graph.add_node("scrape_and_save", agent.scrape_and_save)
 
-# Build graph
-agent = WebScrapingAgent(model=llm)
+    graph.set_entry_point("generate_urls")
+    graph.add_edge("generate_urls", "scrape_and_save")
+    graph.add_edge("scrape_and_save", END)
 
-graph = StateGraph(AgentState)
-graph.add_node("generate_urls", agent.generate_urls)
-graph.add_node("scrape_and_save", agent.scrape_and_save)
+    return graph.compile()
 
-graph.set_entry_point("generate_urls")
-graph.add_edge("generate_urls", "scrape_and_save")
-graph.add_edge("scrape_and_save", END)
+_web_agent = None
 
-web_agent = graph.compile()
+def __getattr__(name):
+    # langgraph.json points at `agent.py:web_agent`; compile it on first access, not on import
+    global _web_agent
+    if name == "web_agent":
+        if _web_agent is None:
+            _web_agent = build_graph()
+        return _web_agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,180 @@
+"""
+Streaming, size-capped document downloads for the web scraper.
+
+Responses are streamed into a spooled temp file (in memory up to 1 MB, then
+on disk) instead of being buffered whole, with caps on bytes and wall time.
+The document type is sniffed from the first bytes rather than trusted from
+the URL suffix. PDFs are read page by page and extraction stops as soon as
+enough text has been gathered for the chunks the agent still needs.
+
+afetch_text() streams with an httpx AsyncClient and runs PDF/DOCX/HTML
+extraction in a worker thread, so the async scraper graph never blocks its
+event loop.
+
+Limits (environment):
+    SCRAPER_MAX_BYTES      largest download in bytes (default 25 MB)
+    SCRAPER_MAX_SECONDS    wall-time cap per download (default 60)
+    SCRAPER_MAX_PDF_PAGES  most PDF pages read per document (default 200)
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from metrics import metrics
+
+MAX_BYTES = int(os.getenv("SCRAPER_MAX_BYTES", str(25 * 1024 * 1024)))
+MAX_SECONDS = float(os.getenv("SCRAPER_MAX_SECONDS", "60"))
+MAX_PDF_PAGES = int(os.getenv("SCRAPER_MAX_PDF_PAGES", "200"))
+SPOOL_BYTES = 1024 * 1024
+BLOCK_BYTES = 64 * 1024
+HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
+
+# Binary formats are useless when truncated, so they are rejected instead of cut off
+BINARY_KINDS = ("pdf", "docx")
+
+
+class DownloadTooLarge(Exception):
+    """A binary document exceeded the byte or time cap"""
+
+
+def sniff_kind(head, content_type="", url=""):
+    """Document type from the first bytes, falling back to headers and URL"""
+    start = head.lstrip(b"\xef\xbb\xbf \t\r\n")[:512].lower()
+    if b"%pdf-" in head[:1024].lower():
+        return "pdf"
+    if head.startswith(b"PK\x03\x04"):
+        return "docx" if ("openxmlformats" in content_type or url.lower().endswith(".docx")
+                          or b"word/" in head or b"[content_types].xml" in head.lower()) else None
+    if start.startswith((b"<!doctype html", b"<html", b"<head", b"<body", b"<?xml", b"<!--")) or b"<html" in start:
+        return "html"
+    if "html" in content_type or "xml" in content_type:
+        return "html"
+    if content_type.startswith("text/"):
+        return "text"
+    return None
+
+
+class _Capture:
+    """Spools streamed blocks under the byte and time caps"""
+
+    def __init__(self, url, headers, max_bytes, max_seconds):
+        self.url = url
+        self.content_type = headers.get("content-type", "").lower()
+        self.declared = int(headers.get("content-length") or 0)
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.deadline = time.time() + max_seconds
+        self.kind = None
+        self.spool = None
+        self.size = 0
+        self.truncated = False
+
+    def _start(self, head):
+        self.kind = sniff_kind(head, self.content_type, self.url)
+        if self.kind is None:
+            raise ValueError(f"unsupported content ({self.content_type or 'unknown type'})")
+        if self.kind in BINARY_KINDS and self.declared > self.max_bytes:
+            raise DownloadTooLarge(f"{self.kind} is {self.declared / 1e6:.1f} MB "
+                                   f"(cap {self.max_bytes / 1e6:.1f} MB)")
+        self.spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+
+    def add(self, block):
+        """Spool one block; False once a cap is hit and the stream should stop"""
+        if self.spool is None:
+            self._start(block)
+        if self.size + len(block) > self.max_bytes or (self.size and time.time() > self.deadline):
+            kept = max(self.max_bytes - self.size, 0)
+            self.spool.write(block[:kept])
+            self.size += kept
+            self.truncated = True
+            return False
+        self.spool.write(block)
+        self.size += len(block)
+        return True
+
+    def finish(self):
+        if self.spool is None:
+            self._start(b"")
+        metrics.inc("pipeline_scraper_bytes_total", min(self.size, self.max_bytes), kind=self.kind)
+        if self.truncated:
+            metrics.inc("pipeline_scraper_truncated_total", kind=self.kind)
+            if self.kind in BINARY_KINDS:
+                self.spool.close()
+                raise DownloadTooLarge(f"{self.kind} exceeded the {self.max_bytes / 1e6:.1f} MB / "
+                                       f"{self.max_seconds:.0f}s cap")
+        self.spool.seek(0)
+        return self.kind, self.spool, self.truncated, self.size
+
+
+async def adownload(url, client=None, max_bytes=MAX_BYTES, max_seconds=MAX_SECONDS):
+    """
+    Stream url into a spooled temp file on an httpx AsyncClient (a short-lived one
+    unless client is given). Returns (kind, file, truncated, size); HTML and text
+    are truncated at the caps, PDF/DOCX raise DownloadTooLarge.
+    """
+    import httpx
+    if client is None:
+        async with httpx.AsyncClient(headers=HEADERS, follow_redirects=True) as client:
+            return await adownload(url, client, max_bytes, max_seconds)
+    timeout = httpx.Timeout(30, connect=10)
+    async with client.stream("GET", url, headers=HEADERS, timeout=timeout, follow_redirects=True) as response:
+        response.raise_for_status()
+        capture = _Capture(url, response.headers, max_bytes, max_seconds)
+        async for block in response.aiter_bytes(BLOCK_BYTES):
+            if not capture.add(block):
+                break
+    return capture.finish()
+
+
+def pdf_text(fileobj, max_pages=MAX_PDF_PAGES, max_chars=0):
+    """Extract pages one at a time; stop at max_pages or once max_chars are gathered"""
+    import PyPDF2
+    reader = PyPDF2.PdfReader(fileobj)
+    parts, chars = [], 0
+    for number, page in enumerate(reader.pages):
+        if number >= max_pages or (max_chars and chars >= max_chars):
+            print(f"  - Read {number}/{len(reader.pages)} PDF pages ({chars} chars)")
+            break
+        text = page.extract_text() or ""
+        parts.append(text)
+        chars += len(text)
+    return "\n".join(parts).strip()
+
+
+def docx_text(fileobj, max_chars=0):
+    import docx
+    parts, chars = [], 0
+    for paragraph in docx.Document(fileobj).paragraphs:
+        if max_chars and chars >= max_chars:
+            break
+        parts.append(paragraph.text)
+        chars += len(paragraph.text)
+    return "\n".join(parts).strip()
+
+
+async def afetch_text(url, max_chars=0, client=None, max_bytes=MAX_BYTES, max_pages=MAX_PDF_PAGES,
+                      max_seconds=MAX_SECONDS):
+    """Download url with caps and return its text (max_chars=0 means no text budget); extraction runs in a worker thread"""
+    with metrics.timer("scraper_fetch"):
+        kind, spool, truncated, size = await adownload(url, client, max_bytes, max_seconds)
+    return await asyncio.to_thread(extract_text, kind, spool, truncated, max_chars, max_bytes, max_pages)
+
+
+def extract_text(kind, spool, truncated, max_chars=0, max_bytes=MAX_BYTES, max_pages=MAX_PDF_PAGES):
+    """Text of a downloaded document; closes the spool"""
+    if truncated:
+        print(f"  - ⚠️ Download capped at {max_bytes / 1e6:.1f} MB, using the first part of the page")
+    with spool, metrics.timer("scraper_extract"):
+        if kind == "pdf":
+            return pdf_text(spool, max_pages, max_chars)
+        if kind == "docx":
+            return docx_text(spool, max_chars)
+        content = spool.read()
+        if kind == "text":
+            return content.decode("utf-8", errors="replace").strip()
+        # lxml + readability-style scoring keeps only the main content, so sidebars,
+        # cookie banners and related-article lists never become chunks
+        from agent_webscraper.html_extractor import extract_main_text
+        return extract_main_text(content)
@@ -0,0 +1,222 @@
+"""
+Persistent search cache and URL frontier for the scraper agent.
+
+Search results are cached per normalised topic ("Nepal trekking permits" and
+"permits for trekking in Nepal" share one entry), and every URL is keyed by
+its canonical form: https, lower-case host without "www.", no fragment, no
+tracking parameters (utm_*, gclid, fbclid, ...), sorted query. Each URL keeps
+its last scrape outcome:
+
+    harvested   chunks were saved from it
+    irrelevant  text was extracted but the relevance check rejected every chunk
+    empty       too little text or no chunks
+    failed      download or extraction error
+
+Later runs skip harvested, irrelevant and empty URLs and retry failed ones
+only after SCRAPER_RETRY_HOURS, at most SCRAPER_MAX_FAILURES times. When the
+cached results run out, the next page of search results is fetched.
+
+Settings (environment):
+    SCRAPER_FRONTIER_DB       SQLite file (default dataset/scrape_frontier.db)
+    SCRAPER_SEARCH_TTL_DAYS   age before a cached search is refreshed (default 7)
+    SCRAPER_RETRY_HOURS       wait before retrying a failed URL (default 24)
+    SCRAPER_MAX_FAILURES      failures before a URL is given up (default 3)
+
+    python -m agent_webscraper.frontier stats
+    python -m agent_webscraper.frontier forget https://example.com/page
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+FRONTIER_DB = os.getenv("SCRAPER_FRONTIER_DB", "dataset/scrape_frontier.db")
+SEARCH_TTL_SECONDS = float(os.getenv("SCRAPER_SEARCH_TTL_DAYS", "7")) * 86400
+RETRY_SECONDS = float(os.getenv("SCRAPER_RETRY_HOURS", "24")) * 3600
+MAX_FAILURES = int(os.getenv("SCRAPER_MAX_FAILURES", "3"))
+
+HARVESTED, IRRELEVANT, EMPTY, FAILED = "harvested", "irrelevant", "empty", "failed"
+DONE_STATUSES = (HARVESTED, IRRELEVANT, EMPTY)
+
+TRACKING_PARAMS = re.compile(
+    r"^(utm_\w+|gclid|gclsrc|dclid|fbclid|msclkid|yclid|igshid|mc_cid|mc_eid|_ga|_gl|_hsenc|_hsmi|"
+    r"ref|ref_src|referrer|spm|cmpid|icid|trk|trkcampaign)$", re.I)
+TOPIC_STOPWORDS = {"a", "an", "and", "the", "of", "for", "in", "on", "to", "about", "with", "at", "by", "from",
+                   "info", "information", "guide", "guides"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    topic_key TEXT PRIMARY KEY,
+    topic TEXT,
+    urls TEXT NOT NULL,
+    pages INTEGER NOT NULL,
+    exhausted INTEGER NOT NULL DEFAULT 0,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS urls (
+    canonical TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status TEXT,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    topic_key TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS urls_status ON urls (status);
+"""
+
+
+def canonical_url(url):
+    """Canonical form used to recognise duplicates of the same page"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https"):
+        return url.strip()
+    host = (parts.hostname or "").lower().rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    port = parts.port
+    netloc = host if port in (None, DEFAULT_PORTS[scheme]) else f"{host}:{port}"
+    path = re.sub(r"/{2,}", "/", parts.path or "/")
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if not TRACKING_PARAMS.match(k))
+    # http and https copies of a page are the same document
+    return urlunsplit(("https", netloc, path, urlencode(query), ""))
+
+
+def topic_key(topic):
+    """Order- and filler-insensitive key for a search topic"""
+    words = re.findall(r"[a-z0-9]+", (topic or "").lower())
+    return " ".join(sorted({w for w in words if w not in TOPIC_STOPWORDS})) or (topic or "").strip().lower()
+
+
+class Frontier:
+    """SQLite-backed search cache and per-URL scrape outcomes"""
+
+    def __init__(self, path=FRONTIER_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def cached_search(self, topic):
+        """(urls, pages fetched, exhausted) for a fresh cached search, or None"""
+        row = self.db.execute("SELECT urls, pages, exhausted, fetched_at FROM searches WHERE topic_key = ?",
+                              (topic_key(topic),)).fetchone()
+        if row is None or time.time() - row[3] > SEARCH_TTL_SECONDS:
+            return None
+        return json.loads(row[0]), row[1], bool(row[2])
+
+    def store_search(self, topic, urls, pages, exhausted):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?, ?, ?)",
+                            (topic_key(topic), topic, json.dumps(urls), pages, int(exhausted), time.time()))
+
+    def search(self, topic, search_fn, per_page=10, more=False):
+        """
+        URLs for topic, de-duplicated by canonical form (the first-seen spelling is
+        kept for fetching). Uses the cache unless `more` asks for the next page;
+        search_fn(topic, max_results, start) -> urls. Returns (urls, fetched) where
+        fetched says whether the search API was called.
+        """
+        cached = self.cached_search(topic)
+        if cached and (not more or cached[2]):
+            return cached[0], False
+        urls, pages = (cached[0], cached[1]) if cached else ([], 0)
+        return self._add_page(topic, urls, pages, search_fn(topic, per_page, pages * per_page), per_page)
+
+    async def asearch(self, topic, search_fn, per_page=10, more=False):
+        """search() with a coroutine search_fn"""
+        cached = self.cached_search(topic)
+        if cached and (not more or cached[2]):
+            return cached[0], False
+        urls, pages = (cached[0], cached[1]) if cached else ([], 0)
+        return self._add_page(topic, urls, pages, await search_fn(topic, per_page, pages * per_page), per_page)
+
+    def _add_page(self, topic, urls, pages, page, per_page):
+        if not page and not urls:
+            # Nothing found, or the search API failed: do not cache an empty result
+            return [], True
+        seen = {canonical_url(url) for url in urls}
+        for url in page:
+            canonical = canonical_url(url)
+            if canonical not in seen:
+                seen.add(canonical)
+                urls.append(url)
+        self.store_search(topic, urls, pages + 1, exhausted=len(page) < per_page)
+        return urls, True
+
+    def status(self, url):
+        row = self.db.execute("SELECT status, failures, updated_at FROM urls WHERE canonical = ?",
+                              (canonical_url(url),)).fetchone()
+        return row
+
+    def should_fetch(self, url):
+        """False for harvested, irrelevant and empty URLs and for failed ones still cooling down"""
+        row = self.status(url)
+        if row is None or row[0] is None:
+            return True
+        status, failures, updated_at = row
+        if status in DONE_STATUSES:
+            return False
+        return failures < MAX_FAILURES and time.time() - updated_at >= RETRY_SECONDS
+
+    def pending(self, urls):
+        return [url for url in urls if self.should_fetch(url)]
+
+    def record(self, url, status, chunks=0, error=None, topic=None):
+        """Store the outcome of one scrape attempt"""
+        failed = status == FAILED
+        with self.db:
+            self.db.execute(
+                "INSERT INTO urls (canonical, url, status, chunks, failures, last_error, topic_key, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (canonical) DO UPDATE SET "
+                "url = excluded.url, status = excluded.status, chunks = urls.chunks + excluded.chunks, "
+                "failures = urls.failures + excluded.failures, last_error = excluded.last_error, "
+                "topic_key = COALESCE(excluded.topic_key, urls.topic_key), updated_at = excluded.updated_at",
+                (canonical_url(url), url, status, chunks, int(failed), str(error)[:500] if error else None,
+                 topic_key(topic) if topic else None, time.time()))
+
+    def forget(self, url):
+        with self.db:
+            return self.db.execute("DELETE FROM urls WHERE canonical = ?", (canonical_url(url),)).rowcount
+
+    def counts(self):
+        rows = self.db.execute("SELECT COALESCE(status, 'new'), COUNT(*), SUM(chunks) FROM urls GROUP BY 1")
+        return {status: {"urls": n, "chunks": chunks or 0} for status, n, chunks in rows}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect the scraper's search cache and URL frontier")
+    parser.add_argument("--db", default=FRONTIER_DB)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="URLs and chunks per scrape outcome")
+    forget = subparsers.add_parser("forget", help="Make a URL eligible for scraping again")
+    forget.add_argument("url")
+    args = parser.parse_args(argv)
+
+    frontier = Frontier(args.db)
+    if args.command == "stats":
+        searches = frontier.db.execute("SELECT COUNT(*), SUM(pages) FROM searches").fetchone()
+        print(f"{searches[0]} cached searches ({searches[1] or 0} result pages)")
+        for status, row in sorted(frontier.counts().items()):
+            print(f"  {status:<11} {row['urls']:>6} URLs {row['chunks']:>7} chunks")
+    else:
+        print(f"Forgot {frontier.forget(args.url)} URL")
+    frontier.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Main-content extraction for scraped HTML pages.
+
+Parses with lxml (C parser, much faster than BeautifulSoup's html.parser) and
+isolates the article with readability-style scoring:
+
+1. Drop non-content tags and elements whose class/id/role marks them as
+   navigation, cookie banners, sidebars, share bars, related-article lists,
+   comments or ads. Class and id hints are matched as whole words ("lead-in"
+   is not an ad); boilerplate words win over content words ("related-posts",
+   "comment-body" go), page furniture such as header/footer only goes when
+   nothing names it content ("entry-header" stays)
+2. Score every paragraph-like block by text length and commas, credit the
+   score to its parent (and half to its grandparent), weight by class/id
+   hints and discount by link density
+3. Keep the best candidate plus siblings that score close to it
+
+What is left becomes the chunks, so fewer boilerplate chunks reach the
+relevance LLM.
+"""
+
+import re
+
+from lxml import etree, html
+
+DROP_TAGS = ["script", "style", "noscript", "template", "iframe", "svg", "canvas", "form", "button",
+             "select", "input", "textarea", "nav", "header", "footer", "aside", "menu", "dialog"]
+BLOCK_TAGS = {"p", "div", "section", "article", "main", "h1", "h2", "h3", "h4", "h5", "h6", "li", "ul", "ol",
+              "pre", "blockquote", "table", "tr", "td", "th", "dd", "dt", "dl", "br", "figcaption"}
+SCORED_TAGS = ("p", "pre", "td", "blockquote", "li", "dd")
+
+# Words of class/id hints, after splitting on whitespace, "-" and "_"
+BOILERPLATE_WORDS = {
+    "comment", "comments", "cookie", "cookies", "consent", "gdpr", "banner", "banners", "sidebar", "widget",
+    "widgets", "related", "recommend", "recommended", "recommendations", "share", "sharing", "social", "promo",
+    "promos", "promotion", "newsletter", "subscribe", "signup", "popup", "modal", "advert", "advertisement",
+    "advertising", "sponsor", "sponsored", "ad", "ads", "breadcrumb", "breadcrumbs", "pagination", "pager",
+    "authorbio",
+}
+FURNITURE_WORDS = {"menu", "masthead", "footer", "header", "nav", "navbar", "navigation", "toolbar", "disclaimer",
+                   "skip", "overlay"}
+CONTENT_WORDS = {"article", "content", "main", "post", "entry", "body", "text", "story", "blog", "page"}
+# Layout state on a container ("has-sidebar", "no-comments") says nothing about its own text
+STATE_PREFIXES = ("has-", "with-", "no-", "is-")
+NEGATIVE_ROLES = {"navigation", "banner", "complementary", "contentinfo", "search", "dialog", "alertdialog"}
+
+MIN_BLOCK_CHARS = 25
+MIN_MAIN_CHARS = 200
+
+
+def _hint(element):
+    return f"{element.get('class', '')} {element.get('id', '')}"
+
+
+def hint_words(element):
+    """Whole words of the class/id hint (a "side-bar" token also yields "sidebar")"""
+    words = set()
+    for token in _hint(element).lower().split():
+        if token.startswith(STATE_PREFIXES):
+            continue
+        words.update(w for w in re.split(r"[-_]+", token) if w)
+        words.add(re.sub(r"[-_]+", "", token))
+    return words
+
+
+def is_boilerplate_hint(words):
+    return bool(words & BOILERPLATE_WORDS) or (bool(words & FURNITURE_WORDS) and not words & CONTENT_WORDS)
+
+
+def class_weight(element):
+    words = hint_words(element)
+    if not words:
+        return 0
+    weight = 0
+    if words & (BOILERPLATE_WORDS | FURNITURE_WORDS):
+        weight -= 25
+    if words & CONTENT_WORDS:
+        weight += 25
+    return weight
+
+
+def _text(element):
+    return " ".join(element.text_content().split())
+
+
+def link_density(element):
+    text_length = len(_text(element))
+    if not text_length:
+        return 0.0
+    link_length = sum(len(_text(a)) for a in element.iter("a"))
+    return min(link_length / text_length, 1.0)
+
+
+def _is_hidden(element):
+    style = element.get("style", "").replace(" ", "").lower()
+    return ("display:none" in style or "visibility:hidden" in style
+            or element.get("aria-hidden") == "true" or element.get("hidden") is not None)
+
+
+def strip_boilerplate(root):
+    """Remove non-content tags and elements marked as navigation/ads/banners"""
+    etree.strip_elements(root, *DROP_TAGS, etree.Comment, with_tail=False)
+    doomed = []
+    for element in root.iter(etree.Element):
+        if element.tag in ("html", "body"):
+            continue
+        if element.get("role") in NEGATIVE_ROLES or _is_hidden(element):
+            doomed.append(element)
+            continue
+        if is_boilerplate_hint(hint_words(element)):
+            doomed.append(element)
+        elif element.tag in ("ul", "ol") and link_density(element) > 0.5:
+            doomed.append(element)  # link lists: related articles, tag clouds, menus
+    for element in doomed:
+        parent = element.getparent()
+        if parent is not None:
+            element.drop_tree()
+
+
+def score_candidates(root):
+    """Readability scoring: {element: score} for parents of paragraph-like blocks"""
+    scores = {}
+
+    def initial(element):
+        score = class_weight(element)
+        if element.tag in ("article", "main"):
+            score += 10
+        elif element.tag in ("div", "section"):
+            score += 5
+        elif element.tag in ("td", "blockquote", "pre"):
+            score += 3
+        return score
+
+    for block in root.iter(*SCORED_TAGS):
+        text = _text(block)
+        if len(text) < MIN_BLOCK_CHARS:
+            continue
+        parent = block.getparent()
+        if parent is None:
+            continue
+        grandparent = parent.getparent()
+        content_score = 1 + text.count(",") + min(len(text) // 100, 3)
+        for node, share in ((parent, 1.0), (grandparent, 0.5)):
+            if node is None or not isinstance(node.tag, str):
+                continue
+            if node not in scores:
+                scores[node] = initial(node)
+            scores[node] += content_score * share
+
+    return {node: score * (1 - link_density(node)) for node, score in scores.items()}
+
+
+def select_content(root):
+    """Best-scoring candidate plus siblings that look like part of the same article"""
+    scores = score_candidates(root)
+    if not scores:
+        return [root]
+    top = max(scores, key=scores.get)
+    parent = top.getparent()
+    if parent is None:
+        return [top]
+
+    threshold = max(10.0, scores[top] * 0.2)
+    selected = []
+    for sibling in parent:
+        if not isinstance(sibling.tag, str):
+            continue
+        if sibling is top or scores.get(sibling, 0) >= threshold:
+            selected.append(sibling)
+        elif sibling.tag == "p":
+            text = _text(sibling)
+            density = link_density(sibling)
+            if (len(text) > 80 and density < 0.25) or (text.endswith((".", "!", "?")) and density == 0):
+                selected.append(sibling)
+    return selected
+
+
+def to_text(elements):
+    """Text with one line per block element"""
+    lines = []
+    for element in elements:
+        for block in element.iter(*BLOCK_TAGS):
+            block.tail = "\n" + (block.tail or "")
+            if block.tag != "br":
+                block.text = "\n" + (block.text or "")
+        lines.extend(element.text_content().splitlines())
+    lines = (" ".join(line.split()) for line in lines)
+    return "\n".join(line for line in lines if line)
+
+
+def parse(content):
+    """lxml document from bytes (lets lxml honour <meta charset>) or str"""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return html.document_fromstring(content, parser=html.HTMLParser(remove_comments=True, recover=True))
+
+
+def extract_main_text(content):
+    """Main article text of an HTML page, one block per line ("" if there is none)"""
+    root = parse(content)
+    body = root.find("body")
+    if body is None:
+        body = root
+    strip_boilerplate(body)
+    text = to_text(select_content(body))
+    if len(text) < MIN_MAIN_CHARS:
+        # Scoring found no article (e.g. a list or landing page): fall back to the cleaned body
+        text = to_text([body])
+    return text if len(text.strip()) > 50 else ""
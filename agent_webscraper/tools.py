@@ -1,30 +1,49 @@
 from langchain_core.tools import tool
-from bs4 import BeautifulSoup
+import asyncio
 import json
 import re
 import os
-import requests
-from serpapi import GoogleSearch
 from dotenv import load_dotenv
 from agent_webscraper.prompt import inspection_prompt, extract_chunk_count_and_topic_prompt
-import PyPDF2
-import docx
-import io
+from agent_webscraper.downloader import afetch_text
+from metrics import metrics
+from rate_control import AIMDController
 load_dotenv()
 
-chunk_counter = {"count": 0}
 SERPAPI_KEY = os.getenv("SERPAPI_KEY")
-llm_instance = None
+CHUNK_DIR = "chunks"
 
-def set_llm_instance(llm):
-    global llm_instance
-    llm_instance = llm
+# Retries with backoff for scraper LLM calls. One controller per process: concurrent
+# runs share the provider quota, so AIMD settles the combined in-flight limit.
+llm_controller = AIMDController("scraper_relevance", initial_limit=2,
+                                max_limit=int(os.getenv("SCRAPER_LLM_MAX_CONCURRENCY", "8")))
 
-@tool
-def extract_topic_and_chunk(user_request: str) -> dict:
+class ScrapeRun:
+    """Counter and output paths of one scraping run; nothing here is shared between runs"""
+
+    def __init__(self, run_id, target, count=0, output_dir=CHUNK_DIR):
+        self.run_id = run_id
+        self.target = target
+        self.count = count
+        self.output_dir = output_dir
+        self.files = []
+
+    @property
+    def reached(self):
+        return self.count >= self.target
+
+    @property
+    def remaining(self):
+        return max(self.target - self.count, 0)
+
+    def chunk_path(self, index):
+        # <prefix>_chunk_<n>.json, the name syntheticdatageneration and lineage look for
+        return os.path.join(self.output_dir, f"web_{self.run_id}_chunk_{index}.json")
+
+async def extract_topic_and_chunk(llm, user_request: str) -> dict:
     """Extract topic and chunk count from user request using LLM."""
     extraction_prompt = extract_chunk_count_and_topic_prompt(user_request)
-    response = llm_instance.invoke(extraction_prompt)
+    response = await llm_controller.acall(llm.ainvoke, extraction_prompt)
     response_text = response.content.strip()
     
     chunks = None
@@ -38,13 +57,18 @@ def extract_topic_and_chunk(user_request: str) -> dict:
     
     return {"topic": topic, "target_chunks": chunks}
 
+def _serpapi_search(params):
+    from serpapi import GoogleSearch
+    return GoogleSearch(params).get_dict()
+
 @tool
-def search_urls(topic: str, max_results: int = 5) -> list:
-    """Search for URLs using SerpAPI with topic from LLM."""
+async def search_urls(topic: str, max_results: int = 5, start: int = 0) -> list:
+    """Search for URLs using SerpAPI with topic from LLM (start = result offset for later pages)."""
     try:
         params = {"q": topic, 
                   "api_key": SERPAPI_KEY, 
                   "num": max_results,
+                  "start": start,
                   "engine": "google",  # Specify the search engine
                     "google_domain": "google.com",
                     "hl": "en",
@@ -52,9 +76,10 @@ def search_urls(topic: str, max_results: int = 5) -> list:
                     "location_requested": "Austin, Texas, United States",
                     "device": "desktop",  # Optional: specify device type
                   }
-        search = GoogleSearch(params)
-        results = search.get_dict()
+        # The SerpAPI client is blocking; one call per result page, so a worker thread is enough
+        results = await asyncio.to_thread(_serpapi_search, params)
         urls = [r["link"] for r in results.get("organic_results", []) if "link" in r][:max_results]
+        metrics.inc("pipeline_scraper_searches_total")
         print(f"Found {len(urls)} URLs for topic: {topic}")
         return urls
     except Exception as e:
@@ -62,28 +87,11 @@ def search_urls(topic: str, max_results: int = 5) -> list:
         return []
 
 @tool
-def extract_text_from_url(url: str) -> str:
-    """Extract text from URL (HTML, PDF, DOCX)."""
+async def extract_text_from_url(url: str, max_chars: int = 0) -> str:
+    """Extract text from URL (HTML, PDF, DOCX); stop reading once max_chars are gathered (0 = all)."""
     try:
-        headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
-        response = requests.get(url, timeout=10, headers=headers)
-        response.raise_for_status()
-        content_type = response.headers.get('content-type', '').lower()
-        
-        if url.lower().endswith('.pdf') or 'pdf' in content_type:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(response.content))
-            text = "\n".join(page.extract_text() for page in pdf_reader.pages)
-            return text.strip()
-        elif url.lower().endswith('.docx') or 'openxmlformats' in content_type:
-            doc = docx.Document(io.BytesIO(response.content))
-            text = "\n".join(p.text for p in doc.paragraphs)
-            return text.strip()
-        else:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            for tag in soup(["script", "style", "nav", "header", "footer"]):
-                tag.decompose()
-            text = soup.get_text(separator="\n", strip=True)
-            return re.sub(r"\n{2,}", "\n", text) if len(text.strip()) > 50 else ""
+        # Streamed, size-capped async download with content sniffing and page-by-page PDF extraction
+        return await afetch_text(url, max_chars=max_chars)
     except Exception as e:
         return f"Error: {str(e)}"
 
@@ -103,13 +111,16 @@ def chunk_text(text: str, max_chars: int = 2000) -> list:
         chunks.append(current.strip())
     return chunks
 
-def _is_chunk_relevant(chunk: str, user_request: str) -> dict:
+async def _is_chunk_relevant(llm, chunk: str, user_request: str) -> dict:
     """Check if chunk is relevant using LLM."""
-    if not llm_instance:
+    if not llm:
         return {"is_relevant": True, "reason": "No LLM available"}
     
     try:
-        response = llm_instance.invoke(inspection_prompt(user_request, chunk))
+        with metrics.timer("scraper_relevance"):
+            response = await llm_controller.acall(llm.ainvoke, inspection_prompt(user_request, chunk))
+        metrics.record_tokens("scraper_relevance", response)
+        metrics.item_done("scraper_relevance")
         response_text = response.content.strip()
         is_relevant = "RELEVANT: YES" in response_text.upper()
         reason = response_text.split("REASON:")[1].strip() if "REASON:" in response_text else "No reason"
@@ -117,53 +128,47 @@ def _is_chunk_relevant(chunk: str, user_request: str) -> dict:
         print(f"    {'✅ RELEVANT' if is_relevant else '❌ NOT RELEVANT'}: {reason[:80]}...")
         return {"is_relevant": is_relevant, "reason": reason}
     except Exception as e:
+        metrics.inc("pipeline_errors_total", stage="scraper_relevance")
         print(f"Quality check failed: {e}")
-        return {"is_relevant": False, "reason": f"Failed: {str(e)}"}
+        return {"is_relevant": False, "reason": f"Failed: {str(e)}", "error": str(e)}
 
-@tool
-def save_chunks(chunks: list, source_url: str, user_request: str, target_count: int) -> list:
-    """Save relevant chunks to files."""
-    os.makedirs("./chunks", exist_ok=True)
+async def save_chunks(llm, run: ScrapeRun, chunks: list, source_url: str, user_request: str, errors: list = None) -> list:
+    """Save relevant chunks to this run's files; relevance checks that errored are appended to `errors`."""
+    os.makedirs(run.output_dir, exist_ok=True)
     saved = []
     
     for chunk in chunks:
-        if chunk_counter["count"] >= target_count or len(chunk.strip()) < 100:
+        if run.reached or len(chunk.strip()) < 100:
             break
         
         # Check relevance
-        check = _is_chunk_relevant(chunk, user_request)
+        check = await _is_chunk_relevant(llm, chunk, user_request)
+        if check.get("error") and errors is not None:
+            errors.append(check["error"])
         if not check["is_relevant"]:
-            print(f"  - Skipping chunk {chunk_counter['count']}: {check['reason'][:50]}...")
+            print(f"  - Skipping chunk {run.count}: {check['reason'][:50]}...")
             continue
         
         # Save chunk
         chunk_data = {
             "source_file": source_url,
-            "chunk_index": chunk_counter["count"],
+            "chunk_index": run.count,
             "raw_text": chunk,
             "contextualized_text": chunk,
             "metadata": {
                 "chunk_size": len(chunk),
-                "contextualized_size": len(chunk)
+                "contextualized_size": len(chunk),
+                "run_id": run.run_id
             }
         }
         
-        filename = f"chunks/chunk_{chunk_counter['count']}.json"
-        with open(filename, "w", encoding="utf-8") as f:
+        filename = run.chunk_path(run.count)
+        with metrics.timer("scraper_write"), open(filename, "w", encoding="utf-8") as f:
             json.dump(chunk_data, f, ensure_ascii=False, indent=2)
         
         saved.append(chunk_data)
-        chunk_counter["count"] += 1
-        print(f"  - ✅ Saved chunk {chunk_counter['count']-1}")
+        run.files.append(filename)
+        run.count += 1
+        print(f"  - ✅ Saved chunk {run.count-1}")
     
     return saved
-
-@tool
-def check_target_reached(target: int) -> bool:
-    """Check if target chunk count reached."""
-    return chunk_counter["count"] >= target
-
-@tool
-def reset_counter():
-    """Reset chunk counter."""
-    chunk_counter["count"] = 0
\ No newline at end of file
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Synthetic corpora for the benchmarks, at any size.
+
+Every generator is seeded and writes the exact layout the pipeline reads:
+
+- chunks/<name>_chunk_<n>.json   (chunk_generation.py output)
+- dataset/raw.json               (syntheticdatageneration.py output)
+- dataset/unfiltered.json        (preprocess.py output)
+
+plus raw LLM response texts (fenced generation JSON with stray control
+characters, single-quoted judge JSON) for the parsing paths.
+
+Usage:
+    python -m benchmarks.corpus --chunks 500 --entries 500 --pairs 15 --records 5000 --output /tmp/corpus
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.pipeline_throughput import VOCABULARY, make_chunk_text, write_synthetic_chunks  # noqa: E402
+
+
+def make_sentence(rng, low=6, high=16):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(low, high))).capitalize()
+
+
+def make_pair(rng):
+    """One Q&A pair with markdown in the answer, like the generation prompt asks for"""
+    question = make_sentence(rng, 6, 12) + "?"
+    bullets = "<br>".join(f"- **{rng.choice(VOCABULARY)}**: {make_sentence(rng)}." for _ in range(rng.randint(1, 4)))
+    answer = f"{make_sentence(rng, 10, 25)} costs {rng.randint(10, 5000)} USD.<br>{bullets}"
+    return {"question": question, "answer": answer}
+
+
+def make_raw_dataset(entries, pairs=15, seed=0):
+    """raw.json content: one entry per chunk file, keyed by chunk file name"""
+    rng = random.Random(seed)
+    dataset = {}
+    for i in range(entries):
+        name = f"synthetic_chunk_{i:03d}.json"
+        context = make_chunk_text(rng, sentences=4)
+        dataset[name] = {
+            "generated": [make_pair(rng) for _ in range(pairs)],
+            "context": context[:500] + "...",
+            "chunk_file": name,
+            "chunk_digest": f"{rng.getrandbits(256):064x}",
+            "source_info": f"Source: data/synthetic_{i % 5}.pdf, Chunk: {i}",
+        }
+    return dataset
+
+
+def make_unfiltered(records, seed=0):
+    """unfiltered.json content: flattened Q&A pairs with source columns"""
+    rng = random.Random(seed)
+    return [{**make_pair(rng), "chunk_file": f"synthetic_chunk_{i // 15:03d}.json",
+             "source_file": f"data/synthetic_{i % 5}.pdf"} for i in range(records)]
+
+
+def make_generation_response(pairs=15, seed=0):
+    """A generation reply as models send it: fenced JSON with stray control characters"""
+    rng = random.Random(seed)
+    body = json.dumps({"records": [make_pair(rng) for _ in range(pairs)]}, indent=2)
+    noisy = "".join(ch + ("\x0b" if rng.random() < 0.002 else "") for ch in body)
+    return f"```json\n{noisy}\n```"
+
+
+def make_judge_response(records=5, seed=0):
+    """A judge reply with single-quoted JSON, which needs the quote repair path"""
+    rng = random.Random(seed)
+    items = []
+    for _ in range(records):
+        items.append("{'quality': {'accuracy': {'score': %d, 'explanation': '%s'}, "
+                     "'style': {'score': %d, 'explanation': '%s'}}}"
+                     % (rng.randint(1, 10), make_sentence(rng), rng.randint(1, 10), make_sentence(rng)))
+    return "```json\n[" + ", ".join(items) + "]\n```"
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+
+def write_corpus(output, chunks=0, entries=0, pairs=15, records=0, seed=0):
+    """Write the requested corpora under output; returns the written paths"""
+    written = []
+    if chunks:
+        write_synthetic_chunks(output, chunks, seed=seed)
+        written.append(os.path.join(output, "chunks"))
+    if entries:
+        path = os.path.join(output, "dataset", "raw.json")
+        write_json(path, make_raw_dataset(entries, pairs, seed))
+        written.append(path)
+    if records:
+        path = os.path.join(output, "dataset", "unfiltered.json")
+        write_json(path, make_unfiltered(records, seed))
+        written.append(path)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic chunk, raw.json and unfiltered.json corpora")
+    parser.add_argument("--chunks", type=int, default=0, help="Chunk files to write")
+    parser.add_argument("--entries", type=int, default=0, help="raw.json entries to write")
+    parser.add_argument("--pairs", type=int, default=15, help="Q&A pairs per raw.json entry")
+    parser.add_argument("--records", type=int, default=0, help="unfiltered.json records to write")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True, help="Working directory to write into")
+    args = parser.parse_args(argv)
+
+    for path in write_corpus(args.output, args.chunks, args.entries, args.pairs, args.records, args.seed):
+        print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
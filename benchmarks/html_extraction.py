@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+HTML extraction benchmark: lxml main-content extractor vs the previous
+BeautifulSoup html.parser approach in agent_webscraper.tools.
+
+For every page in a stored corpus (a folder of .html files) both extractors
+run, their output is chunked the way the scraper chunks it, and the report
+compares parse time, extracted size, chunk counts and the boilerplate-chunk
+rate - chunks that would cost a relevance-LLM call only to be rejected.
+
+On synthetic pages (--synthetic) the article sentences are known, so a chunk
+counts as boilerplate when less than half its text comes from the article.
+They include prose boilerplate marked only by its class (related-posts,
+comment-body, sidebar-content, pager) and article paragraphs whose classes
+contain boilerplate letters (lead-in, download-info, thread-summary).
+On a stored corpus a chunk counts as boilerplate when most of its lines are
+short link-like fragments or match common banner/navigation phrases.
+
+Usage:
+    python -m benchmarks.html_extraction --corpus path/to/html_pages
+    python -m benchmarks.html_extraction --synthetic 200 --save-corpus benchmarks/corpus/html
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from agent_webscraper.html_extractor import extract_main_text  # noqa: E402
+from benchmarks.pipeline_throughput import VOCABULARY, make_chunk_text  # noqa: E402
+
+MIN_CHUNK_CHARS = 100   # save_chunks skips shorter chunks without an LLM call
+BOILERPLATE_LINE = re.compile(
+    r"cookie|consent|subscribe|newsletter|sign (up|in)|log ?in|related (posts|articles)|share (this|on)|"
+    r"all rights reserved|copyright|©|privacy policy|terms of (use|service)|follow us|read more|"
+    r"advertisement|skip to|menu|home\s*[|›»/]", re.I)
+
+BOILERPLATE_SNIPPETS = {
+    "cookie": ["We use cookies to improve your experience on our website. By continuing to browse you accept "
+               "our use of cookies and our privacy policy, including analytics and advertising partners."],
+    "newsletter": ["Subscribe to our weekly newsletter and get the best travel deals, exclusive offers and "
+                   "insider guides delivered straight to your inbox every Friday morning, free forever."],
+    "footer": ["Copyright 2024 Example Travel Media Group. All rights reserved. Terms of use, privacy policy, "
+               "cookie settings, accessibility statement, advertise with us, careers and contact information."],
+    "comment": ["Great article, thanks for sharing! I visited last spring and it was amazing, would definitely "
+                "recommend going with a local guide, they know all the best places to stay and eat."],
+}
+
+
+def baseline_extract(content):
+    """The previous extract_text_from_url HTML branch"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, "html.parser")
+    for tag in soup(["script", "style", "nav", "header", "footer"]):
+        tag.decompose()
+    text = soup.get_text(separator="\n", strip=True)
+    return re.sub(r"\n{2,}", "\n", text) if len(text.strip()) > 50 else ""
+
+
+def chunk_sentences(text, max_chars=2000):
+    """Same splitting as tools.chunk_text"""
+    sentences = re.split(r"(?<=[.!?])\s+", text)
+    chunks, current = [], ""
+    for sentence in sentences:
+        if len(current) + len(sentence) <= max_chars:
+            current += sentence + " "
+        else:
+            if current.strip():
+                chunks.append(current.strip())
+            current = sentence + " "
+    if current.strip():
+        chunks.append(current.strip())
+    return chunks
+
+
+def _links(rng, count):
+    return "".join(f'<li><a href="/{rng.choice(VOCABULARY)}">{rng.choice(VOCABULARY).title()} '
+                   f'{rng.choice(VOCABULARY)} guide</a></li>' for _ in range(count))
+
+
+def _prose_block(rng, css_class, count):
+    """Boilerplate written as full prose, so only its class marks it (no link density, no banner phrases)"""
+    return "".join(f'<div class="{css_class}"><p>{make_chunk_text(rng, sentences=3)}</p></div>' for _ in range(count))
+
+
+def synthetic_page(rng):
+    """A news/blog-style page; returns (html, article sentences)"""
+    paragraphs = [make_chunk_text(rng, sentences=rng.randint(3, 8)) for _ in range(rng.randint(6, 25))]
+    # Article classes that only share letters with boilerplate words (lead-in contains "ad-")
+    article_classes = ["lead-in", "download-info", "thread-summary"] + [""] * (len(paragraphs) - 3)
+    article = "".join(f'<p class="{c}">{p}</p>' if c else f"<p>{p}</p>" for c, p in zip(article_classes, paragraphs))
+    title = f"{rng.choice(VOCABULARY).title()} {rng.choice(VOCABULARY)} guide"
+    related = "".join(f'<li><a href="/r{i}">{make_chunk_text(rng, 1)}</a></li>' for i in range(rng.randint(4, 10)))
+    comments = "".join(f'<div class="comment"><p>{BOILERPLATE_SNIPPETS["comment"][0]}</p></div>'
+                       for _ in range(rng.randint(0, 6)))
+    page = f"""<!DOCTYPE html><html><head><title>{title}</title>
+<script>window.dataLayer = window.dataLayer || []; function gtag(){{dataLayer.push(arguments);}}</script>
+<style>.x{{color:red}}</style></head><body>
+<div id="cookie-consent" class="banner"><p>{BOILERPLATE_SNIPPETS["cookie"][0]}</p><button>Accept</button></div>
+<header><a href="/">Home</a><ul>{_links(rng, 8)}</ul></header>
+<div class="layout">
+  <div class="sidebar"><h3>Popular</h3><ul>{_links(rng, 12)}</ul>
+    <div class="newsletter-box"><p>{BOILERPLATE_SNIPPETS["newsletter"][0]}</p></div></div>
+  <div class="sidebar-content">{_prose_block(rng, "widget-text", 2)}</div>
+  <div class="post has-sidebar"><h1>{title}</h1><div class="share-bar"><a href="#">Facebook</a> <a href="#">Twitter</a></div>
+    {article}
+    <div class="pager">{_prose_block(rng, "pager-item", 2)}</div>
+    <section class="related-posts"><h3>Related articles</h3><ul>{related}</ul>{_prose_block(rng, "post-teaser", 3)}</section>
+    <div id="comments"><h3>Comments</h3>{comments}{_prose_block(rng, "comment-body", rng.randint(1, 4))}</div>
+  </div>
+</div>
+<footer><p>{BOILERPLATE_SNIPPETS["footer"][0]}</p><ul>{_links(rng, 6)}</ul></footer>
+</body></html>"""
+    sentences = [s for p in paragraphs for s in re.split(r"(?<=[.!?])\s+", p) if s]
+    return page, sentences
+
+
+def article_share(chunk, sentences):
+    covered = sum(len(s) for s in sentences if s in chunk)
+    return covered / max(len(chunk), 1)
+
+
+def is_boilerplate_heuristic(chunk):
+    lines = [l for l in re.split(r"\n|(?<=[.!?])\s+", chunk) if l.strip()]
+    if not lines:
+        return True
+    noisy = sum(1 for l in lines if len(l) < 40 or BOILERPLATE_LINE.search(l))
+    return noisy / len(lines) > 0.5
+
+
+def evaluate(extract, content, sentences=None):
+    start = time.perf_counter()
+    text = extract(content)
+    seconds = time.perf_counter() - start
+    chunks = [c for c in chunk_sentences(text) if len(c) >= MIN_CHUNK_CHARS]
+    if sentences is not None:
+        boilerplate = sum(1 for c in chunks if article_share(c, sentences) < 0.5)
+        recall = sum(1 for s in sentences if s in text) / max(len(sentences), 1)
+    else:
+        boilerplate = sum(1 for c in chunks if is_boilerplate_heuristic(c))
+        recall = None
+    return {"seconds": seconds, "chars": len(text), "chunks": len(chunks), "boilerplate": boilerplate,
+            "recall": recall}
+
+
+def summarize(rows):
+    chunks = sum(r["chunks"] for r in rows)
+    boilerplate = sum(r["boilerplate"] for r in rows)
+    recalls = [r["recall"] for r in rows if r["recall"] is not None]
+    seconds = [r["seconds"] for r in rows]
+    return {
+        "total_seconds": round(sum(seconds), 4),
+        "mean_ms": round(1000 * statistics.mean(seconds), 3),
+        "p95_ms": round(1000 * sorted(seconds)[int(0.95 * (len(seconds) - 1))], 3),
+        "chars": sum(r["chars"] for r in rows),
+        "chunks": chunks,
+        "boilerplate_chunks": boilerplate,
+        "boilerplate_rate": round(boilerplate / max(chunks, 1), 4),
+        "article_recall": round(statistics.mean(recalls), 4) if recalls else None,
+    }
+
+
+def load_corpus(corpus):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(corpus, "*.htm*"))):
+        with open(path, "rb") as f:
+            content = f.read()
+        labels_path = os.path.splitext(path)[0] + ".sentences.json"
+        sentences = None
+        if os.path.exists(labels_path):
+            with open(labels_path, "r", encoding="utf-8") as f:
+                sentences = json.load(f)
+        pages.append((os.path.basename(path), content, sentences))
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML main-content extraction")
+    parser.add_argument("--corpus", help="Folder of stored .html pages (optional <name>.sentences.json labels)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Generate this many labelled pages instead")
+    parser.add_argument("--save-corpus", help="Write the synthetic pages and labels to this folder")
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results", "html_extraction.json"))
+    args = parser.parse_args()
+
+    if args.synthetic:
+        rng = random.Random(args.seed)
+        pages = []
+        for i in range(args.synthetic):
+            page, sentences = synthetic_page(rng)
+            pages.append((f"page_{i:04d}.html", page.encode("utf-8"), sentences))
+        if args.save_corpus:
+            os.makedirs(args.save_corpus, exist_ok=True)
+            for name, content, sentences in pages:
+                with open(os.path.join(args.save_corpus, name), "wb") as f:
+                    f.write(content)
+                with open(os.path.join(args.save_corpus, name.replace(".html", ".sentences.json")), "w") as f:
+                    json.dump(sentences, f)
+    elif args.corpus:
+        pages = load_corpus(args.corpus)
+    else:
+        parser.error("pass --corpus DIR or --synthetic N")
+    if not pages:
+        print("No pages to benchmark")
+        return 1
+
+    results = {}
+    for name, extract in (("baseline_bs4", baseline_extract), ("lxml_readability", extract_main_text)):
+        rows = [evaluate(extract, content, sentences) for _, content, sentences in pages]
+        results[name] = summarize(rows)
+
+    base, new = results["baseline_bs4"], results["lxml_readability"]
+    print(f"{len(pages)} pages")
+    print(f"{'extractor':<18} {'mean ms':>9} {'p95 ms':>9} {'chunks':>7} {'boilerplate':>12} {'recall':>7}")
+    for name, r in results.items():
+        recall = f"{r['article_recall']:.1%}" if r["article_recall"] is not None else "-"
+        print(f"{name:<18} {r['mean_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['chunks']:>7} "
+              f"{r['boilerplate_rate']:>11.1%} {recall:>7}")
+    speedup = base["total_seconds"] / max(new["total_seconds"], 1e-9)
+    saved = base["boilerplate_chunks"] - new["boilerplate_chunks"]
+    print(f"Speedup: x{speedup:.1f}; relevance-LLM calls avoided on boilerplate chunks: {saved}")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"pages": len(pages), "speedup": round(speedup, 2), "extractors": results}, f, indent=2)
+    print(f"Results saved to: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+PDF routing benchmark: fast text-layer path vs docling, speed and chunk quality.
+
+Runs every PDF through pdf_router.route_pdf, the fast path and (when docling
+is installed) the full docling pipeline, and reports per-file timings, chunk
+counts, chunk size spread, sentence-boundary and heading coverage, and how
+much of docling's vocabulary the fast path recovers.
+
+Without a corpus, --synthetic writes born-digital test PDFs (prose sections
+plus one table-heavy document that should be routed to docling).
+
+Usage:
+    python -m benchmarks.pdf_routing --pdfs "data/*.pdf"
+    python -m benchmarks.pdf_routing --synthetic 5 --pages 40 --skip-docling
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.pipeline_throughput import VOCABULARY, make_chunk_text  # noqa: E402
+from generation_planner import count_tokens  # noqa: E402
+from pdf_router import iter_fast, route_pdf  # noqa: E402
+
+WORD = re.compile(r"[a-z]{3,}")
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_text_pdf(path, pages, font_size=10):
+    """Minimal born-digital PDF: one Helvetica text line per entry in each page"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        ops = [f"BT /F1 {font_size} Tf 50 800 Td {font_size + 3} TL"]
+        ops += [f"({_escape(line)}) Tj T*" for line in lines]
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                        f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>").encode())
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(bytes(out))
+
+
+def wrap(text, width=95):
+    lines, current = [], ""
+    for word in text.split():
+        if current and len(current) + len(word) + 1 > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}".strip()
+    if current:
+        lines.append(current)
+    return lines
+
+
+def prose_pages(rng, num_pages, lines_per_page=55):
+    lines, section = [], 0
+    while len(lines) < num_pages * lines_per_page:
+        section += 1
+        lines += ["", f"{section} {rng.choice(VOCABULARY).title()} And {rng.choice(VOCABULARY).title()}", ""]
+        for _ in range(rng.randint(2, 5)):
+            lines += wrap(make_chunk_text(rng, sentences=rng.randint(3, 7))) + [""]
+    return [lines[i:i + lines_per_page] for i in range(0, num_pages * lines_per_page, lines_per_page)]
+
+
+def table_pages(rng, num_pages, lines_per_page=55):
+    pages = []
+    for _ in range(num_pages):
+        rows = [f"{rng.choice(VOCABULARY):<14}{rng.randint(1, 9000):>8}{rng.randint(1, 99):>8}%{rng.randint(100, 999):>8}"
+                for _ in range(lines_per_page - 2)]
+        pages.append(["Cost Table"] + rows)
+    return pages
+
+
+def write_synthetic_corpus(workdir, count, num_pages, seed):
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        path = os.path.join(workdir, f"synthetic_{i:02d}.pdf")
+        write_text_pdf(path, prose_pages(rng, num_pages))
+        paths.append(path)
+    path = os.path.join(workdir, "synthetic_tables.pdf")
+    write_text_pdf(path, table_pages(rng, max(num_pages // 4, 1)))
+    paths.append(path)
+    return paths
+
+
+def chunk_quality(chunks):
+    if not chunks:
+        return {"chunks": 0}
+    tokens = [count_tokens(c["text"]) for c in chunks]
+    return {
+        "chunks": len(chunks),
+        "mean_tokens": round(statistics.mean(tokens), 1),
+        "stdev_tokens": round(statistics.pstdev(tokens), 1),
+        "max_tokens": max(tokens),
+        "sentence_end_ratio": round(sum(c["text"].rstrip()[-1:] in ".!?:" for c in chunks) / len(chunks), 3),
+        "with_heading_ratio": round(sum(bool(c["headings"]) for c in chunks) / len(chunks), 3),
+    }
+
+
+def vocabulary(chunks):
+    return set(WORD.findall(" ".join(c["text"].lower() for c in chunks)))
+
+
+def docling_chunks(pdf_file):
+    from chunk_generation import build_docling, iter_whole
+    global _docling
+    if _docling is None:
+        _docling = build_docling()
+    return list(iter_whole(*_docling, pdf_file))
+
+
+_docling = None
+
+
+def benchmark_file(pdf_file, skip_docling):
+    result = {"file": os.path.basename(pdf_file)}
+    start = time.perf_counter()
+    result["routing"] = route_pdf(pdf_file)
+    result["route_seconds"] = round(time.perf_counter() - start, 4)
+
+    start = time.perf_counter()
+    fast = iter_fast(pdf_file)
+    result["fast"] = {"seconds": round(time.perf_counter() - start, 4), **chunk_quality(fast)}
+
+    if not skip_docling:
+        try:
+            start = time.perf_counter()
+            slow = docling_chunks(pdf_file)
+            result["docling"] = {"seconds": round(time.perf_counter() - start, 4), **chunk_quality(slow)}
+            reference = vocabulary(slow)
+            if reference:
+                result["fast_vocabulary_recall"] = round(len(vocabulary(fast) & reference) / len(reference), 4)
+            if result["fast"]["seconds"] > 0:
+                result["speedup"] = round(result["docling"]["seconds"] / result["fast"]["seconds"], 1)
+        except ImportError as e:
+            result["docling"] = {"error": f"docling not installed ({e})"}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF routing, fast extraction and docling")
+    parser.add_argument("--pdfs", default="data/*.pdf", help="Glob of PDFs to benchmark")
+    parser.add_argument("--synthetic", type=int, default=0, help="Generate this many synthetic PDFs instead")
+    parser.add_argument("--pages", type=int, default=30, help="Pages per synthetic PDF")
+    parser.add_argument("--skip-docling", action="store_true", help="Only time routing and the fast path")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results", "pdf_routing.json"))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="pdf_routing_") as workdir:
+        if args.synthetic:
+            pdf_files = write_synthetic_corpus(workdir, args.synthetic, args.pages, args.seed)
+        else:
+            pdf_files = sorted(glob.glob(args.pdfs))
+        if not pdf_files:
+            print(f"No PDFs match {args.pdfs}; use --synthetic N to generate a corpus")
+            return 1
+
+        results = []
+        for pdf_file in pdf_files:
+            result = benchmark_file(pdf_file, args.skip_docling)
+            results.append(result)
+            fast = result["fast"]
+            line = (f"{result['file']:<28} route={result['routing']['route']:<8} "
+                    f"fast {fast['seconds']:>7.3f}s {fast['chunks']:>4} chunks")
+            if "seconds" in result.get("docling", {}):
+                line += (f" | docling {result['docling']['seconds']:>7.2f}s {result['docling']['chunks']:>4} chunks"
+                         f" | recall {result.get('fast_vocabulary_recall', 0):.1%} x{result.get('speedup', 0)}")
+            print(line)
+
+    routed_fast = [r for r in results if r["routing"]["route"] == "fast"]
+    summary = {
+        "files": len(results),
+        "routed_fast": len(routed_fast),
+        "fast_seconds": round(sum(r["fast"]["seconds"] for r in results), 3),
+        "docling_seconds": round(sum(r["docling"].get("seconds", 0) for r in results if "docling" in r), 3),
+    }
+    print(f"Routed {summary['routed_fast']}/{summary['files']} files to the fast path")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "files": results}, f, indent=2)
+    print(f"Results saved to: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+End-to-end pipeline throughput benchmark against the offline mock LLM server.
+
+Builds a synthetic chunk corpus in a temporary working directory, starts
+mock_llm_server in-process and runs generation -> preprocessing -> judging
+exactly as a user would, without touching any real API quota.
+
+Usage:
+    python -m benchmarks.pipeline_throughput --chunks 50 --latency lognormal:0.2,0.3 --rate-429 0.02
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from mock_llm_server import MockConfig, start_server  # noqa: E402
+
+VOCABULARY = (
+    "trail permit altitude acclimatization season monsoon guide porter lodge itinerary budget "
+    "equipment insurance route glacier village culture festival transport visa currency weather "
+    "safety rescue oxygen summit basecamp teahouse regulation conservation wildlife river valley"
+).split()
+
+
+def make_chunk_text(rng, sentences=20):
+    lines = []
+    for _ in range(sentences):
+        words = [rng.choice(VOCABULARY) for _ in range(rng.randint(8, 18))]
+        lines.append(" ".join(words).capitalize() + f" costs {rng.randint(10, 5000)} USD.")
+    return " ".join(lines)
+
+
+def write_synthetic_chunks(workdir, count, seed=0):
+    """Write `count` chunk JSON files in the chunk_generation.py format"""
+    rng = random.Random(seed)
+    chunk_dir = os.path.join(workdir, "chunks")
+    os.makedirs(chunk_dir, exist_ok=True)
+    for i in range(count):
+        text = make_chunk_text(rng)
+        chunk_data = {
+            "source_file": f"data/synthetic_{i % 5}.pdf",
+            "chunk_index": i,
+            "raw_text": text,
+            "contextualized_text": text,
+            "metadata": {"chunk_size": len(text), "contextualized_size": len(text)},
+        }
+        with open(os.path.join(chunk_dir, f"synthetic_chunk_{i:03d}.json"), "w", encoding="utf-8") as f:
+            json.dump(chunk_data, f, indent=2)
+
+
+def run_stage(script, workdir, env, extra_args=()):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, os.path.join(REPO_ROOT, script), *extra_args],
+        cwd=workdir, env=env, capture_output=True, text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        print(result.stdout[-2000:])
+        print(result.stderr[-2000:])
+        raise RuntimeError(f"{script} exited with {result.returncode}")
+    return elapsed
+
+
+def count_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return len(json.load(f))
+
+
+def run_benchmark(args):
+    config = MockConfig(latency=args.latency, rate_429=args.rate_429, rpm=args.rpm, seed=args.seed)
+    server, url = start_server(config)
+    workdir = tempfile.mkdtemp(prefix="pipeline_bench_")
+    write_synthetic_chunks(workdir, args.chunks, seed=args.seed)
+
+    env = dict(os.environ)
+    env.update({
+        "LLM_BACKEND": "mock",
+        "MOCK_LLM_URL": url,
+        "GENERATION_REQUEST_DELAY": str(args.request_delay),
+        "JUDGE_REQUEST_DELAY": str(args.request_delay),
+        "PIPELINE_METRICS": "1",
+        "PIPELINE_METRICS_DIR": os.path.join(workdir, "metrics"),
+        "PYTHONPATH": REPO_ROOT,
+    })
+
+    stages = {}
+    try:
+        if args.plan:
+            stages["plan"] = {"seconds": run_stage("generation_planner.py", workdir, env), "items": args.chunks}
+        seconds = run_stage("syntheticdatageneration.py", workdir, env, ["--packed"] if args.packed else [])
+        stages["generation"] = {"seconds": seconds, "items": args.chunks}
+        seconds = run_stage("preprocess.py", workdir, env)
+        pairs = count_json(os.path.join(workdir, "dataset", "unfiltered.json"))
+        stages["preprocess"] = {"seconds": seconds, "items": pairs}
+        seconds = run_stage("dataquality_check.py", workdir, env)
+        stages["judge"] = {"seconds": seconds, "items": pairs}
+        passed = count_json(os.path.join(workdir, "final_dataset", "filtered.json"))
+    finally:
+        server.shutdown()
+
+    for stage in stages.values():
+        stage["items_per_second"] = stage["items"] / stage["seconds"] if stage["seconds"] else 0.0
+
+    total_seconds = sum(s["seconds"] for s in stages.values())
+    report = {
+        "config": vars(args),
+        "workdir": workdir,
+        "stages": stages,
+        "total_seconds": total_seconds,
+        "pairs_generated": stages["preprocess"]["items"],
+        "pairs_passed": passed,
+        "pairs_per_second_end_to_end": passed / total_seconds if total_seconds else 0.0,
+        "mock_server": dict(config.stats),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline throughput benchmark")
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--latency", default="lognormal:0.2,0.3")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=0)
+    parser.add_argument("--request-delay", type=float, default=0.0,
+                        help="Pacing delay passed to the generation/judge stages")
+    parser.add_argument("--plan", action="store_true", help="Run generation_planner.py before generation")
+    parser.add_argument("--packed", action="store_true", help="Use packed multi-chunk generation requests")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join(REPO_ROOT, "benchmarks", "results", "pipeline_throughput.json"))
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+
+    print(f"\n{'stage':<12}{'seconds':>10}{'items':>8}{'items/s':>10}")
+    for name, stage in report["stages"].items():
+        print(f"{name:<12}{stage['seconds']:>10.2f}{stage['items']:>8}{stage['items_per_second']:>10.2f}")
+    print(f"\nEnd-to-end: {report['pairs_passed']} pairs passed in {report['total_seconds']:.2f}s "
+          f"({report['pairs_per_second_end_to_end']:.2f} pairs/s)")
+    print(f"Mock server: {report['mock_server']}")
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
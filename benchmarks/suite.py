@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite with stored baselines and regression gates.
+
+Micro benchmarks time the CPU hot paths on synthetic corpora (benchmarks.corpus):
+
+    chunk_text                     scraper sentence chunker
+    clean_json_breaking_characters control-character cleanup of generation replies
+    strip_code_fences              cleanup plus fence stripping, per generation reply
+    judge_quote_repair             dataquality_check.parse_judge_response on single-quoted JSON
+    preprocess_flatten             preprocess.flatten over raw.json
+    format_chat_template           train.format_chat_template with an offline BPE tokenizer
+    checkpoint_write               the per-chunk raw.json checkpoint (json.dump, indent=2)
+    store_entry                    adding every entry to raw.json via store_entry
+
+Macro benchmarks run generation -> preprocess -> judge end to end against the
+in-process mock LLM server (benchmarks.pipeline_throughput) with zero latency,
+so they measure pipeline overhead rather than model speed.
+
+Every timing is divided by a fixed pure-Python calibration loop measured in
+the same run, so a baseline recorded on one machine stays usable on another.
+A benchmark whose normalised time grows by more than --threshold over the
+baseline is a regression and makes the run exit non-zero. A missing baseline
+is only a warning for local runs; with an explicit --baseline or under CI
+(the CI environment variable) it fails the run. Benchmarks whose
+modules are not installed (langchain_core for chunk_text, transformers for
+format_chat_template) are reported as skipped.
+
+Usage:
+    python -m benchmarks.suite --update-baseline          # record benchmarks/baselines/suite.json
+    python -m benchmarks.suite                            # compare against it, exit 1 on regressions
+    python -m benchmarks.suite --only micro --scale 4 --threshold 0.15
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.corpus import (  # noqa: E402
+    make_generation_response, make_judge_response, make_raw_dataset, make_unfiltered,
+)
+from benchmarks.pipeline_throughput import make_chunk_text  # noqa: E402
+
+BASELINE_PATH = os.path.join(REPO_ROOT, "benchmarks", "baselines", "suite.json")
+OUTPUT_PATH = os.path.join(REPO_ROOT, "benchmarks", "results", "suite.json")
+MIN_SAMPLE_SECONDS = 0.1    # loops per sample are doubled until one sample takes this long
+CALIBRATION_SAMPLES = 15    # before and after the suite; the fastest sample is the machine's speed
+
+
+class Skipped(Exception):
+    """A benchmark's dependencies are not installed"""
+
+
+def calibration_loop():
+    """Fixed pure-Python workload (dicts, strings, JSON) used to normalise timings across machines"""
+    total = 0
+    for i in range(20000):
+        record = {"question": f"question {i}", "answer": "answer " * (i % 7), "score": i % 10}
+        total += len(json.dumps(record)) + len(record["answer"].split())
+    return total
+
+
+def _import(name):
+    try:
+        return __import__(name, fromlist=["_"])
+    except ImportError as e:
+        raise Skipped(str(e)) from e
+
+
+def bench_chunk_text(scale, rng):
+    tools = _import("agent_webscraper.tools")
+    text = make_chunk_text(rng, sentences=int(2000 * scale))
+    return (lambda: tools.chunk_text.func(text)), len(text) // 1000, "KB"
+
+
+def bench_clean_json(scale, rng):
+    generation = _import("syntheticdatageneration")
+    replies = [make_generation_response(15, seed=i) for i in range(int(50 * scale))]
+    return (lambda: [generation.clean_json_breaking_characters(r) for r in replies]), len(replies), "replies"
+
+
+def bench_strip_code_fences(scale, rng):
+    generation = _import("syntheticdatageneration")
+    replies = [make_generation_response(15, seed=i) for i in range(int(50 * scale))]
+    return (lambda: [generation.strip_code_fences(r) for r in replies]), len(replies), "replies"
+
+
+def bench_judge_quote_repair(scale, rng):
+    judge = _import("dataquality_check")
+    replies = [make_judge_response(5, seed=i) for i in range(int(100 * scale))]
+    return (lambda: [judge.parse_judge_response(r) for r in replies]), len(replies), "replies"
+
+
+def bench_preprocess_flatten(scale, rng):
+    preprocess = _import("preprocess")
+    dataset = make_raw_dataset(int(200 * scale), 15, seed=rng.randint(0, 1000))
+    return (lambda: preprocess.flatten(dataset)), 15 * len(dataset), "pairs"
+
+
+def bench_format_chat_template(scale, rng):
+    _import("transformers")
+    train = _import("train")
+    evaluate_model = _import("evaluate_model")
+    records = make_unfiltered(int(500 * scale), seed=rng.randint(0, 1000))
+    tokenizer = evaluate_model.build_tiny_tokenizer([f"{r['question']} {r['answer']}" for r in records])
+    batch = {"question": [r["question"] for r in records], "answer": [r["answer"] for r in records]}
+    return (lambda: train.format_chat_template(batch, tokenizer)), len(records), "records"
+
+
+def bench_checkpoint_write(scale, rng):
+    dataset = make_raw_dataset(int(200 * scale), 15, seed=rng.randint(0, 1000))
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_checkpoint_"), "raw.json")
+
+    def write():
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(dataset, f, indent=2)
+    return write, len(dataset), "entries"
+
+
+def bench_store_entry(scale, rng):
+    generation = _import("syntheticdatageneration")
+    entries = list(make_raw_dataset(int(200 * scale), 1, seed=rng.randint(0, 1000)).items())
+
+    def store_all():
+        dataset = {}
+        for key, entry in entries:
+            generation.store_entry(dataset, key, entry)
+    return store_all, len(entries), "entries"
+
+
+MICRO = {
+    "chunk_text": bench_chunk_text,
+    "clean_json_breaking_characters": bench_clean_json,
+    "strip_code_fences": bench_strip_code_fences,
+    "judge_quote_repair": bench_judge_quote_repair,
+    "preprocess_flatten": bench_preprocess_flatten,
+    "format_chat_template": bench_format_chat_template,
+    "checkpoint_write": bench_checkpoint_write,
+    "store_entry": bench_store_entry,
+}
+
+
+def measure(fn, repeat):
+    """
+    Median and best seconds per call; loops are batched so every sample lasts
+    MIN_SAMPLE_SECONDS, and the garbage collector is off while timing, as in timeit
+    """
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        return _measure(fn, repeat)
+    finally:
+        if collecting:
+            gc.enable()
+
+
+def _measure(fn, repeat):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        fn()
+        loops = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            elapsed = time.perf_counter() - start
+            if elapsed >= MIN_SAMPLE_SECONDS:
+                break
+            loops *= 2
+        samples = [elapsed / loops]
+        for _ in range(repeat - 1):
+            start = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            samples.append((time.perf_counter() - start) / loops)
+    return statistics.median(samples), min(samples)
+
+
+def run_micro(names, scale, repeat, seed):
+    results = {}
+    for name in names:
+        rng = random.Random(seed)
+        try:
+            fn, items, unit = MICRO[name](scale, rng)
+        except Skipped as e:
+            results[f"micro.{name}"] = {"skipped": str(e)}
+            print(f"  {name:<32} skipped ({e})")
+            continue
+        median, best = measure(fn, repeat)
+        results[f"micro.{name}"] = {"seconds": median, "best_seconds": best, "items": items, "unit": unit,
+                                    "items_per_second": items / median if median else 0.0}
+        print(f"  {name:<32} {median * 1000:>10.2f} ms  {items:>6} {unit:<8} {items / median:>12,.0f} {unit}/s")
+    return results
+
+
+def run_macro(chunks, repeat, seed):
+    """Fastest of `repeat` end-to-end runs per stage against the zero-latency mock"""
+    from benchmarks.pipeline_throughput import run_benchmark
+    args = argparse.Namespace(chunks=chunks, latency="constant:0.0", rate_429=0.0, rpm=0, seed=seed,
+                              plan=False, packed=False, request_delay=0.0)
+    results = {}
+    for _ in range(repeat):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            report = run_benchmark(args)
+        for stage, values in report["stages"].items():
+            entry = results.setdefault(f"macro.{stage}", {"seconds": float("inf"), "items": values["items"],
+                                                           "unit": "items"})
+            entry["seconds"] = entry["best_seconds"] = min(entry["seconds"], values["seconds"])
+    for name, entry in results.items():
+        entry["items_per_second"] = entry["items"] / entry["seconds"] if entry["seconds"] else 0.0
+        print(f"  {name[6:]:<32} {entry['seconds'] * 1000:>10.2f} ms  {entry['items']:>6} {entry['unit']:<8} "
+              f"{entry['items_per_second']:>12,.1f} {entry['unit']}/s")
+    return results
+
+
+def compare(current, baseline, threshold):
+    """Rows of (name, status, ratio) with ratios normalised by each run's calibration time"""
+    rows = []
+    scale = current["calibration_seconds"] / baseline["calibration_seconds"]
+    for name, result in current["benchmarks"].items():
+        old = baseline["benchmarks"].get(name)
+        if "skipped" in result:
+            rows.append((name, "skipped", None))
+        elif old is None or "skipped" in old:
+            rows.append((name, "new", None))
+        elif old.get("items") != result.get("items"):
+            rows.append((name, "resized", None))   # different corpus size: not comparable
+        else:
+            # Best samples: the median carries the scheduling noise of shared CI machines
+            ratio = result["best_seconds"] / (old["best_seconds"] * scale)
+            status = "REGRESSION" if ratio > 1 + threshold else "faster" if ratio < 1 - threshold else "ok"
+            rows.append((name, status, ratio))
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Micro and end-to-end benchmarks with regression gates")
+    parser.add_argument("--only", choices=("micro", "macro"), help="Run one half of the suite")
+    parser.add_argument("--bench", nargs="+", choices=sorted(MICRO), help="Micro benchmarks to run (default all)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Corpus size multiplier")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing samples per micro benchmark")
+    parser.add_argument("--macro-chunks", type=int, default=20, help="Chunks in the end-to-end corpus")
+    parser.add_argument("--macro-repeat", type=int, default=1, help="End-to-end runs (fastest is kept)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", help=f"Baseline file (default {os.path.relpath(BASELINE_PATH, REPO_ROOT)}); "
+                                           "a missing explicit baseline fails the run")
+    parser.add_argument("--update-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed slowdown before a benchmark counts as a regression (0.25 = 25%%)")
+    parser.add_argument("--confirm", type=int, default=2,
+                        help="Re-measure a flagged micro benchmark this many times before failing")
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    return parser.parse_args(argv)
+
+
+def confirm(current, baseline, args, rows):
+    """Re-measure flagged benchmarks, keeping each one's best sample, so a noisy neighbour is not a regression"""
+    for attempt in range(args.confirm):
+        flagged = [name for name, status, _ in rows if status == "REGRESSION"]
+        if not flagged:
+            break
+        print(f"Re-measuring {', '.join(flagged)} ({attempt + 1}/{args.confirm})")
+        results = run_micro([name[6:] for name in flagged if name.startswith("micro.")], args.scale, args.repeat,
+                            args.seed)
+        if any(name.startswith("macro.") for name in flagged):
+            # One end-to-end run times every stage
+            results.update(run_macro(args.macro_chunks, 1, args.seed))
+        for name, result in results.items():
+            kept = current["benchmarks"][name]
+            if result["best_seconds"] < kept["best_seconds"]:
+                current["benchmarks"][name] = result
+        rows = compare(current, baseline, args.threshold)
+    return rows
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # A gate that silently passes is worse than none: in CI or when asked for, the baseline must exist
+    require_baseline = args.baseline is not None or os.getenv("CI", "").lower() in ("1", "true", "yes")
+    args.baseline = args.baseline or BASELINE_PATH
+    calibration = min(measure(calibration_loop, CALIBRATION_SAMPLES))
+    print(f"Calibration loop: {calibration * 1000:.1f} ms")
+    benchmarks = {}
+    if args.only != "macro":
+        print("Micro benchmarks:")
+        benchmarks.update(run_micro(args.bench or list(MICRO), args.scale, args.repeat, args.seed))
+    if args.only != "micro":
+        print(f"End-to-end against the mock LLM ({args.macro_chunks} chunks):")
+        benchmarks.update(run_macro(args.macro_chunks, args.macro_repeat, args.seed))
+    # Calibrate again afterwards; the faster of the two is least disturbed by CPU frequency ramps
+    calibration = min(calibration, min(measure(calibration_loop, CALIBRATION_SAMPLES)))
+    current = {"created_at": time.time(), "python": sys.version.split()[0], "scale": args.scale,
+               "calibration_seconds": calibration, "benchmarks": benchmarks}
+
+    baseline = None
+    if not args.update_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = confirm(current, baseline, args, compare(current, baseline, args.threshold))
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(current, f, indent=2)
+    print(f"Results saved to: {args.output}")
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        # Keep baselines of benchmarks this run did not execute (--only / --bench)
+        merged = {**baseline.get("benchmarks", {}), **benchmarks}
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({**current, "benchmarks": merged}, f, indent=2)
+        print(f"Baseline saved to: {args.baseline}")
+        return 0
+
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; record one with --update-baseline")
+        return 1 if require_baseline else 0
+    print(f"\nAgainst baseline ({args.threshold:.0%} threshold, normalised by the calibration loop):")
+    for name, status, ratio in rows:
+        change = f"{(ratio - 1) * 100:+7.1f}%" if ratio is not None else " " * 8
+        print(f"  {name:<40} {change}  {status}")
+    regressions = [name for name, status, _ in rows if status == "REGRESSION"]
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
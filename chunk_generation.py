@@ -1,99 +1,327 @@
-from docling.document_converter import DocumentConverter
-from docling.chunking import HybridChunker
 from colorama import Fore
+from metrics import metrics, start_run
+from memory_profiler import MemoryBudgetExceeded, memory, start_profile
+from lineage import chunk_stem, file_digest
+import argparse
+import gc
 import json
 import glob
 import os
+import re
+import shutil
+import sys
+import tempfile
 
-def main():
+# PDFs longer than this are converted WINDOW_PAGES pages at a time so peak memory
+# depends on the window, not the document (a 2,000-page manual needs 20+ GB whole)
+WINDOW_THRESHOLD_PAGES = int(os.getenv("CHUNK_WINDOW_THRESHOLD_PAGES", "200"))
+WINDOW_PAGES = int(os.getenv("CHUNK_WINDOW_PAGES", "50"))
+MAX_STITCHED_CHARS = 8000
+
+SENTENCE_END = re.compile(r"[.!?:;][\"')\]]*\s+")
+
+
+def count_pages(pdf_file):
+    """Page count without loading the document into docling (0 if unreadable)"""
+    try:
+        from PyPDF2 import PdfReader
+        return len(PdfReader(pdf_file).pages)
+    except Exception as e:
+        print(f"  -> {Fore.YELLOW}Could not count pages ({e}), converting whole file{Fore.RESET}")
+        return 0
+
+
+def chunk_record(chunker, chunk):
+    """Plain-data copy of a docling chunk, so the window's document can be freed"""
+    return {
+        "text": chunk.text,
+        "contextualized": chunker.contextualize(chunk=chunk),
+        "headings": list(getattr(chunk.meta, "headings", None) or []),
+    }
+
+
+def contextualize_text(headings, text):
+    # Same layout as HybridChunker.contextualize: section headings, then the text
+    return "\n".join([*headings, text])
+
+
+def stitch(tail, head, max_chars=MAX_STITCHED_CHARS):
+    """
+    Repair the chunk boundary a page window introduced between the last chunk of
+    one window and the first chunk of the next. Chunks from the same section are
+    merged when they fit; otherwise a trailing partial sentence is moved forward.
+    Returns the chunks to emit in place of (tail, head).
+    """
+    if tail["headings"] != head["headings"]:
+        return [tail, head]  # the window edge fell on a section break
+    
+    if len(tail["text"]) + len(head["text"]) + 1 <= max_chars:
+        text = f"{tail['text']} {head['text']}"
+        return [{"text": text, "contextualized": contextualize_text(tail["headings"], text), "headings": tail["headings"]}]
+    
+    ends = list(SENTENCE_END.finditer(tail["text"] + " "))
+    cut = ends[-1].end() if ends else 0
+    if cut == 0 or cut >= len(tail["text"]):
+        return [tail, head]  # no sentence break to repair, or the tail already ends cleanly
+    
+    kept, carried = tail["text"][:cut].rstrip(), tail["text"][cut:].strip()
+    moved = f"{carried} {head['text']}"
+    return [
+        {"text": kept, "contextualized": contextualize_text(tail["headings"], kept), "headings": tail["headings"]},
+        {"text": moved, "contextualized": contextualize_text(head["headings"], moved), "headings": head["headings"]},
+    ]
+
+
+def iter_whole(converter, chunker, pdf_file):
+    with metrics.timer("convert"), memory.stage("convert"):
+        doc = converter.convert(pdf_file).document
+    with metrics.timer("chunk"), memory.stage("chunk"):
+        chunks = list(chunker.chunk(dl_doc=doc))
+    for chunk in chunks:
+        with metrics.timer("contextualize"):
+            record = chunk_record(chunker, chunk)
+        yield record
+
+
+def iter_windowed(converter, chunker, pdf_file, num_pages, window_pages):
+    """
+    Convert and chunk `window_pages` pages at a time. The last chunk of each
+    window is held back and stitched to the first chunk of the next one.
+    The window is halved whenever memory goes over the soft budget.
+    """
+    tail = None
+    start = 1
+    while start <= num_pages:
+        end = min(start + window_pages - 1, num_pages)
+        print(f"  -> Converting pages {start}-{end} of {num_pages}")
+        with metrics.timer("convert"), memory.stage("convert_window"):
+            doc = converter.convert(pdf_file, page_range=(start, end)).document
+        with metrics.timer("chunk"), memory.stage("chunk"):
+            chunks = list(chunker.chunk(dl_doc=doc))
+        with metrics.timer("contextualize"):
+            records = [chunk_record(chunker, chunk) for chunk in chunks]
+        del doc, chunks
+        gc.collect()
+        memory.snapshot(f"{pdf_file} pages {start}-{end}")
+        if memory.check("convert_window") == "shrink" and window_pages > 1:
+            window_pages = max(1, window_pages // 2)
+            print(f"  -> {Fore.YELLOW}Memory over the soft budget, window shrunk to {window_pages} pages{Fore.RESET}")
+        start = end + 1
+        
+        if not records:
+            continue
+        if tail is not None:
+            stitched = stitch(tail, records[0])
+            records = stitched + records[1:]
+        yield from records[:-1]
+        tail = records[-1]
+        metrics.item_done("convert_window")
+    
+    if tail is not None:
+        yield tail
+
+
+def build_docling():
+    """docling pulls in torch and the layout models, so build it only when a PDF needs it"""
+    from docling.document_converter import DocumentConverter
+    from docling.chunking import HybridChunker
+    
+    converter = DocumentConverter()
+    
+    # Configure chunker for more, smaller chunks
+    chunker = HybridChunker(
+        chunk_size=2000,      # Smaller chunks
+        chunk_overlap=50,    # Some overlap to maintain context
+    )
+    return converter, chunker
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert PDFs in data/ into chunk files")
+    parser.add_argument("--window-pages", type=int, default=WINDOW_PAGES,
+                        help="Pages per conversion window for large PDFs")
+    parser.add_argument("--window-threshold", type=int, default=WINDOW_THRESHOLD_PAGES,
+                        help="Convert PDFs with more pages than this in windows (0 = always)")
+    parser.add_argument("--route", choices=["auto", "docling", "fast"], default=os.getenv("CHUNK_ROUTE", "auto"),
+                        help="auto samples each PDF and uses the fast text-layer path when docling is not needed")
+    parser.add_argument("--files", nargs="+", help="Only (re-)chunk these PDFs; other chunks are kept")
+    return parser.parse_args(argv)
+
+
+def load_metadata(metadata_path, keep_sources):
+    """Metadata entries of the PDFs that are not being re-chunked"""
+    if not os.path.exists(metadata_path):
+        return []
+    with open(metadata_path, 'r', encoding='utf-8') as f:
+        entries = json.load(f).get("chunks", [])
+    return [entry for entry in entries if entry.get("source_pdf") in keep_sources]
+
+
+def replace_chunks(pdf_file, staging):
+    """Swap a PDF's freshly written chunks in for its old ones, so a failed conversion loses nothing"""
+    # Old chunks go first so a shorter new version leaves no stale high-index files
+    for old_chunk in glob.glob(os.path.join("chunks", f"{glob.escape(chunk_stem(pdf_file))}_chunk_*.json")):
+        os.remove(old_chunk)
+    for name in os.listdir(staging):
+        os.replace(os.path.join(staging, name), os.path.join("chunks", name))
+
+
+def main(argv=None):
     """
     Process all PDFs and save chunks to chunk_folder for later processing
     """
+    args = parse_args(argv)
+    from pdf_router import iter_fast, route_pdf
+    
+    start_run("chunk_generation")
+    start_profile("chunk_generation")
+    
     # Create chunk folder if it doesn't exist
     os.makedirs("chunks", exist_ok=True)
     
-    converter = DocumentConverter()
-    
     # Get all PDF files in the data directory
-    pdf_files = glob.glob("data/*.pdf")
+    all_pdfs = glob.glob("data/*.pdf")
+    pdf_files = args.files or all_pdfs
     print(f"Found {len(pdf_files)} PDF files: {pdf_files}")
     
     if len(pdf_files) == 0:
         print("No PDF files found in data/ directory. Exiting.")
         return
     
-    # Configure chunker for more, smaller chunks
-    chunker = HybridChunker(
-        chunk_size=2000,      # Smaller chunks
-        chunk_overlap=50,    # Some overlap to maintain context
-    )
+    converter = chunker = None
+    aborted = None
+    failed = []
     
-    # Process each PDF file
-    all_chunks = []
-    chunk_metadata = []
+    # Process each PDF file; with --files the other PDFs keep their chunks and metadata
+    metadata_path = os.path.join("chunks", "chunks_metadata.json")
+    chunk_metadata = load_metadata(metadata_path, set(all_pdfs) - set(pdf_files)) if args.files else []
+    all_chunks = [entry["contextualized_preview"] for entry in chunk_metadata]
     
-    for pdf_file in pdf_files:
+    for file_idx, pdf_file in enumerate(pdf_files):
         print(f"{Fore.CYAN}Processing: {pdf_file}{Fore.RESET}")
+        metrics.queue_depth("convert", len(pdf_files) - file_idx)
+        # New chunks are written here and only replace the old ones once the whole PDF converted
+        staging = tempfile.mkdtemp(prefix=".staging_", dir="chunks")
+        pdf_metadata, pdf_chunks = [], []
         try:
-            doc = converter.convert(pdf_file).document
-            chunks = list(chunker.chunk(dl_doc=doc))
+            if args.route == "auto":
+                decision = route_pdf(pdf_file)
+            else:
+                decision = {"route": args.route, "reason": "--route"}
+            print(f"  -> Route: {decision['route']} ({decision['reason']})")
+            metrics.inc("pipeline_pdf_route_total", route=decision["route"])
+            
+            # The chunk files record which version of the PDF they came from (see lineage.py)
+            source_digest = file_digest(pdf_file)
             
+            if decision["route"] == "fast":
+                with metrics.timer("fast_extract"):
+                    chunks = iter_fast(pdf_file)
+            else:
+                if converter is None:
+                    with memory.stage("load_docling"):
+                        converter, chunker = build_docling()
+                num_pages = decision.get("pages") or count_pages(pdf_file)
+                # Already near the budget: window even short documents
+                if num_pages > args.window_threshold or (num_pages and memory.check("convert") == "shrink"):
+                    print(f"  -> {num_pages} pages, converting in windows of {args.window_pages}")
+                    chunks = iter_windowed(converter, chunker, pdf_file, num_pages, args.window_pages)
+                else:
+                    chunks = iter_whole(converter, chunker, pdf_file)
+            
+            # Indices run across windows, so chunk files are named the same on every run
+            chunk_idx = -1
             for chunk_idx, chunk in enumerate(chunks):
                 # Save individual chunk in JSON format
-                chunk_filename = f"{os.path.splitext(os.path.basename(pdf_file))[0]}_chunk_{chunk_idx:03d}.json"
-                chunk_path = os.path.join("chunks", chunk_filename)
+                chunk_filename = f"{chunk_stem(pdf_file)}_chunk_{chunk_idx:03d}.json"
+                chunk_path = os.path.join(staging, chunk_filename)
                 
-                # Contextualize the chunk
-                print(f"  -> Contextualizing chunk {chunk_idx + 1}/{len(chunks)}")
-                enriched_text = chunker.contextualize(chunk=chunk)
+                print(f"  -> Contextualized chunk {chunk_idx + 1}")
+                enriched_text = chunk["contextualized"]
                 
                 # Create JSON structure like the example
                 chunk_data = {
                     "source_file": pdf_file,
                     "chunk_index": chunk_idx,
-                    "raw_text": chunk.text,
+                    "raw_text": chunk["text"],
                     "contextualized_text": enriched_text,
                     "metadata": {
-                        "chunk_size": len(chunk.text),
+                        "extractor": decision["route"],
+                        "source_digest": source_digest,
+                        "chunk_size": len(chunk["text"]),
                         "contextualized_size": len(enriched_text)
                     }
                 }
                 
                 # Save chunk to JSON file
-                with open(chunk_path, 'w', encoding='utf-8') as f:
+                with metrics.timer("chunk_write"), open(chunk_path, 'w', encoding='utf-8') as f:
                     json.dump(chunk_data, f, indent=2, ensure_ascii=False)
                 
                 # Store metadata
-                chunk_metadata.append({
-                    "chunk_id": len(all_chunks),
+                pdf_metadata.append({
+                    "chunk_id": len(all_chunks) + len(pdf_chunks),
                     "source_pdf": pdf_file,
                     "chunk_filename": chunk_filename,
-                    "raw_text_preview": chunk.text[:100] + "...",
+                    "raw_text_preview": chunk["text"][:100] + "...",
                     "contextualized_preview": enriched_text[:100] + "..."
                 })
                 
-                all_chunks.append(enriched_text)
+                pdf_chunks.append(enriched_text)
             
-            print(f"  -> {Fore.GREEN}Added {len(chunks)} chunks from {pdf_file}{Fore.RESET}")
+            replace_chunks(pdf_file, staging)
+            chunk_metadata.extend(pdf_metadata)
+            all_chunks.extend(pdf_chunks)
+            metrics.item_done("convert")
+            metrics.item_done("chunk", chunk_idx + 1)
+            memory.snapshot(pdf_file)
+            print(f"  -> {Fore.GREEN}Added {chunk_idx + 1} chunks from {pdf_file}{Fore.RESET}")
             
+        except MemoryBudgetExceeded as e:
+            # Keep the chunks of finished PDFs and stop before the kernel OOM-kills the run
+            print(f"{Fore.RED}Aborting at {pdf_file}: {e}{Fore.RESET}")
+            aborted = e
         except Exception as e:
-            print(f"{Fore.RED}Error processing {pdf_file}: {e}{Fore.RESET}")
-            continue
+            print(f"{Fore.RED}Error processing {pdf_file}: {e} - keeping its previous chunks{Fore.RESET}")
+            metrics.inc("pipeline_errors_total", stage="convert")
+            failed.append(pdf_file)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        if aborted:
+            break
+    
+    # PDFs that did not convert keep their old chunk files, so they keep their metadata too
+    unconverted = set(failed) | ({pdf_file} if aborted else set())
+    if unconverted:
+        kept = load_metadata(metadata_path, unconverted)
+        chunk_metadata.extend(kept)
+        all_chunks.extend(entry["contextualized_preview"] for entry in kept)
     
     # Save metadata
-    metadata_path = os.path.join("chunks", "chunks_metadata.json")
     with open(metadata_path, 'w', encoding='utf-8') as f:
         json.dump({
             "total_chunks": len(all_chunks),
-            "source_pdfs": pdf_files,
+            "source_pdfs": sorted(set(pdf_files) | {entry["source_pdf"] for entry in chunk_metadata}),
             "chunks": chunk_metadata
         }, f, indent=2)
     
-    print(f"\n{Fore.GREEN}✓ Chunking complete!{Fore.RESET}")
+    if aborted:
+        print(f"\n{Fore.RED}✗ Chunking stopped by the memory budget{Fore.RESET}")
+    elif failed:
+        print(f"\n{Fore.RED}✗ {len(failed)} PDFs failed to convert: {', '.join(failed)}{Fore.RESET}")
+    else:
+        print(f"\n{Fore.GREEN}✓ Chunking complete!{Fore.RESET}")
     print(f"Total chunks created: {len(all_chunks)}")
     print(f"Chunks saved to: chunks/")
     print(f"Metadata saved to: {metadata_path}")
     print(f"\nNext step: Run syntheticdatageneration.py to generate Q&A pairs from chunks")
+    
+    exported = metrics.export()
+    if exported:
+        print(f"Metrics saved to: {', '.join(exported)}")
+    profile = memory.export()
+    if profile:
+        print(f"Memory profile saved to: {profile}")
+    return 1 if aborted or failed else 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
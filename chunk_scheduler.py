@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Value-first ordering of chunk work for syntheticdatageneration.py.
+
+Chunks are generated in order of estimated value instead of file order, so a
+run stopped by quota, a deadline or a --max-minutes / --token-budget limit has
+already produced the most useful and diverse Q&A. The value of a chunk is
+
+    DENSITY_WEIGHT * density   information density (generation_planner.density_score)
+  + NOVELTY_WEIGHT * novelty   1 - cosine similarity to the closest chunk already
+                               generated (raw.json) or scheduled ahead of it
+  + SOURCE_WEIGHT  * rarity    1 / sqrt(1 + chunks of its source document already
+                               generated or scheduled), favouring thin sources
+
+Novelty and rarity only fall as chunks are scheduled, so a lazy greedy pass
+(re-scoring only the top of a heap) orders thousands of chunks quickly.
+
+    python chunk_scheduler.py order --top 20    # preview the schedule
+    python chunk_scheduler.py coverage          # per-source coverage of dataset/raw.json
+"""
+
+import argparse
+import glob
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+
+from colorama import Fore
+
+DENSITY_WEIGHT = float(os.getenv("SCHEDULE_DENSITY_WEIGHT", "1.0"))
+NOVELTY_WEIGHT = float(os.getenv("SCHEDULE_NOVELTY_WEIGHT", "1.0"))
+SOURCE_WEIGHT = float(os.getenv("SCHEDULE_SOURCE_WEIGHT", "1.0"))
+N_FEATURES = 2048
+BLOCK_ROWS = 1024
+COVERAGE_PATH = "dataset/coverage.json"
+DATASET_PATH = "dataset/raw.json"
+
+SOURCE_INFO_PATTERN = re.compile(r"Source: (.*), Chunk: ")
+
+
+def load_chunk_info(chunk_path):
+    with open(chunk_path, "r", encoding="utf-8") as f:
+        chunk_data = json.load(f)
+    return chunk_data["contextualized_text"], chunk_data.get("source_file") or "unknown"
+
+
+def entry_source(entry, chunk_sources):
+    """Source document of a raw.json entry: from its chunk file, else from source_info"""
+    source = chunk_sources.get(entry.get("chunk_file"))
+    if source is None:
+        match = SOURCE_INFO_PATTERN.match(entry.get("source_info", ""))
+        source = match.group(1) if match else "unknown"
+    return source
+
+
+def entry_text(entry):
+    """Context preview and generated Q&A of one raw.json entry as a single text"""
+    pairs = entry.get("generated") or []
+    qa = " ".join(f"{p.get('question', '')} {p.get('answer', '')}" for p in pairs if isinstance(p, dict))
+    return f"{entry.get('context', '')} {qa}" if qa.strip() else ""
+
+
+def schedule(chunk_paths, dataset=None):
+    """
+    Order chunk_paths by value, highest first. Returns [(chunk_path, details)]
+    with the value and its parts at the moment each chunk was scheduled.
+    """
+    import numpy as np
+    from generation_planner import density_features, density_score
+    from subset_selection import hashed_tfidf
+
+    if not chunk_paths:
+        return []
+    dataset = dataset or {}
+    chunks = [load_chunk_info(path) for path in chunk_paths]
+    chunk_sources = {os.path.basename(path): source for path, (_, source) in zip(chunk_paths, chunks)}
+    generated = [entry for entry in dataset.values() if entry_text(entry).strip()]
+
+    # One vector space for chunks and generated content, so similarities are comparable
+    X = hashed_tfidf([text for text, _ in chunks] + [entry_text(e) for e in generated], N_FEATURES)
+    C, G = X[:len(chunks)], X[len(chunks):]
+    max_sim = np.zeros(len(chunks), dtype=np.float32)
+    for start in range(0, len(G), BLOCK_ROWS):
+        max_sim = np.maximum(max_sim, (C @ G[start:start + BLOCK_ROWS].T).max(axis=1))
+    density = [density_score(density_features(text)) for text, _ in chunks]
+    source_counts = Counter(entry_source(e, chunk_sources) for e in generated)
+
+    def parts(i):
+        return {
+            "density": density[i],
+            "novelty": float(1.0 - max_sim[i]),
+            "rarity": 1.0 / math.sqrt(1 + source_counts[chunks[i][1]]),
+        }
+
+    def value(p):
+        return DENSITY_WEIGHT * p["density"] + NOVELTY_WEIGHT * p["novelty"] + SOURCE_WEIGHT * p["rarity"]
+
+    # (-value upper bound, index, picks seen when it was scored)
+    heap = [(-value(parts(i)), i, 0) for i in range(len(chunks))]
+    heapq.heapify(heap)
+    picks, order = [], []
+    while heap:
+        _, i, seen = heapq.heappop(heap)
+        if seen < len(picks):
+            max_sim[i] = max(max_sim[i], float((C[picks[seen:]] @ C[i]).max()))
+            current = parts(i)
+            if heap and value(current) < -heap[0][0]:
+                heapq.heappush(heap, (-value(current), i, len(picks)))
+                continue
+        current = parts(i)
+        picks.append(i)
+        source_counts[chunks[i][1]] += 1
+        order.append((chunk_paths[i], {"value": round(value(current), 4), "source": chunks[i][1],
+                                       **{k: round(v, 4) for k, v in current.items()}}))
+    return order
+
+
+def order_chunks(chunk_paths, dataset=None):
+    """chunk_paths in value order"""
+    return [path for path, _ in schedule(list(chunk_paths), dataset)]
+
+
+def coverage(chunk_paths, dataset):
+    """Per source document: chunks, chunks generated, Q&A pairs and share of all pairs"""
+    report = {}
+    chunk_sources = {}
+    for path in chunk_paths:
+        source = load_chunk_info(path)[1]
+        chunk_sources[os.path.basename(path)] = source
+        report.setdefault(source, {"chunks": 0, "generated": 0, "pairs": 0})["chunks"] += 1
+    for entry in dataset.values():
+        row = report.setdefault(entry_source(entry, chunk_sources), {"chunks": 0, "generated": 0, "pairs": 0})
+        row["generated"] += 1
+        row["pairs"] += len(entry.get("generated") or [])
+    total_pairs = sum(row["pairs"] for row in report.values())
+    for row in report.values():
+        row["chunk_coverage"] = round(row["generated"] / row["chunks"], 4) if row["chunks"] else 1.0
+        row["pair_share"] = round(row["pairs"] / total_pairs, 4) if total_pairs else 0.0
+    return report
+
+
+def write_coverage(report, path=COVERAGE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def print_coverage(report):
+    print(f"{'source':<40}{'chunks':>8}{'done':>8}{'covered':>9}{'pairs':>8}{'share':>8}")
+    for source, row in sorted(report.items(), key=lambda item: item[1]["chunk_coverage"]):
+        print(f"{source[-40:]:<40}{row['chunks']:>8}{row['generated']:>8}{row['chunk_coverage']:>9.0%}"
+              f"{row['pairs']:>8}{row['pair_share']:>8.1%}")
+
+
+def load_dataset(path=DATASET_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Value-first chunk schedule and per-source coverage")
+    parser.add_argument("--chunks", default="chunks", help="Folder with *_chunk_*.json files")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    order = subparsers.add_parser("order", help="Show the order the next generation run will use")
+    order.add_argument("--top", type=int, default=20)
+    subparsers.add_parser("coverage", help="Per-source coverage of the dataset so far")
+    args = parser.parse_args(argv)
+
+    chunk_files = sorted(glob.glob(os.path.join(args.chunks, "*_chunk_*.json")))
+    dataset = load_dataset(args.dataset)
+    if args.command == "coverage":
+        report = coverage(chunk_files, dataset)
+        print_coverage(report)
+        print(f"Coverage saved to: {write_coverage(report)}")
+        return
+
+    done = {entry.get("chunk_file") for entry in dataset.values()}
+    pending = [path for path in chunk_files if os.path.basename(path) not in done]
+    print(f"{Fore.CYAN}{len(pending)} chunks to schedule ({len(dataset)} already generated){Fore.RESET}")
+    print(f"{'chunk':<40}{'value':>7}{'density':>9}{'novelty':>9}{'rarity':>8}  source")
+    for path, details in schedule(pending, dataset)[:args.top]:
+        print(f"{os.path.basename(path)[-40:]:<40}{details['value']:>7.3f}{details['density']:>9.3f}"
+              f"{details['novelty']:>9.3f}{details['rarity']:>8.3f}  {details['source']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+One entry point for every pipeline stage.
+
+    python cli.py chunk
+    python cli.py scrape "Nepal trekking permits, 50 chunks"
+    python cli.py plan --rpm 15
+    python cli.py generate --packed --dry-run
+    python cli.py preprocess
+    python cli.py judge
+    python cli.py scores filter --min-accuracy 8 --min-style 7
+    python cli.py select --fraction 0.4
+    python cli.py train
+    python cli.py merge --adapters meta-llama/Llama-3.2-3b-finetuned
+    python cli.py mock-server --latency constant:0.2
+    python cli.py startup --budget-ms 500
+
+A stage module is imported only when its subcommand runs, so `--help` and dry
+runs never pay for docling, torch, LangChain or the Gemini SDK. `startup`
+times `--help` for every subcommand in a fresh interpreter and fails when one
+is over budget.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+# subcommand: (module, description, module parses its own arguments)
+STAGES = {
+    "chunk": ("chunk_generation", "Convert PDFs in data/ into chunk files", True),
+    "frontier": ("agent_webscraper.frontier", "Inspect the scraper's search cache and URL outcomes", True),
+    "plan": ("generation_planner", "Plan Q&A pairs per chunk and predict run cost", True),
+    "schedule": ("chunk_scheduler", "Preview the value-first chunk order and per-source coverage", True),
+    "generate": ("syntheticdatageneration", "Generate Q&A pairs from chunks", True),
+    "preprocess": ("preprocess", "Flatten dataset/raw.json into dataset/unfiltered.json", False),
+    "judge": ("dataquality_check", "Score Q&A pairs and keep the good ones", False),
+    "scores": ("parquet_store", "Inspect and re-threshold the judged Parquet dataset", True),
+    "judge-store": ("judge_store", "Re-threshold stored judge scores without LLM calls", True),
+    "router": ("judge_router", "Evaluate the local model that routes records away from the judge", True),
+    "lineage": ("lineage", "Show stale artifacts and rebuild only what changed", True),
+    "select": ("subset_selection", "Select a high-coverage training subset", True),
+    "train": ("train", "Fine-tune Llama 3.2 with LoRA", False),
+    "merge": ("merge_lora_llama", "Merge one or several LoRA adapters into the base model", True),
+    "evaluate": ("evaluate_model", "Measure answer quality and generation speed on held-out Q&A", True),
+    "mock-server": ("mock_llm_server", "Run the offline mock LLM server", True),
+}
+
+STARTUP_BUDGET_MS = float(os.getenv("CLI_STARTUP_BUDGET_MS", "500"))
+
+
+def run_stage(name, argv):
+    module_name, _, forwards = STAGES[name]
+    module = importlib.import_module(module_name)
+    return module.main(argv) if forwards else module.main()
+
+
+def run_scrape(args):
+    import asyncio
+    from agent_webscraper.agent import build_graph
+    return asyncio.run(build_graph().ainvoke({"user_request": args.request}))
+
+
+def time_command(argv, repeats):
+    """Best wall time in ms over `repeats` fresh interpreters, and the last exit code"""
+    best, returncode = None, 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        returncode = subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, returncode
+
+
+def run_startup(args):
+    """Time `cli.py <stage> --help` for every subcommand against the budget"""
+    cli = os.path.abspath(__file__)
+    interpreter_ms, _ = time_command([sys.executable, "-c", "pass"], args.repeats)
+    print(f"Interpreter baseline: {interpreter_ms:.0f} ms (budget {args.budget_ms:.0f} ms per subcommand)")
+
+    results, over = {}, []
+    for name in ["scrape", *STAGES]:
+        elapsed, returncode = time_command([sys.executable, cli, name, "--help"], args.repeats)
+        status = "ok" if returncode == 0 else f"exit {returncode}"
+        if returncode == 0 and elapsed > args.budget_ms:
+            status = "over budget"
+            over.append(name)
+        results[name] = {"ms": round(elapsed, 1), "status": status}
+        print(f"  {name:<12} {elapsed:>7.0f} ms  {status}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"budget_ms": args.budget_ms, "interpreter_ms": round(interpreter_ms, 1),
+                       "subcommands": results}, f, indent=2)
+    if over:
+        print(f"Over budget: {', '.join(over)}")
+        return 1
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Domain-specific dataset pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (_, description, forwards) in STAGES.items():
+        # Stages with their own argparse get the raw arguments, including --help
+        subparsers.add_parser(name, help=description, description=description, add_help=not forwards)
+
+    scrape = subparsers.add_parser("scrape", help="Scrape the web into chunk files with the LangGraph agent")
+    scrape.add_argument("request", help='What to collect, e.g. "Nepal trekking permits, 50 chunks"')
+
+    startup = subparsers.add_parser("startup", help="Measure subcommand startup time against a budget")
+    startup.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    startup.add_argument("--repeats", type=int, default=3)
+    startup.add_argument("--output", help="Write the timings as JSON")
+    return parser
+
+
+def main(argv=None):
+    args, rest = build_parser().parse_known_args(argv)
+    if args.command in STAGES:
+        if rest and not STAGES[args.command][2]:
+            build_parser().error(f"unrecognized arguments: {' '.join(rest)}")
+        return run_stage(args.command, rest)
+    if rest:
+        build_parser().error(f"unrecognized arguments: {' '.join(rest)}")
+    if args.command == "scrape":
+        run_scrape(args)
+        return 0
+    return run_startup(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,8 +6,13 @@ import os
 from dotenv import load_dotenv
 import re
 import time
-import google.generativeai as genai
 from prompts import quality_check_prompt_template
+from llm_backend import backend_name, lazy_backend
+from rate_control import AIMDController, DeadLetterQueue, hedge_policy, ordered_map
+from metrics import metrics, start_run
+from parquet_store import PARQUET_DIR, write_shards
+from judge_store import JUDGE_DB, MIN_SCORE, JudgeStore, content_hash, scores
+from judge_router import LOCAL_JUDGE, prepare_router, record_calibration, route
 load_dotenv()
 
 class Score(BaseModel):
@@ -18,14 +23,20 @@ class Rank(BaseModel):
     accuracy: Score
     style: Score
 
-# Configure Google Gemini
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-model = genai.GenerativeModel('gemini-2.0-flash')
+# LLM backend (LLM_BACKEND=gemini|mock, LLM_MODEL overrides the model), built on first call
+model = lazy_backend('gemini-2.0-flash')
 
 # os.environ["OPENROUTER_API_KEY"] = os.getenv("OPENROUTER_API_KEY")
 
 BATCH_SIZE = 5   # Send 5 Q&A pairs per API request
-REQUEST_DELAY = 2  # 2 seconds between requests
+REQUEST_DELAY = float(os.getenv("JUDGE_REQUEST_DELAY", "2"))  # 2 seconds between request starts
+MAX_CONCURRENCY = int(os.getenv("JUDGE_MAX_CONCURRENCY", "4"))  # AIMD ceiling for in-flight calls
+
+# Shared retry/backoff + AIMD concurrency control for every judge call
+# (JUDGE_HEDGE_PERCENTILE=95 duplicates calls slower than the recent p95)
+controller = AIMDController("judge", max_limit=MAX_CONCURRENCY, min_interval=REQUEST_DELAY,
+                            hedge=hedge_policy("JUDGE"))
+dead_letters = DeadLetterQueue("dataset/dead_letter_judge.jsonl")
 
 # Domain configuration - customize for your specific use case
 DOMAIN_CONFIG = {
@@ -37,105 +48,80 @@ DOMAIN_CONFIG = {
 }
 
 def llm_call_batch(records_batch, domain_config=DOMAIN_CONFIG):
-    """Process 5 Q&A pairs in one API call"""
-    try:
-        prompt = quality_check_prompt_template(records_batch, domain_config)
-        
+    """Process 5 Q&A pairs in one API call; API errors propagate to the rate controller"""
+    # Only the Q&A text goes to the judge; source fields stay out of the prompt
+    prompt = quality_check_prompt_template(
+        [{"question": r["question"], "answer": r["answer"]} for r in records_batch], domain_config)
+    
+    with metrics.timer("judge_llm"):
         response = model.generate_content(prompt)
-        data = response.text
-        
-        # Debug: Print first 200 chars of response
-        print(f"{Fore.MAGENTA}LLM Response Preview: {data[:200]}...{Fore.RESET}")
-        
-        # Remove code blocks if present
-        if data.startswith("```"):
-            data = data.split("```", 2)[1]
-            if data.startswith("json"):
-                data = data[4:]
-        
-        # Clean the data more thoroughly
-        data = data.strip()
+    metrics.record_tokens("judge_llm", response)
+    return parse_judge_response(response.text)
+
+def parse_judge_response(text):
+    """Parse the judge's JSON list, stripping code fences and repairing single quotes"""
+    data = text
+    
+    # Debug: Print first 200 chars of response
+    print(f"{Fore.MAGENTA}LLM Response Preview: {data[:200]}...{Fore.RESET}")
+    
+    # Remove code blocks if present
+    if data.startswith("```"):
+        data = data.split("```", 2)[1]
+        if data.startswith("json"):
+            data = data[4:]
+    
+    # Clean the data more thoroughly
+    data = data.strip()
+    
+    # Try to parse JSON with better error handling
+    try:
+        with metrics.timer("judge_parse"):
+            parsed_data = json.loads(data)
+        print(f"{Fore.MAGENTA}Successfully parsed {len(parsed_data)} objects{Fore.RESET}")
+        return parsed_data
+    except json.JSONDecodeError as e:
+        metrics.retry("judge_parse", reason="quote_repair")
+        print(f"{Fore.RED}JSON parsing failed: {e}{Fore.RESET}")
+        print(f"{Fore.RED}Error at position {e.pos}: '{data[max(0, e.pos-20):e.pos+20]}'{Fore.RESET}")
+        print(f"{Fore.YELLOW}Full raw LLM response:{Fore.RESET}")
+        print(text)
+        print(f"{Fore.YELLOW}End of raw response{Fore.RESET}")
         
-        # Try to parse JSON with better error handling
+        # Fix mixed quotes issue - replace single quotes with double quotes in string values
         try:
-            parsed_data = json.loads(data)
-            print(f"{Fore.MAGENTA}Successfully parsed {len(parsed_data)} objects{Fore.RESET}")
-            return parsed_data
-        except json.JSONDecodeError as e:
-            print(f"{Fore.RED}JSON parsing failed: {e}{Fore.RESET}")
-            print(f"{Fore.RED}Error at position {e.pos}: '{data[max(0, e.pos-20):e.pos+20]}'{Fore.RESET}")
-            print(f"{Fore.YELLOW}Full raw LLM response:{Fore.RESET}")
-            print(response.text)
-            print(f"{Fore.YELLOW}End of raw response{Fore.RESET}")
+            # More comprehensive fix for single quotes
+            fixed_data = data
             
-            # Fix mixed quotes issue - replace single quotes with double quotes in string values
-            try:
-                # More comprehensive fix for single quotes
-                fixed_data = data
-                
-                # Fix single quotes around values: ': 'value' -> ": "value"
-                fixed_data = re.sub(r": '([^']*)'", r': "\1"', fixed_data)
-                
-                # Fix single quotes around keys: 'key': -> "key":
-                fixed_data = re.sub(r"'([^']*)':", r'"\1":', fixed_data)
-                
-                # Fix any remaining single quotes that might break JSON
-                fixed_data = fixed_data.replace("'", '"')
-                
-                parsed_data = json.loads(fixed_data)
-                print(f"{Fore.GREEN}Fixed quotes and parsed {len(parsed_data)} objects{Fore.RESET}")
-                return parsed_data
-            except Exception as fix_error:
-                print(f"{Fore.RED}Fix attempt failed: {fix_error}{Fore.RESET}")
-                # Return empty list instead of fallback
-                return []
+            # Fix single quotes around values: ': 'value' -> ": "value"
+            fixed_data = re.sub(r": '([^']*)'", r': "\1"', fixed_data)
+            
+            # Fix single quotes around keys: 'key': -> "key":
+            fixed_data = re.sub(r"'([^']*)':", r'"\1":', fixed_data)
+            
+            # Fix any remaining single quotes that might break JSON
+            fixed_data = fixed_data.replace("'", '"')
             
-    except Exception as e:
-        # Return default scores for all records in batch
-        return [{"question": record.get("question", ""), "answer": record.get("answer", ""), 
-                "quality": {"accuracy": {"score": 1, "explanation": f"Error: {str(e)}"}, 
-                           "style": {"score": 1, "explanation": f"Error: {str(e)}"}}} 
-               for record in records_batch]
+            with metrics.timer("judge_parse"):
+                parsed_data = json.loads(fixed_data)
+            print(f"{Fore.GREEN}Fixed quotes and parsed {len(parsed_data)} objects{Fore.RESET}")
+            return parsed_data
+        except Exception as fix_error:
+            print(f"{Fore.RED}Fix attempt failed: {fix_error}{Fore.RESET}")
+            metrics.inc("pipeline_parse_failures_total", stage="judge")
+            # Return empty list instead of fallback
+            return []
 
-def load_existing_results():
-    """Load existing results if they exist"""
-    quality = []
-    processed_batches = 0
-    
-    try:
-        if os.path.exists('dataset/quality_results.json'):
-            with open('dataset/quality_results.json', 'r') as f:
-                quality = json.load(f)
-        
-        if os.path.exists('dataset/checkpoint.json'):
-            with open('dataset/checkpoint.json', 'r') as f:
-                checkpoint = json.load(f)
-                processed_batches = checkpoint.get('processed_batches', 0)
-        
-        print(f"{Fore.CYAN}Resuming from batch {processed_batches + 1}, found {len(quality)} existing quality records{Fore.RESET}")
-    except:
-        print(f"{Fore.YELLOW}Starting fresh{Fore.RESET}")
-    
-    return quality, processed_batches
+def judge_name():
+    return f"{backend_name()}:{os.getenv('LLM_MODEL', model.default_model)}"
 
-def save_checkpoint(quality, batch_idx):
-    """Save checkpoint and current results"""
-    # Don't overwrite the input file, just save progress
-    with open('dataset/quality_results.json', 'w') as f:
-        json.dump(quality, f, indent=2)
-    
-    with open('dataset/checkpoint.json', 'w') as f:
-        json.dump({'processed_batches': batch_idx + 1}, f)
+def passes(accuracy_score, style_score):
+    return accuracy_score >= MIN_SCORE and style_score >= MIN_SCORE
 
 def main():
     """Main processing function"""
     print(f"{Fore.CYAN}Starting quality evaluation{Fore.RESET}")
-    
-    # Load existing results and checkpoint
-    quality, start_batch = load_existing_results()
-    
-    # Initialize instructions list for filtered results
-    instructions = []
+    start_run("judge")
     
     # Load data
     try:
@@ -146,72 +132,144 @@ def main():
         print(f"{Fore.RED}Error: dataset/unfiltered.json not found{Fore.RESET}")
         return
     
+    # Records judged in any earlier run (or before a crash) keep their stored scores;
+    # only new or edited question/answer text goes to the judge
+    store = JudgeStore(JUDGE_DB)
+    hashes = [content_hash(record) for record in data]
+    known = store.known(hashes)
+    pending, queued = [], set()
+    for record, record_hash in zip(data, hashes):
+        if record_hash not in known and record_hash not in queued:
+            pending.append(record)
+            queued.add(record_hash)
+    print(f"{Fore.CYAN}{len(data) - len(pending)} records already judged in {JUDGE_DB}, {len(pending)} to judge{Fore.RESET}")
+    metrics.inc("pipeline_judge_cached_total", len(data) - len(pending))
+    
+    # JUDGE_ROUTER=1: a local model trained on earlier judgments scores the records it is
+    # sure about; uncertain ones and a calibration sample still go to the judge
+    calibration, local_count = {}, 0
+    router = prepare_router(store) if pending else None
+    if router is not None:
+        local, pending, calibration = route(router, pending, [content_hash(r) for r in pending])
+        if local:
+            store.put([record for record, _ in local], [result for _, result in local], "router", LOCAL_JUDGE)
+        local_count = len(local)
+        metrics.inc("pipeline_judge_routed_total", local_count, route="local")
+        metrics.inc("pipeline_judge_routed_total", len(pending) - len(calibration), route="judge")
+        metrics.inc("pipeline_judge_routed_total", len(calibration), route="calibration")
+        print(f"{Fore.CYAN}Router: {local_count} scored locally, {len(pending)} to the judge "
+              f"({len(calibration)} calibration samples){Fore.RESET}")
+    
     # Process data in batches
     start_time = time.time()
     
-    # Create batches of 5
-    batches = [data[i:i+BATCH_SIZE] for i in range(0, len(data), BATCH_SIZE)]
+    # Create batches of 5, keyed by content so dead-letter keys stay unique across runs
+    batches = [pending[i:i+BATCH_SIZE] for i in range(0, len(pending), BATCH_SIZE)]
+    work = [(batch_idx, f"batch_{content_hash(batch[0])[:12]}", batch) for batch_idx, batch in enumerate(batches)]
     
-    # Skip already processed batches
-    for batch_idx in range(start_batch, len(batches)):
-        batch = batches[batch_idx]
-        print(f"\n{Fore.YELLOW}Processing batch {batch_idx + 1}/{len(batches)} ({len(batch)} records){Fore.RESET}")
+    # Batches that exhausted their retries last time are replayed first (batch_idx None),
+    # minus records that are stored or already queued from the current dataset
+    replay, recovered = [], []
+    covered = known | queued
+    for entry in dead_letters.load():
+        records = [r for r in entry["payload"]["records"] if content_hash(r) not in covered]
+        if records:
+            replay.append((None, entry["key"], records))
+        else:
+            recovered.append(entry["key"])
+    if replay:
+        print(f"{Fore.CYAN}Replaying {len(replay)} dead-lettered batches{Fore.RESET}")
+    work = replay + work
+    
+    judge = judge_name()
+    judged_count = 0
+    calibrated, agreed = 0, 0
+    judged = ordered_map(work, lambda item: controller.call(llm_call_batch, item[2]), controller)
+    
+    for done, ((batch_idx, key, batch), outcome) in enumerate(judged):
+        metrics.queue_depth("judge", len(work) - done - 1)
+        label = f"{batch_idx + 1}/{len(batches)}" if batch_idx is not None else f"{key} (replay)"
+        print(f"\n{Fore.YELLOW}Processing batch {label} ({len(batch)} records){Fore.RESET}")
         
-        # Process batch - get 5 results for 5 Q&A pairs
-        results = llm_call_batch(batch)
-        print(f"{Fore.BLUE}LLM returned {len(results)} results{Fore.RESET}")
+        if outcome.error is not None:
+            # Out of retries: keep the records for a later run instead of scoring them 1
+            print(f"{Fore.RED}Batch {label} failed: {outcome.error} - moved to dead-letter queue{Fore.RESET}")
+            metrics.inc("pipeline_errors_total", stage="judge")
+            dead_letters.add(key, {"records": batch}, outcome.error, getattr(outcome.error, "attempts", 0))
+            continue
+        if batch_idx is None:
+            recovered.append(key)
         
-        # Process the batch results
-        batch_passed = 0
-        batch_failed = 0
+        # Process batch - get 5 results for 5 Q&A pairs; records without a result stay
+        # unstored and are judged again next run
+        results = outcome.value
+        print(f"{Fore.BLUE}LLM returned {len(results)} results{Fore.RESET}")
+        with metrics.timer("judge_write"):
+            stored = store.put(batch, results, key, judge)
+        judged_count += stored
+        if calibration:
+            for record, result in zip(batch, results):
+                verdict = calibration.get(content_hash(record))
+                if verdict is not None:
+                    calibrated += 1
+                    agreed += verdict == passes(*scores(result))
         
-        for record, result in zip(batch, results):
-            try:
-                quality_data = result.get('quality', {})
-                accuracy_score = quality_data.get('accuracy', {}).get('score', 1)
-                style_score = quality_data.get('style', {}).get('score', 1)
-            except:
-                accuracy_score = 1
-                style_score = 1
-            
-            if accuracy_score > 6 and style_score > 6:
-                instructions.append(record)
-                quality.append({**record, 'quality': result})
-                batch_passed += 1
-            else:
-                batch_failed += 1
+        batch_passed = sum(1 for result in results[:len(batch)] if passes(*scores(result)))
+        batch_failed = stored - batch_passed
         
-        # Print batch statistics
-        total_processed = len(instructions)
-        total_records = (batch_idx + 1) * BATCH_SIZE
-        overall_pass_rate = (total_processed / total_records) * 100
+        metrics.item_done("judge", len(batch))
+        metrics.inc("pipeline_judge_passed_total", batch_passed)
         
         print(f"{Fore.GREEN}✓ {batch_passed} passed{Fore.RESET}, {Fore.RED}✗ {batch_failed} failed{Fore.RESET}")
-        print(f"{Fore.CYAN}Overall: {total_processed}/{total_records} passed ({overall_pass_rate:.1f}%){Fore.RESET}")
-        
-        # Save checkpoint every batch
-        save_checkpoint(quality, batch_idx)
-        
-        # Wait 4 seconds between API calls
-        if batch_idx < len(batches) - 1:
-            time.sleep(REQUEST_DELAY)
     
+    dead_letters.remove(recovered)
+    if calibrated:
+        record_calibration(calibrated, agreed)
     end_time = time.time()
     
+    # Final dataset from stored scores: freshly judged and carried-over records alike
+    stored_results = store.results(set(hashes))
+    instructions, quality = [], []
+    for record, record_hash in zip(data, hashes):
+        if record_hash not in stored_results:
+            continue
+        accuracy_score, style_score, result = stored_results[record_hash]
+        if passes(accuracy_score, style_score):
+            instructions.append(record)
+            quality.append({**record, 'quality': result})
+    
     # Save final results
+    os.makedirs('final_dataset', exist_ok=True)
     with open('final_dataset/filtered.json', 'w') as f:
         json.dump(instructions, f, indent=2)
     
     with open('dataset/qualityresults.json', 'w') as f:
         json.dump(quality, f, indent=2)
     
+    # All judged records with scores and source columns, for cheap re-thresholding
+    with metrics.timer("judge_write"):
+        shards = write_shards(store.parquet_rows(set(hashes)), PARQUET_DIR)
+    store.close()
+    
     # Print final statistics
+    scored = len([h for h in hashes if h in stored_results])
     print(f"\n{Fore.CYAN}Final Results:{Fore.RESET}")
-    print(f"Total records processed: {len(data)}")
+    print(f"Total records processed: {len(data)} ({judged_count} judged this run, {local_count} scored locally, "
+          f"{len(data) - len(pending) - local_count} reused)")
     print(f"Records that passed quality check: {len(instructions)}")
-    print(f"Pass rate: {len(instructions)/len(data)*100:.1f}%")
+    print(f"Pass rate: {len(instructions)/max(scored, 1)*100:.1f}% of {scored} scored records")
     print(f"Processing time: {end_time - start_time:.2f} seconds")
     print(f"Quality data saved to: final_dataset/filtered.json")
+    print(f"Judge scores saved to: {JUDGE_DB} (re-threshold with judge_store.py filter)")
+    print(f"Scored records saved to: {PARQUET_DIR}/ ({len(shards)} Parquet shards)")
+    pending = dead_letters.load()
+    if pending:
+        print(f"{Fore.YELLOW}{len(pending)} batches in dead-letter queue ({dead_letters.path}) - rerun to retry them{Fore.RESET}")
+    controller.report()
+    
+    exported = metrics.export()
+    if exported:
+        print(f"Metrics saved to: {', '.join(exported)}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Evaluate a fine-tuned (merged) model on a held-out split of filtered.json.
+
+Generation is batched and the shared system prompt is encoded once: its KV
+cache is computed a single time and copied into every batch, so each request
+only pays for its own question tokens. Reports
+
+- throughput: generated tokens/s, prompt tokens skipped thanks to the prefix cache
+- latency: p50/p95/p99 per request (a request's latency is its batch's wall time)
+- refusal accuracy: in-domain questions should be answered, out-of-domain
+  questions refused with the rejection message
+- answer overlap: token F1 against the reference answer for in-domain questions
+
+Runs on CPU or GPU. For CI, `--model tiny` builds a random two-layer Llama
+and a byte-level tokenizer offline, so the harness is exercised without
+downloading weights.
+
+Usage:
+    python evaluate_model.py --model merged_travel --holdout-fraction 0.1
+    python evaluate_model.py --model tiny --limit 16 --max-new-tokens 8
+"""
+
+import argparse
+import copy
+import json
+import math
+import os
+import re
+import time
+import zlib
+
+from colorama import Fore
+
+from train import CHAT_TEMPLATE, SYSTEM_PROMPT
+
+REFUSAL_PATTERN = re.compile(
+    r"i'?m sorry|i am sorry|i can only|i (?:can ?not|can't|am unable|'m unable)|unable to (?:answer|help|provide)|"
+    r"outside (?:of )?(?:my|the|your) (?:scope|domain)|not able to (?:answer|help)|only (?:provide|answer|help)", re.I)
+
+OUT_OF_DOMAIN_QUESTIONS = [
+    "How do I bake a sourdough loaf at home?",
+    "What is the derivative of x cubed?",
+    "Write a Python function that reverses a linked list.",
+    "Who won the 2018 FIFA World Cup?",
+    "How do I change the oil in my car?",
+    "Can you explain how a blockchain reaches consensus?",
+    "What are the symptoms of vitamin D deficiency?",
+    "Translate 'good morning' into Japanese.",
+    "How should I structure a cover letter for a software job?",
+    "What is the capital of Australia?",
+]
+
+WORD = re.compile(r"\w+")
+
+
+def is_refusal(text):
+    return bool(REFUSAL_PATTERN.search(text[:300]))
+
+
+def is_held_out(record, fraction):
+    """Deterministic split by question hash, stable across runs and dataset order"""
+    return zlib.crc32(record["question"].encode("utf-8")) % 10_000 < fraction * 10_000
+
+
+def token_f1(prediction, reference):
+    pred, ref = WORD.findall(prediction.lower()), WORD.findall(reference.lower())
+    if not pred or not ref:
+        return 0.0
+    counts = {}
+    for w in ref:
+        counts[w] = counts.get(w, 0) + 1
+    common = 0
+    for w in pred:
+        if counts.get(w, 0) > 0:
+            common += 1
+            counts[w] -= 1
+    if not common:
+        return 0.0
+    precision, recall = common / len(pred), common / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def build_eval_set(data_file, fraction, limit, ood_file=None):
+    """Held-out in-domain records plus out-of-domain questions, each labelled with the expected behaviour"""
+    with open(data_file, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    held_out = [r for r in records if is_held_out(r, fraction)]
+    if limit:
+        held_out = held_out[:limit]
+    items = [{"question": r["question"], "reference": r["answer"], "domain": "in",
+              # Negative examples in the dataset are already refusals
+              "expect_refusal": is_refusal(r["answer"])} for r in held_out]
+
+    ood = OUT_OF_DOMAIN_QUESTIONS
+    if ood_file:
+        with open(ood_file, "r", encoding="utf-8") as f:
+            ood = json.load(f)
+    if limit:
+        ood = ood[:max(1, limit // 4)]
+    items += [{"question": q, "reference": "", "domain": "out", "expect_refusal": True} for q in ood]
+    return items
+
+
+def build_tiny_tokenizer(texts):
+    """Byte-level BPE tokenizer with the Llama 3 special tokens, trained on texts (offline)"""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    special = ["<|begin_of_text|>", "<|eot_id|>", "<|pad|>", "<|start_header_id|>", "<|end_header_id|>"]
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=1024, special_tokens=special, show_progress=False,
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tokenizer.train_from_iterator(texts, trainer)
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token=special[0], eos_token=special[1],
+                                   pad_token=special[2], additional_special_tokens=special[3:])
+
+
+def build_tiny_model(texts, seed=0):
+    """Random two-layer Llama plus a byte-level BPE tokenizer trained on the eval texts (offline, for CI)"""
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    tokenizer = build_tiny_tokenizer(texts)
+    torch.manual_seed(seed)
+    config = LlamaConfig(vocab_size=len(tokenizer), hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+                         num_attention_heads=4, num_key_value_heads=4, max_position_embeddings=2048,
+                         bos_token_id=tokenizer.bos_token_id, eos_token_id=tokenizer.eos_token_id,
+                         pad_token_id=tokenizer.pad_token_id)
+    return LlamaForCausalLM(config).eval(), tokenizer
+
+
+def load_model(name, device, texts):
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    if name == "tiny":
+        model, tokenizer = build_tiny_model(texts)
+    else:
+        dtype = torch.float16 if device.startswith("cuda") else torch.float32
+        tokenizer = AutoTokenizer.from_pretrained(name, token=os.getenv("HF_TOKEN"))
+        model = AutoModelForCausalLM.from_pretrained(name, dtype=dtype, token=os.getenv("HF_TOKEN")).eval()
+    if tokenizer.pad_token_id is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.chat_template = CHAT_TEMPLATE
+    return model.to(device), tokenizer
+
+
+def split_prompt(tokenizer, question):
+    """Token ids of the shared system prefix and of this question's suffix"""
+    system = [{"role": "system", "content": SYSTEM_PROMPT}]
+    prefix = tokenizer.apply_chat_template(system, tokenize=False)
+    full = tokenizer.apply_chat_template(system + [{"role": "user", "content": question}],
+                                         tokenize=False, add_generation_prompt=True)
+    assert full.startswith(prefix), "chat template does not render the system prompt as a prefix"
+    return (tokenizer(prefix, add_special_tokens=False)["input_ids"],
+            tokenizer(full[len(prefix):], add_special_tokens=False)["input_ids"])
+
+
+class Generator:
+    """Batched greedy generation with an optional shared-prefix KV cache"""
+
+    def __init__(self, model, tokenizer, device, max_new_tokens, prefix_cache=True):
+        import torch
+        self.torch = torch
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_new_tokens = max_new_tokens
+        self.prefix_ids, _ = split_prompt(tokenizer, "")
+        self.prefix_cache = None
+        if prefix_cache:
+            with torch.no_grad():
+                ids = torch.tensor([self.prefix_ids], device=device)
+                self.prefix_cache = model(input_ids=ids, use_cache=True).past_key_values
+
+    def generate(self, questions):
+        """Return (answers, new_token_counts, prompt_tokens_computed)"""
+        torch = self.torch
+        suffixes = [split_prompt(self.tokenizer, q)[1] for q in questions]
+        width = max(len(s) for s in suffixes)
+        pad = self.tokenizer.pad_token_id
+        # Pad between the shared prefix and each question so the prefix sits at the same
+        # positions in every row; masked pads are skipped by attention and position ids
+        input_ids = [self.prefix_ids + [pad] * (width - len(s)) + s for s in suffixes]
+        mask = [[1] * len(self.prefix_ids) + [0] * (width - len(s)) + [1] * len(s) for s in suffixes]
+        input_ids = torch.tensor(input_ids, device=self.device)
+        attention_mask = torch.tensor(mask, device=self.device)
+
+        kwargs = {}
+        computed = input_ids.numel()
+        if self.prefix_cache is not None:
+            cache = copy.deepcopy(self.prefix_cache)
+            cache.batch_repeat_interleave(len(questions))
+            kwargs["past_key_values"] = cache
+            computed -= len(self.prefix_ids) * len(questions)
+
+        with torch.no_grad():
+            output = self.model.generate(input_ids=input_ids, attention_mask=attention_mask, do_sample=False,
+                                         max_new_tokens=self.max_new_tokens, pad_token_id=pad, **kwargs)
+        new_tokens = output[:, input_ids.shape[1]:]
+        answers, counts = [], []
+        for row in new_tokens.tolist():
+            if self.tokenizer.eos_token_id in row:
+                row = row[:row.index(self.tokenizer.eos_token_id) + 1]
+            row = [t for t in row if t != pad]
+            counts.append(len(row))
+            answers.append(self.tokenizer.decode(row, skip_special_tokens=True).strip())
+        return answers, counts, computed
+
+
+def evaluate(items, generator, batch_size):
+    """Run every item through the generator in length-sorted batches"""
+    order = sorted(range(len(items)), key=lambda i: len(items[i]["question"]))
+    latencies, total_new, total_computed, wall = [], 0, 0, 0.0
+    for start in range(0, len(order), batch_size):
+        batch = [items[i] for i in order[start:start + batch_size]]
+        began = time.perf_counter()
+        answers, counts, computed = generator.generate([item["question"] for item in batch])
+        elapsed = time.perf_counter() - began
+        wall += elapsed
+        total_new += sum(counts)
+        total_computed += computed
+        for item, answer, count in zip(batch, answers, counts):
+            item.update(prediction=answer, new_tokens=count, latency=elapsed, refused=is_refusal(answer))
+            latencies.append(elapsed)
+        print(f"{Fore.BLUE}Batch {start // batch_size + 1}: {len(batch)} prompts, {sum(counts)} tokens "
+              f"in {elapsed:.2f}s{Fore.RESET}")
+    return {"latencies": latencies, "new_tokens": total_new, "prompt_tokens_computed": total_computed, "wall": wall}
+
+
+def summarize(items, run, generator, args):
+    def accuracy(group):
+        return round(sum(i["refused"] == i["expect_refusal"] for i in group) / len(group), 4) if group else None
+
+    in_domain = [i for i in items if i["domain"] == "in"]
+    out_domain = [i for i in items if i["domain"] == "out"]
+    answerable = [i for i in in_domain if not i["expect_refusal"]]
+    skipped = len(generator.prefix_ids) * len(items) if generator.prefix_cache is not None else 0
+    return {
+        "model": args.model,
+        "device": args.device,
+        "batch_size": args.batch_size,
+        "max_new_tokens": args.max_new_tokens,
+        "prefix_cache": generator.prefix_cache is not None,
+        "prompts": len(items),
+        "generated_tokens": run["new_tokens"],
+        "tokens_per_second": round(run["new_tokens"] / run["wall"], 2) if run["wall"] else 0.0,
+        "prefix_tokens": len(generator.prefix_ids),
+        "prompt_tokens_computed": run["prompt_tokens_computed"],
+        "prompt_tokens_skipped": skipped,
+        "latency_seconds": {f"p{q}": round(percentile(run["latencies"], q / 100), 4) for q in (50, 95, 99)},
+        "refusal_accuracy": {
+            "overall": accuracy(items),
+            "in_domain": accuracy(in_domain),
+            "out_of_domain": accuracy(out_domain),
+        },
+        "in_domain_answer_f1": round(sum(token_f1(i["prediction"], i["reference"]) for i in answerable)
+                                     / len(answerable), 4) if answerable else None,
+    }
+
+
+def resolve_device(device):
+    import torch
+    if device == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return device
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Batched evaluation of a fine-tuned model")
+    parser.add_argument("--model", default="merged_travel", help="Model path or hub id, or 'tiny' for CI")
+    parser.add_argument("--data", default="final_dataset/filtered.json")
+    parser.add_argument("--holdout-fraction", type=float, default=0.1, help="Share of records held out (by hash)")
+    parser.add_argument("--ood-file", help="JSON list of out-of-domain questions (default: built-in list)")
+    parser.add_argument("--limit", type=int, default=0, help="Most in-domain questions to evaluate (0 = all)")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-new-tokens", type=int, default=256)
+    parser.add_argument("--device", default="auto", help="auto, cpu, cuda, cuda:1, mps ...")
+    parser.add_argument("--no-prefix-cache", action="store_true", help="Re-encode the system prompt in every batch")
+    parser.add_argument("--output", default="eval_results")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(args.data):
+        print(f"{Fore.RED}Error: {args.data} not found{Fore.RESET}")
+        return 1
+    items = build_eval_set(args.data, args.holdout_fraction, args.limit, args.ood_file)
+    print(f"{Fore.CYAN}Evaluating {len(items)} questions "
+          f"({sum(i['domain'] == 'in' for i in items)} held-out, {sum(i['domain'] == 'out' for i in items)} out-of-domain){Fore.RESET}")
+
+    args.device = resolve_device(args.device)
+    texts = [SYSTEM_PROMPT] + [i["question"] + " " + i["reference"] for i in items]
+    model, tokenizer = load_model(args.model, args.device, texts)
+    generator = Generator(model, tokenizer, args.device, args.max_new_tokens, prefix_cache=not args.no_prefix_cache)
+
+    run = evaluate(items, generator, args.batch_size)
+    report = summarize(items, run, generator, args)
+
+    os.makedirs(args.output, exist_ok=True)
+    with open(os.path.join(args.output, "metrics.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    with open(os.path.join(args.output, "predictions.jsonl"), "w", encoding="utf-8") as f:
+        for item in items:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    refusal = report["refusal_accuracy"]
+    print(f"\n{Fore.GREEN}✓ Evaluation complete{Fore.RESET}")
+    print(f"Throughput: {report['tokens_per_second']} tokens/s ({report['generated_tokens']} tokens)")
+    print(f"Latency p50/p95/p99: {report['latency_seconds']['p50']:.2f}s / "
+          f"{report['latency_seconds']['p95']:.2f}s / {report['latency_seconds']['p99']:.2f}s")
+    print(f"Refusal accuracy: in-domain {refusal['in_domain']}, out-of-domain {refusal['out_of_domain']}")
+    if report["prefix_cache"]:
+        print(f"Prefix cache skipped {report['prompt_tokens_skipped']} prompt tokens")
+    print(f"Results saved to: {args.output}/")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
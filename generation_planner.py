@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Planning pass for synthetic data generation.
+
+Tokenizes every chunk, scores its information density (unique terms, numbers,
+named entities) and picks `num_records` per chunk instead of always asking for
+15 pairs. Also predicts total input/output tokens and wall-clock time for the
+generation and judging stages under the configured RPM/TPM limits - all
+before a single API call is made.
+
+Writes dataset/generation_plan.json, which syntheticdatageneration.py picks up
+automatically.
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import re
+
+from colorama import Fore
+
+from prompts import generation_prompt_template, quality_check_prompt_template
+
+PLAN_PATH = "dataset/generation_plan.json"
+
+MIN_RECORDS = 3
+MAX_RECORDS = 25
+TOKENS_PER_RECORD = 45            # content tokens that support roughly one Q&A pair
+OUTPUT_TOKENS_PER_RECORD = 220    # markdown-heavy answers from the generation prompt
+JUDGE_BATCH_SIZE = 5
+JUDGE_OUTPUT_TOKENS_PER_RECORD = 140
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z\-']+")
+NUMBER_PATTERN = re.compile(r"\b\d[\d,.:/-]*\b")
+ENTITY_PATTERN = re.compile(r"(?<![.!?]\s)(?<!^)\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*")
+
+STOPWORDS = set("""
+a an the and or but if of to in on at by for with from as is are was were be been being this that these those
+it its it's into over under than then so such not no can could should would will may might must do does did
+have has had you your we our they their there here which who whom whose what when where why how all any each
+more most other some also only very just about after before between during while up down out off again further
+""".split())
+
+
+def count_tokens(text):
+    """Offline token estimate: words and punctuation, long words split like subword pieces"""
+    tokens = TOKEN_PATTERN.findall(text)
+    return len(tokens) + sum(len(t) // 8 for t in tokens if len(t) > 8)
+
+
+def density_features(text):
+    """Raw information-density features for one chunk"""
+    words = [w.lower() for w in WORD_PATTERN.findall(text)]
+    content_words = [w for w in words if w not in STOPWORDS]
+    unique_terms = len(set(content_words))
+    return {
+        "tokens": count_tokens(text),
+        "words": len(words),
+        "unique_terms": unique_terms,
+        "unique_ratio": unique_terms / len(content_words) if content_words else 0.0,
+        "numbers": len(NUMBER_PATTERN.findall(text)),
+        "entities": len(set(ENTITY_PATTERN.findall(text))),
+    }
+
+
+def density_score(features):
+    """Information units per 100 tokens, squashed to 0..1"""
+    if features["tokens"] == 0:
+        return 0.0
+    units = features["unique_terms"] * features["unique_ratio"] + 2 * features["numbers"] + 2 * features["entities"]
+    per_100 = 100 * units / features["tokens"]
+    return 1 - math.exp(-per_100 / 40)
+
+
+def choose_num_records(features, score, min_records=MIN_RECORDS, max_records=MAX_RECORDS):
+    """Scale the request with chunk size and density"""
+    capacity = features["tokens"] / TOKENS_PER_RECORD
+    return max(min_records, min(max_records, round(capacity * (0.5 + score))))
+
+
+def estimate_minutes(calls, input_tokens, output_tokens, rpm, tpm, latency, concurrency, request_delay):
+    """Wall time is bounded by the slowest of quota, pacing and latency"""
+    limits = {
+        "rpm": calls / rpm if rpm else 0.0,
+        "tpm": (input_tokens + output_tokens) / tpm if tpm else 0.0,
+        "pacing": calls * request_delay / 60,
+        "latency": calls * latency / max(concurrency, 1) / 60,
+    }
+    bottleneck = max(limits, key=limits.get)
+    return limits[bottleneck], bottleneck
+
+
+def build_plan(chunk_files, args):
+    """Score every chunk and predict the cost of the run"""
+    prompt_overhead = count_tokens(generation_prompt_template(""))
+    chunks = {}
+    for chunk_path in sorted(chunk_files):
+        with open(chunk_path, "r", encoding="utf-8") as f:
+            chunk_data = json.load(f)
+        text = chunk_data["contextualized_text"]
+        features = density_features(text)
+        score = density_score(features)
+        num_records = choose_num_records(features, score, args.min_records, args.max_records)
+        chunks[os.path.basename(chunk_path)] = {
+            **features,
+            "source_file": chunk_data.get("source_file"),
+            "density": round(score, 4),
+            "num_records": num_records,
+            "input_tokens": prompt_overhead + features["tokens"],
+            "output_tokens": num_records * OUTPUT_TOKENS_PER_RECORD,
+        }
+
+    gen_calls = len(chunks)
+    gen_input = sum(c["input_tokens"] for c in chunks.values())
+    gen_output = sum(c["output_tokens"] for c in chunks.values())
+    gen_minutes, gen_bottleneck = estimate_minutes(
+        gen_calls, gen_input, gen_output, args.rpm, args.tpm, args.latency, args.concurrency, args.generation_delay)
+
+    total_records = sum(c["num_records"] for c in chunks.values())
+    judge_calls = math.ceil(total_records / JUDGE_BATCH_SIZE)
+    judge_overhead = count_tokens(quality_check_prompt_template([], {
+        "domain_name": "", "domain_description": "", "positive_example": "",
+        "negative_example": "", "rejection_template": ""}))
+    judge_input = judge_calls * judge_overhead + total_records * OUTPUT_TOKENS_PER_RECORD
+    judge_output = total_records * JUDGE_OUTPUT_TOKENS_PER_RECORD
+    judge_minutes, judge_bottleneck = estimate_minutes(
+        judge_calls, judge_input, judge_output, args.rpm, args.tpm, args.latency, args.concurrency, args.judge_delay)
+
+    return {
+        "settings": vars(args),
+        "chunks": chunks,
+        "totals": {
+            "chunks": gen_calls,
+            "num_records": total_records,
+            "fixed_15_records": 15 * gen_calls,
+            "generation": {"calls": gen_calls, "input_tokens": gen_input, "output_tokens": gen_output,
+                           "minutes": round(gen_minutes, 2), "bottleneck": gen_bottleneck},
+            "judge": {"calls": judge_calls, "input_tokens": judge_input, "output_tokens": judge_output,
+                      "minutes": round(judge_minutes, 2), "bottleneck": judge_bottleneck},
+        },
+    }
+
+
+def load_plan(path=PLAN_PATH):
+    """Return {chunk_file: num_records} from a saved plan, or {} if there is none"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    return {name: entry["num_records"] for name, entry in plan["chunks"].items()}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Plan num_records per chunk and predict run cost")
+    parser.add_argument("--chunks", default="chunks", help="Folder with *_chunk_*.json files")
+    parser.add_argument("--output", default=PLAN_PATH)
+    parser.add_argument("--min-records", type=int, default=MIN_RECORDS)
+    parser.add_argument("--max-records", type=int, default=MAX_RECORDS)
+    parser.add_argument("--rpm", type=float, default=float(os.getenv("LLM_RPM", "15")), help="Requests per minute quota")
+    parser.add_argument("--tpm", type=float, default=float(os.getenv("LLM_TPM", "1000000")), help="Tokens per minute quota")
+    parser.add_argument("--latency", type=float, default=3.0, help="Expected seconds per LLM call")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("GENERATION_MAX_CONCURRENCY", "4")))
+    parser.add_argument("--generation-delay", type=float, default=float(os.getenv("GENERATION_REQUEST_DELAY", "4")))
+    parser.add_argument("--judge-delay", type=float, default=float(os.getenv("JUDGE_REQUEST_DELAY", "2")))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    chunk_files = glob.glob(os.path.join(args.chunks, "*_chunk_*.json"))
+    if not chunk_files:
+        print(f"{Fore.RED}Error: No chunk JSON files found in {args.chunks}/{Fore.RESET}")
+        return
+
+    plan = build_plan(chunk_files, args)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=2)
+
+    totals = plan["totals"]
+    records = [c["num_records"] for c in plan["chunks"].values()]
+    print(f"{Fore.CYAN}Planned {totals['chunks']} chunks{Fore.RESET}")
+    print(f"Q&A pairs requested: {totals['num_records']} (fixed 15/chunk would be {totals['fixed_15_records']})")
+    print(f"Records per chunk: min {min(records)}, median {sorted(records)[len(records) // 2]}, max {max(records)}")
+    for stage in ("generation", "judge"):
+        s = totals[stage]
+        print(f"{Fore.YELLOW}{stage:<10}{Fore.RESET} {s['calls']:>6} calls, {s['input_tokens']:>10,} in / "
+              f"{s['output_tokens']:>10,} out tokens, ~{s['minutes']:.1f} min (bound by {s['bottleneck']})")
+    print(f"Plan saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
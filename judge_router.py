@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Local quality model that routes Q&A pairs away from the LLM judge.
+
+Once the judge store holds enough LLM judgments (ROUTER_MIN_TRAIN), two
+logistic regressions on signed hashed n-gram features (NumPy only) learn
+P(accuracy >= MIN_SCORE) and P(style >= MIN_SCORE) from them. With JUDGE_ROUTER=1,
+dataquality_check.py then:
+
+- scores a record locally when the model is sure: both heads at or above
+  ROUTER_CONFIDENCE, or either head at or below 1 - ROUTER_CONFIDENCE
+- sends uncertain records to the judge, so the next run trains on exactly
+  the records the model found hardest
+- still sends a ROUTER_CALIBRATION_FRACTION sample of the sure records to the
+  judge and tracks how often the local verdict agreed
+
+The model is retrained from the store at the start of every run. It is only
+used while its held-out agreement, and that of the last calibration sample,
+reach ROUTER_MIN_AGREEMENT. After a failed calibration the router waits for
+ROUTER_RETRY_AFTER new LLM judgments, then runs a probe: every record it is
+sure about goes to the judge, and if they agree it routes again the next run.
+Local scores are stored under the judge name "local:router" and are never
+used as training labels.
+
+    python judge_router.py evaluate --confidence 0.9   # held-out agreement and routable share
+    python judge_router.py stats                       # training rows and calibration history
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+import zlib
+
+import numpy as np
+from colorama import Fore
+
+from judge_store import JUDGE_DB, MIN_SCORE, JudgeStore
+from subset_selection import tokenize
+
+ROUTER_ENABLED = os.getenv("JUDGE_ROUTER", "0").lower() in ("1", "true", "yes")
+MIN_TRAIN = int(os.getenv("ROUTER_MIN_TRAIN", "2000"))
+CONFIDENCE = float(os.getenv("ROUTER_CONFIDENCE", "0.9"))
+CALIBRATION_FRACTION = float(os.getenv("ROUTER_CALIBRATION_FRACTION", "0.05"))
+MIN_AGREEMENT = float(os.getenv("ROUTER_MIN_AGREEMENT", "0.9"))
+RETRY_AFTER = int(os.getenv("ROUTER_RETRY_AFTER", "500"))
+FEATURE_BITS = int(os.getenv("ROUTER_FEATURE_BITS", "18"))
+ROUTER_STATE = os.getenv("ROUTER_STATE", "dataset/judge_router.json")
+
+LOCAL_JUDGE = "local:router"
+HOLDOUT_FRACTION = 0.2
+MIN_CALIBRATION_SAMPLES = 20
+HEADS = ("accuracy", "style")
+DENSE_FEATURES = 4
+
+
+def hash_fraction(record_hash):
+    """Deterministic position of a content hash in [0, 1)"""
+    return int(record_hash[:8], 16) / 2 ** 32
+
+
+class HashedFeatures:
+    """Sparse CSR rows of signed hashed question/answer n-grams plus a few length features"""
+
+    def __init__(self, records, bits=FEATURE_BITS):
+        hashed = 1 << bits
+        self.dims = hashed + DENSE_FEATURES
+        indptr, indices, values = [0], [], []
+        for record in records:
+            row = {}
+            words = {}
+            for field in ("question", "answer"):
+                tokens = tokenize(str(record.get(field, "")))
+                words[field] = {t for t in tokens if " " not in t}
+                for token in tokens:
+                    h = zlib.crc32(f"{field[0]}:{token}".encode("utf-8"))
+                    col = h & (hashed - 1)
+                    # The sign bit halves the bias from colliding n-grams
+                    row[col] = row.get(col, 0.0) + (1.0 if h >> 31 else -1.0)
+            norm = math.sqrt(sum(v * v for v in row.values())) or 1.0
+            question, answer = words["question"], words["answer"]
+            dense = (
+                math.log1p(len(str(record.get("question", "")))) / 8,
+                math.log1p(len(str(record.get("answer", "")))) / 8,
+                len(question & answer) / max(len(question), 1),
+                min(len(answer) / max(len(question), 1), 10.0) / 10,
+            )
+            row = {col: value / norm for col, value in row.items()}
+            row.update({hashed + i: value for i, value in enumerate(dense)})
+            indices.extend(row)
+            values.extend(row.values())
+            indptr.append(len(indices))
+        self.rows = len(records)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.row_ids = np.repeat(np.arange(self.rows), np.diff(np.asarray(indptr)))
+
+    def dot(self, weights):
+        return np.bincount(self.row_ids, weights=self.values * weights[self.indices], minlength=self.rows)
+
+    def transpose_dot(self, residual):
+        return np.bincount(self.indices, weights=self.values * residual[self.row_ids], minlength=self.dims)
+
+
+def sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+def train_logistic(X, y, epochs=80, learning_rate=0.5, l2=1e-4):
+    """Full-batch Adagrad on the L2-regularised log loss; returns (weights, bias)"""
+    prior = min(max(y.mean(), 1e-3), 1 - 1e-3)
+    weights, bias = np.zeros(X.dims), math.log(prior / (1 - prior))
+    weight_g2, bias_g2 = np.full(X.dims, 1e-8), 1e-8
+    for _ in range(epochs):
+        residual = (sigmoid(X.dot(weights) + bias) - y) / X.rows
+        grad = X.transpose_dot(residual) + l2 * weights
+        grad_bias = residual.sum()
+        weight_g2 += grad * grad
+        bias_g2 += grad_bias * grad_bias
+        weights -= learning_rate * grad / np.sqrt(weight_g2)
+        bias -= learning_rate * grad_bias / math.sqrt(bias_g2)
+    return weights, bias
+
+
+def local_score(probability):
+    """Map P(score >= 7) onto the judge's 1-10 scale (0.9 -> 9, 0.1 -> 2)"""
+    return int(round(1 + 9 * float(probability)))
+
+
+def local_passes(probabilities):
+    return all(local_score(p) >= MIN_SCORE for p in probabilities)
+
+
+class JudgeRouter:
+    """One logistic head per judge axis over shared hashed features"""
+
+    def __init__(self, heads, bits=FEATURE_BITS, confidence=CONFIDENCE):
+        self.heads = heads
+        self.bits = bits
+        self.confidence = confidence
+        self.calibration_fraction = CALIBRATION_FRACTION
+
+    @classmethod
+    def fit(cls, rows, bits=FEATURE_BITS, confidence=CONFIDENCE):
+        X = HashedFeatures(rows, bits)
+        heads = [train_logistic(X, np.array([row[axis] >= MIN_SCORE for row in rows], dtype=np.float64))
+                 for axis in HEADS]
+        return cls(heads, bits, confidence)
+
+    def predict(self, records):
+        """(n, 2) array of P(accuracy >= 7), P(style >= 7)"""
+        if not records:
+            return np.zeros((0, len(HEADS)))
+        X = HashedFeatures(records, self.bits)
+        return np.column_stack([sigmoid(X.dot(weights) + bias) for weights, bias in self.heads])
+
+    def confident(self, probabilities):
+        """Rows whose pass/fail verdict the model is sure of"""
+        sure_pass = (probabilities >= self.confidence).all(axis=1)
+        sure_fail = (probabilities <= 1 - self.confidence).any(axis=1)
+        return sure_pass | sure_fail
+
+    def local_result(self, probabilities):
+        """A judge-shaped result for a locally scored record"""
+        return {
+            "quality": {axis: {"score": local_score(p), "explanation": f"local router, P(score >= 7) = {p:.3f}"}
+                        for axis, p in zip(HEADS, probabilities)},
+            "router": {axis: round(float(p), 4) for axis, p in zip(HEADS, probabilities)},
+        }
+
+
+def training_rows(store):
+    """LLM (or imported) judgments only; the router never learns from its own scores"""
+    return store.select("judge IS NULL OR judge NOT LIKE 'local:%'",
+                        columns="hash, question, answer, accuracy, style")
+
+
+def evaluate(rows, confidence=CONFIDENCE, bits=FEATURE_BITS):
+    """Train on a hash split and report how the router would have done on the held-out part"""
+    train = [r for r in rows if hash_fraction(r["hash"]) >= HOLDOUT_FRACTION]
+    holdout = [r for r in rows if hash_fraction(r["hash"]) < HOLDOUT_FRACTION]
+    if not train or not holdout:
+        return {"train": len(train), "holdout": len(holdout), "routable": 0.0, "agreement": None}
+    router = JudgeRouter.fit(train, bits, confidence)
+    probabilities = router.predict(holdout)
+    sure = router.confident(probabilities)
+    truth = np.array([r["accuracy"] >= MIN_SCORE and r["style"] >= MIN_SCORE for r in holdout])
+    predicted = np.array([local_passes(p) for p in probabilities])
+    agree = predicted == truth
+    return {
+        "train": len(train),
+        "holdout": len(holdout),
+        "pass_rate": round(float(truth.mean()), 4),
+        "verdict_accuracy": round(float(agree.mean()), 4),
+        "routable": round(float(sure.mean()), 4),
+        "agreement": round(float(agree[sure].mean()), 4) if sure.any() else None,
+    }
+
+
+def load_state(path=ROUTER_STATE):
+    if not os.path.exists(path):
+        return {"calibration": []}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state, path=ROUTER_STATE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+
+
+def last_calibration(state):
+    """The most recent calibration sample large enough to judge agreement by"""
+    for entry in reversed(state.get("calibration", [])):
+        if entry["sampled"] >= MIN_CALIBRATION_SAMPLES:
+            return entry
+    return None
+
+
+def prepare_router(store, enabled=ROUTER_ENABLED):
+    """Train the router from the store, or return None when it should not route this run"""
+    if not enabled:
+        return None
+    rows = training_rows(store)
+    if len(rows) < MIN_TRAIN:
+        print(f"{Fore.YELLOW}Router off: {len(rows)} LLM judgments, needs {MIN_TRAIN} (ROUTER_MIN_TRAIN){Fore.RESET}")
+        return None
+    state = load_state()
+    calibration = last_calibration(state)
+    probe = bool(calibration and calibration["agreed"] / calibration["sampled"] < MIN_AGREEMENT)
+    if probe:
+        # The judge keeps labelling while the router is off; retry once enough new labels arrived
+        new_rows = len(rows) - calibration.get("trained_rows", 0)
+        if new_rows < RETRY_AFTER:
+            print(f"{Fore.YELLOW}Router off: last calibration agreed on {calibration['agreed']}/"
+                  f"{calibration['sampled']} records (< {MIN_AGREEMENT:.0%}), retrying after "
+                  f"{RETRY_AFTER - new_rows} more LLM judgments (ROUTER_RETRY_AFTER){Fore.RESET}")
+            return None
+    holdout = evaluate(rows)
+    state.update(trained_rows=len(rows), holdout=holdout, trained_at=time.time())
+    save_state(state)
+    if holdout["agreement"] is None or holdout["agreement"] < MIN_AGREEMENT:
+        print(f"{Fore.YELLOW}Router off: held-out agreement {holdout['agreement']} < {MIN_AGREEMENT:.0%}{Fore.RESET}")
+        return None
+    print(f"{Fore.CYAN}Router trained on {len(rows)} judgments: {holdout['agreement']:.1%} held-out agreement, "
+          f"{holdout['routable']:.0%} of records routable{Fore.RESET}")
+    router = JudgeRouter.fit(rows)
+    if probe:
+        print(f"{Fore.CYAN}Router probe: every record it is sure about goes to the judge this run{Fore.RESET}")
+        router.calibration_fraction = 1.0
+    return router
+
+
+def route(router, records, hashes, calibration_fraction=None):
+    """
+    Split records into (local, to_judge, calibration): local is a list of
+    (record, result) pairs, to_judge keeps the input order, and calibration
+    maps the hash of each sampled confident record to the local verdict.
+    """
+    if calibration_fraction is None:
+        calibration_fraction = router.calibration_fraction
+    probabilities = router.predict(records)
+    sure = router.confident(probabilities)
+    local, to_judge, calibration = [], [], {}
+    for record, record_hash, p, confident in zip(records, hashes, probabilities, sure):
+        if not confident:
+            to_judge.append(record)
+        elif hash_fraction(record_hash[8:]) < calibration_fraction:
+            calibration[record_hash] = local_passes(p)
+            to_judge.append(record)
+        else:
+            local.append((record, router.local_result(p)))
+    return local, to_judge, calibration
+
+
+def record_calibration(sampled, agreed):
+    """Append one run's calibration sample to the router state"""
+    state = load_state()
+    state.setdefault("calibration", []).append({"time": time.time(), "sampled": sampled, "agreed": agreed,
+                                                "trained_rows": state.get("trained_rows", 0)})
+    save_state(state)
+    colour = Fore.GREEN if agreed >= MIN_AGREEMENT * sampled else Fore.YELLOW
+    print(f"{colour}Router calibration: judge agreed with {agreed}/{sampled} local verdicts "
+          f"({agreed / max(sampled, 1):.1%}){Fore.RESET}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local quality model that routes records away from the LLM judge")
+    parser.add_argument("--db", default=JUDGE_DB, help="SQLite judge store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    evaluate_parser = subparsers.add_parser("evaluate", help="Held-out agreement and routable share")
+    evaluate_parser.add_argument("--confidence", type=float, nargs="+", default=[CONFIDENCE])
+    evaluate_parser.add_argument("--bits", type=int, default=FEATURE_BITS, help="log2 of hashed feature count")
+    subparsers.add_parser("stats", help="Training rows and calibration history")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    store = JudgeStore(args.db)
+    rows = training_rows(store)
+    store.close()
+    if args.command == "stats":
+        state = load_state()
+        print(f"{Fore.CYAN}{len(rows)} LLM judgments available (router needs {MIN_TRAIN}){Fore.RESET}")
+        if state.get("holdout"):
+            print(f"Last training: {state['trained_rows']} rows, held-out {state['holdout']}")
+        for entry in state.get("calibration", [])[-10:]:
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["time"]))
+            print(f"  {when}  {entry['agreed']}/{entry['sampled']} agreed")
+        return 0
+    for confidence in args.confidence:
+        start = time.perf_counter()
+        result = evaluate(rows, confidence, args.bits)
+        print(f"confidence {confidence:.2f}: {result} ({time.perf_counter() - start:.1f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
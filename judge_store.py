@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Persistent store of every judge result, keyed by record content hash.
+
+dataquality_check.py writes the raw scores and explanations of every judged
+Q&A pair, passed or failed, to a local SQLite database (dataset/judge.db).
+On the next run only records whose question/answer text is new or changed
+are sent to the judge; everything else reuses its stored scores. The
+database also replaces the batch checkpoint, because a crashed run resumes
+by skipping whatever is already stored.
+
+Re-thresholding runs offline against the indexed score columns:
+
+    python judge_store.py stats
+    python judge_store.py filter --min-accuracy 8 --min-style 7
+    python judge_store.py filter --formula "0.7 * accuracy + 0.3 * style >= 7.5"
+    python judge_store.py import-log dataset/judged.jsonl   # seed from an older judged log
+
+By default `filter` only considers records present in dataset/unfiltered.json,
+so stale judgments from earlier datasets never leak into filtered.json.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+from colorama import Fore
+
+JUDGE_DB = os.getenv("JUDGE_DB", "dataset/judge.db")
+MIN_SCORE = 7   # pass mark on both axes for dataquality_check, the store filters and train.py
+FORMULA_TOKEN = re.compile(r"\s*(accuracy|style|and|or|not|min|max|abs|\d+(?:\.\d+)?|<=|>=|==|!=|<|>|[-+*/(),])",
+                           re.I)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS judgments (
+    hash TEXT PRIMARY KEY,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    accuracy INTEGER NOT NULL,
+    style INTEGER NOT NULL,
+    result TEXT,
+    chunk_file TEXT,
+    source_file TEXT,
+    batch TEXT,
+    judge TEXT,
+    judged_at REAL
+);
+CREATE INDEX IF NOT EXISTS judgments_scores ON judgments (accuracy, style);
+"""
+
+
+def content_hash(record):
+    """Hash of the judged text only, so source metadata changes never trigger re-judging"""
+    payload = json.dumps([record["question"], record["answer"]], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _score(quality, axis):
+    try:
+        return max(0, min(10, int(quality.get(axis, {}).get("score", 1))))
+    except (AttributeError, TypeError, ValueError):
+        return 1
+
+
+def scores(result):
+    """(accuracy, style) from a raw judge result; unparseable results score 1"""
+    quality = result.get("quality", {}) if isinstance(result, dict) else {}
+    return _score(quality, "accuracy"), _score(quality, "style")
+
+
+def compile_formula(formula):
+    """Validate a score formula (e.g. "0.7 * accuracy + 0.3 * style >= 7.5") for use as a SQL filter"""
+    position, tokens = 0, []
+    formula = formula.strip()
+    while position < len(formula):
+        match = FORMULA_TOKEN.match(formula, position)
+        if not match:
+            raise ValueError(f"unsupported formula near {formula[position:position + 20]!r}")
+        tokens.append(match.group(1).lower())
+        position = match.end()
+    if not tokens:
+        raise ValueError("empty formula")
+    # min/max of several arguments are SQLite's scalar MIN/MAX
+    return " ".join(tokens).replace("==", "=")
+
+
+class JudgeStore:
+    """SQLite table of judge results, one row per distinct question/answer pair"""
+
+    def __init__(self, path=JUDGE_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM judgments").fetchone()[0]
+
+    def _restrict(self, hashes):
+        """Load hashes into a temp table to join against; returns the join clause"""
+        if hashes is None:
+            return ""
+        self.db.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (hash TEXT PRIMARY KEY)")
+        self.db.execute("DELETE FROM wanted")
+        self.db.executemany("INSERT OR IGNORE INTO wanted VALUES (?)", ((h,) for h in hashes))
+        return " JOIN wanted USING (hash)"
+
+    def known(self, hashes):
+        """The subset of hashes that already have a judgment"""
+        join = self._restrict(hashes)
+        return {row[0] for row in self.db.execute(f"SELECT hash FROM judgments{join}")}
+
+    def put(self, records, results, batch, judge=None):
+        """Store one batch of judged records (replaces earlier judgments of the same text)"""
+        now = time.time()
+        rows = []
+        for record, result in zip(records, results):
+            accuracy, style = scores(result)
+            rows.append((content_hash(record), record["question"], record["answer"], accuracy, style,
+                         json.dumps(result, ensure_ascii=False), record.get("chunk_file"),
+                         record.get("source_file"), batch, judge, now))
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO judgments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def select(self, where="1", hashes=None, columns="*"):
+        """Rows (as dicts) matching a SQL condition over the score columns"""
+        join = self._restrict(hashes)
+        cursor = self.db.execute(f"SELECT {columns} FROM judgments{join} WHERE {where} ORDER BY judgments.rowid")
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    def results(self, hashes):
+        """{hash: (accuracy, style, raw result)} for the given hashes"""
+        join = self._restrict(hashes)
+        query = f"SELECT hash, accuracy, style, result FROM judgments{join}"
+        return {h: (a, s, json.loads(r) if r else None) for h, a, s, r in self.db.execute(query)}
+
+    def histogram(self, hashes=None):
+        """{(accuracy, style): count}, answered from the score index"""
+        join = self._restrict(hashes)
+        query = f"SELECT accuracy, style, COUNT(*) FROM judgments{join} GROUP BY accuracy, style"
+        return {(a, s): n for a, s, n in self.db.execute(query)}
+
+    def parquet_rows(self, hashes=None):
+        """Rows in the parquet_store schema"""
+        return self.select(hashes=hashes, columns="question, answer, accuracy, style, chunk_file, source_file, batch")
+
+
+def dataset_hashes(data_file):
+    """Hashes of the records in data_file, or None (whole store) when it does not exist"""
+    if not data_file or not os.path.exists(data_file):
+        return None
+    with open(data_file, "r", encoding="utf-8") as f:
+        return {content_hash(r) for r in json.load(f)}
+
+
+def import_log(store, log_path):
+    """Seed the store from a parquet_store judged log (scores only, no explanations)"""
+    from parquet_store import JudgedLog
+    rows = JudgedLog(log_path).load()
+    for row in rows:
+        result = {"quality": {"accuracy": {"score": row["accuracy"]}, "style": {"score": row["style"]}}}
+        store.put([row], [result], row.get("batch"), judge="imported")
+    return len(rows)
+
+
+def print_stats(store, hashes):
+    counts = store.histogram(hashes)
+    total = sum(counts.values())
+    scope = f"{len(hashes)} current records" if hashes is not None else "the whole store"
+    print(f"{Fore.CYAN}{total} judged records ({len(store)} stored, scope: {scope}){Fore.RESET}")
+    if hashes is not None and total < len(hashes):
+        print(f"{Fore.YELLOW}{len(hashes) - total} current records not judged yet{Fore.RESET}")
+    print("Records kept at min score (accuracy = style):")
+    for threshold in range(5, 11):
+        kept = sum(c for (a, s), c in counts.items() if a >= threshold and s >= threshold)
+        print(f"  >= {threshold:<2} {kept:>8} ({kept / max(total, 1):.1%})")
+
+
+def write_filtered(store, where, hashes, output):
+    rows = store.select(where, hashes, columns="question, answer, chunk_file, source_file")
+    records = [{k: v for k, v in row.items() if v is not None} for row in rows]
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(records, f, indent=2)
+    print(f"{Fore.GREEN}✓ Kept {len(records)} records where {where}{Fore.RESET}")
+    print(f"Saved to: {output}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Query and re-threshold stored judge scores without LLM calls")
+    parser.add_argument("--db", default=JUDGE_DB, help="SQLite judge store")
+    parser.add_argument("--data", default="dataset/unfiltered.json",
+                        help="Only consider records in this file ('' for the whole store)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="Record counts per score threshold")
+    filter_parser = subparsers.add_parser("filter", help="Write the records that pass new thresholds or a formula")
+    filter_parser.add_argument("--min-accuracy", type=int, default=MIN_SCORE)
+    filter_parser.add_argument("--min-style", type=int, default=MIN_SCORE)
+    filter_parser.add_argument("--formula", help="Condition over accuracy/style, replaces the minimums")
+    filter_parser.add_argument("--output", default="final_dataset/filtered.json")
+    import_parser = subparsers.add_parser("import-log", help="Seed the store from a judged.jsonl log")
+    import_parser.add_argument("log", nargs="?", default="dataset/judged.jsonl")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    store = JudgeStore(args.db)
+    try:
+        if args.command == "import-log":
+            count = import_log(store, args.log)
+            print(f"{Fore.GREEN}✓ Imported {count} judged rows into {args.db}{Fore.RESET}")
+            return 0
+        hashes = dataset_hashes(args.data)
+        if args.command == "stats":
+            print_stats(store, hashes)
+            return 0
+        if args.formula:
+            try:
+                where = compile_formula(args.formula)
+            except ValueError as e:
+                print(f"{Fore.RED}Error: {e}{Fore.RESET}")
+                return 1
+        else:
+            where = f"accuracy >= {args.min_accuracy} AND style >= {args.min_style}"
+        write_filtered(store, where, hashes, args.output)
+        return 0
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Cross-stage lineage: source file -> chunks -> generated pairs -> judge results.
+
+Every artifact records a digest of what it was built from:
+
+- chunk files carry the sha256 of their source PDF (metadata.source_digest);
+  chunks written before digests were recorded are trusted and get the
+  current digest on the first `make`
+- raw.json entries carry the sha256 of the chunk text they were generated
+  from (chunk_digest)
+- judge results live in the judge store keyed by the pair's content hash
+
+Comparing those digests with the current files gives make-style invalidation.
+An edited PDF is re-chunked; a chunk whose text changed, or that is new, is
+regenerated; pairs of removed sources are dropped; only new pairs reach the
+judge. Everything else is carried forward untouched.
+
+    python lineage.py status              # what is out of date (like make -n)
+    python lineage.py make                # rebuild only the stale parts, through judging
+    python lineage.py index               # write the index to dataset/lineage.json
+    python lineage.py trace "permit cost" # where a final record came from
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+
+from colorama import Fore
+
+DATA_GLOB = os.path.join("data", "*.pdf")
+CHUNK_GLOB = os.path.join("chunks", "*_chunk_*.json")
+RAW_DATASET = "dataset/raw.json"
+LINEAGE_INDEX = "dataset/lineage.json"
+REMOTE_SOURCE = re.compile(r"^[a-z]+://", re.I)
+STAGES = ("chunk", "generate", "preprocess", "judge")
+
+
+def file_digest(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_stem(pdf_file):
+    return os.path.splitext(os.path.basename(pdf_file))[0]
+
+
+def load_raw(path=RAW_DATASET):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_raw(dataset, path=RAW_DATASET):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(dataset, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def build_index(raw_path=RAW_DATASET, judge_db=None):
+    """Lineage of the current tree plus what is stale at each level"""
+    from judge_store import JUDGE_DB, JudgeStore, content_hash
+
+    sources = {path: {"digest": file_digest(path), "chunks": []} for path in sorted(glob.glob(DATA_GLOB))}
+    chunks, removed_sources = {}, {}
+    for path in sorted(glob.glob(CHUNK_GLOB)):
+        with open(path, "r", encoding="utf-8") as f:
+            chunk = json.load(f)
+        name = os.path.basename(path)
+        source = chunk.get("source_file")
+        chunks[name] = {"source": source, "source_digest": chunk.get("metadata", {}).get("source_digest"),
+                        "digest": text_digest(chunk["contextualized_text"]), "entry": None, "pairs": []}
+        if source in sources:
+            sources[source]["chunks"].append(name)
+        elif source and not REMOTE_SOURCE.match(source):
+            removed_sources.setdefault(source, []).append(name)
+
+    orphans = []
+    for key, entry in load_raw(raw_path).items():
+        name = entry.get("chunk_file")
+        if name not in chunks:
+            orphans.append(key)
+            continue
+        pairs = [content_hash(p) for p in entry.get("generated") or entry.get("records") or []
+                 if isinstance(p, dict) and "question" in p and "answer" in p]
+        chunks[name].update(entry=key, generated_from=entry.get("chunk_digest"), pairs=pairs)
+
+    store = JudgeStore(judge_db or JUDGE_DB)
+    judged = store.known([h for c in chunks.values() for h in c["pairs"]])
+    store.close()
+
+    changed_sources = sorted(path for path, source in sources.items()
+                             if not source["chunks"]
+                             # Chunks without a source digest predate lineage: unknown, not changed
+                             or any(chunks[c]["source_digest"] not in (None, source["digest"])
+                                    for c in source["chunks"]))
+    rechunked = {c for path in changed_sources for c in sources[path]["chunks"]}
+    removed_chunks = {c for names in removed_sources.values() for c in names}
+    stale_chunks = sorted(
+        name for name, chunk in chunks.items()
+        if name not in rechunked and name not in removed_chunks
+        # Legacy entries without a digest are trusted, like make with no timestamp to compare
+        and (chunk["entry"] is None or chunk.get("generated_from") not in (None, chunk["digest"])))
+    affected = rechunked | removed_chunks | set(stale_chunks)
+    carried = [h for n, c in chunks.items() if n not in affected for h in c["pairs"]]
+    return {
+        "sources": sources,
+        "chunks": chunks,
+        "judged": len(judged),
+        "stale": {
+            "changed_sources": changed_sources,
+            "removed_sources": sorted(removed_sources),
+            "removed_chunks": sorted(removed_chunks),
+            "regenerate": stale_chunks,
+            "orphan_entries": orphans,
+            "invalidated_pairs": sum(len(chunks[c]["pairs"]) for c in affected),
+            "carried_pairs": len(carried),
+            "unjudged_pairs": len(set(carried) - judged),
+        },
+    }
+
+
+def print_status(index):
+    stale = index["stale"]
+    chunks = index["chunks"]
+    pairs = sum(len(c["pairs"]) for c in chunks.values())
+    print(f"{Fore.CYAN}{len(index['sources'])} sources, {len(chunks)} chunks, {pairs} pairs "
+          f"({index['judged']} judged){Fore.RESET}")
+    for path in stale["changed_sources"]:
+        state = "new" if not index["sources"][path]["chunks"] else "changed"
+        print(f"  {Fore.YELLOW}re-chunk{Fore.RESET}   {path} ({state})")
+    for path in stale["removed_sources"]:
+        print(f"  {Fore.RED}remove{Fore.RESET}     {path} (source deleted)")
+    if stale["regenerate"]:
+        print(f"  {Fore.YELLOW}regenerate{Fore.RESET} {len(stale['regenerate'])} new or changed chunks")
+    if stale["orphan_entries"]:
+        print(f"  {Fore.RED}drop{Fore.RESET}       {len(stale['orphan_entries'])} raw.json entries without a chunk file")
+    if stale["unjudged_pairs"]:
+        print(f"  {Fore.YELLOW}judge{Fore.RESET}      {stale['unjudged_pairs']} pairs without a stored score")
+    if not any(stale[k] for k in ("changed_sources", "removed_sources", "regenerate", "orphan_entries",
+                                  "unjudged_pairs")):
+        print(f"{Fore.GREEN}✓ Everything is up to date{Fore.RESET}")
+        return False
+    print(f"Up to {stale['invalidated_pairs']} pairs invalidated, {stale['carried_pairs']} carried forward")
+    return True
+
+
+def remove_chunks(names):
+    for name in names:
+        path = os.path.join("chunks", name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def drop_entries(doomed, raw_path=RAW_DATASET):
+    """Drop the raw.json entries with these keys; returns how many"""
+    dataset = load_raw(raw_path)
+    kept = {key: entry for key, entry in dataset.items() if key not in doomed}
+    if len(kept) != len(dataset):
+        save_raw(kept, raw_path)
+    return len(dataset) - len(kept)
+
+
+def backfill_source_digests(index):
+    """Record the current source digest in chunk files written before lineage; returns how many"""
+    filled = 0
+    for path, source in index["sources"].items():
+        for name in source["chunks"]:
+            if index["chunks"][name]["source_digest"] is not None:
+                continue
+            chunk_path = os.path.join("chunks", name)
+            with open(chunk_path, "r", encoding="utf-8") as f:
+                chunk = json.load(f)
+            chunk.setdefault("metadata", {})["source_digest"] = source["digest"]
+            with open(chunk_path, "w", encoding="utf-8") as f:
+                json.dump(chunk, f, indent=2, ensure_ascii=False)
+            index["chunks"][name]["source_digest"] = source["digest"]
+            filled += 1
+    return filled
+
+
+def discard_ledger_rows(index, names, ledger_path=None):
+    """Drop work-ledger rows of these chunks unless they already hold the current chunk text"""
+    from work_ledger import LEDGER_DB, WorkLedger
+    ledger_path = ledger_path or LEDGER_DB
+    if not names or not os.path.exists(ledger_path):
+        return 0
+    ledger = WorkLedger(ledger_path)
+    dropped = ledger.discard_stale({name: index["chunks"][name]["digest"] if name in index["chunks"] else None
+                                    for name in names})
+    ledger.close()
+    if dropped:
+        print(f"{Fore.CYAN}Dropped {dropped} stale work-ledger rows{Fore.RESET}")
+    return dropped
+
+
+def make(index, until="judge"):
+    """Rebuild only what is stale, stage by stage; returns a process exit code"""
+    stale = index["stale"]
+    filled = backfill_source_digests(index)
+    if filled:
+        print(f"{Fore.CYAN}Recorded source digests in {filled} chunks written before lineage{Fore.RESET}")
+    removed = set(stale["removed_chunks"])
+    remove_chunks(removed)
+    doomed = {index["chunks"][c]["entry"] for c in removed}
+    rewritten = set()
+
+    if stale["changed_sources"]:
+        import chunk_generation
+        previous = {c: index["chunks"][c] for path in stale["changed_sources"] for c in index["sources"][path]["chunks"]}
+        print(f"{Fore.CYAN}Re-chunking {len(stale['changed_sources'])} sources{Fore.RESET}")
+        if chunk_generation.main(["--files", *stale["changed_sources"]]):
+            return 1
+        # Chunks whose text survived the edit keep their pairs; only new or changed text is stale
+        index = build_index()
+        stale = index["stale"]
+        # Entries without a chunk digest were generated from the previous chunk file, so
+        # they are stale only when re-chunking changed that file's text
+        rewritten = {name for name, chunk in index["chunks"].items()
+                     if name in previous and chunk["entry"] is not None and chunk.get("generated_from") is None
+                     and chunk["digest"] != previous[name]["digest"]}
+        doomed |= {index["chunks"][name]["entry"] for name in rewritten}
+    doomed |= set(stale["orphan_entries"]) | {index["chunks"][c]["entry"] for c in stale["regenerate"]}
+    doomed.discard(None)
+    raw = load_raw()
+    orphaned = {raw[key].get("chunk_file") for key in stale["orphan_entries"]} - {None}
+    discard_ledger_rows(index, removed | orphaned | rewritten | set(stale["regenerate"]))
+    print(f"{Fore.CYAN}Dropped {drop_entries(doomed)} stale raw.json entries, "
+          f"regenerating {len(set(stale['regenerate']) | rewritten)} chunks{Fore.RESET}")
+    if until == "chunk":
+        return 0
+
+    # Generation skips every chunk whose raw.json entry matches its digest
+    import syntheticdatageneration
+    syntheticdatageneration.main([])
+    if until == "generate":
+        return 0
+
+    import preprocess
+    if preprocess.main():
+        return 1
+    if until == "preprocess":
+        return 0
+
+    # The judge store re-judges only pairs it has not seen
+    import dataquality_check
+    dataquality_check.main()
+    return 0
+
+
+def trace(index, text):
+    """Print the lineage of final records whose question contains `text`"""
+    from judge_store import JUDGE_DB, JudgeStore, content_hash
+    dataset = load_raw()
+    store = JudgeStore(JUDGE_DB)
+    found = 0
+    for name, chunk in index["chunks"].items():
+        entry = dataset.get(chunk["entry"]) if chunk["entry"] is not None else None
+        for pair in (entry or {}).get("generated") or []:
+            if not isinstance(pair, dict) or text.lower() not in str(pair.get("question", "")).lower():
+                continue
+            found += 1
+            pair_hash = content_hash(pair)
+            result = store.results([pair_hash]).get(pair_hash)
+            score = f"accuracy {result[0]}, style {result[1]}" if result else "not judged"
+            print(f"{Fore.CYAN}{pair['question']}{Fore.RESET}")
+            print(f"  source  {chunk['source']}")
+            print(f"  chunk   {name} (sha256 {chunk['digest'][:12]})")
+            print(f"  pair    {pair_hash[:12]}  judge: {score}")
+    store.close()
+    if not found:
+        print(f"{Fore.YELLOW}No generated question contains {text!r}{Fore.RESET}")
+
+
+def write_index(index, path=LINEAGE_INDEX):
+    """Compact JSON index: sources with chunk names, chunks with digests and pair hashes"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"sources": index["sources"], "chunks": index["chunks"], "stale": index["stale"]}, f,
+                  separators=(",", ":"))
+    return path
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Lineage index and incremental rebuilds")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="Show what is out of date")
+    make_parser = subparsers.add_parser("make", help="Rebuild only stale sources, chunks and pairs")
+    make_parser.add_argument("--until", choices=STAGES, default="judge", help="Last stage to run")
+    index_parser = subparsers.add_parser("index", help="Write the lineage index")
+    index_parser.add_argument("--output", default=LINEAGE_INDEX)
+    trace_parser = subparsers.add_parser("trace", help="Show where records came from")
+    trace_parser.add_argument("text", help="Part of the question text")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    index = build_index()
+    if args.command == "status":
+        print_status(index)
+    elif args.command == "index":
+        print(f"Lineage index saved to: {write_index(index, args.output)}")
+    elif args.command == "trace":
+        trace(index, args.text)
+    elif print_status(index):
+        code = make(index, args.until)
+        write_index(build_index())
+        return code
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
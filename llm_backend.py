@@ -0,0 +1,176 @@
+"""
+Pluggable LLM backends for the dataset pipeline.
+
+The backend is chosen by configuration instead of being hard-wired:
+
+    LLM_BACKEND=gemini   Google Gemini via google.generativeai (default)
+    LLM_BACKEND=mock     Local stand-in server (see mock_llm_server.py)
+
+LLM_MODEL overrides the model name each stage asks for, and MOCK_LLM_URL
+points the mock backend at a running mock server.
+
+Every backend exposes `generate_content(prompt)` returning an object with
+`.text` and `.usage_metadata`, so call sites written against the Gemini SDK
+keep working unchanged. `get_chat_model()` returns a LangChain-style model
+(`invoke(prompt).content`, `await ainvoke(prompt)`) for the web scraper.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+DEFAULT_BACKEND = "gemini"
+DEFAULT_MOCK_URL = "http://127.0.0.1:8765"
+
+
+class RateLimitError(Exception):
+    """Raised when a backend reports HTTP 429 / quota exhaustion"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMResponse:
+    """Minimal response object shared by non-Gemini backends"""
+
+    def __init__(self, text, input_tokens=0, output_tokens=0):
+        self.text = text
+        self.content = text  # LangChain AIMessage compatibility
+        self.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens}
+
+
+class GeminiBackend:
+    """Google Gemini through the google.generativeai SDK"""
+
+    name = "gemini"
+
+    def __init__(self, model_name):
+        import google.generativeai as genai
+
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate_content(self, prompt):
+        try:
+            return self.model.generate_content(prompt)
+        except Exception as e:
+            if _looks_rate_limited(e):
+                raise RateLimitError(str(e)) from e
+            raise
+
+
+class MockBackend:
+    """HTTP client for the local mock server; never leaves the machine"""
+
+    name = "mock"
+
+    def __init__(self, model_name, url=None, timeout=120):
+        self.model_name = model_name
+        self.url = (url or os.getenv("MOCK_LLM_URL", DEFAULT_MOCK_URL)).rstrip("/")
+        self.timeout = timeout
+
+    def generate_content(self, prompt):
+        body = json.dumps({"model": self.model_name, "prompt": prompt}).encode("utf-8")
+        request = urllib.request.Request(
+            f"{self.url}/v1/generate",
+            data=body,
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                payload = json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                retry_after = e.headers.get("Retry-After")
+                raise RateLimitError(
+                    "429 Resource has been exhausted (mock)",
+                    retry_after=float(retry_after) if retry_after else None,
+                ) from e
+            raise
+        usage = payload.get("usage", {})
+        return LLMResponse(payload["text"], usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+
+    # LangChain-style interface used by the web scraper
+    def invoke(self, prompt):
+        return self.generate_content(prompt)
+
+    async def ainvoke(self, prompt):
+        # urllib is blocking; keep the scraper's event loop free while the mock answers
+        return await asyncio.to_thread(self.generate_content, prompt)
+
+
+BACKENDS = {
+    "gemini": GeminiBackend,
+    "mock": MockBackend,
+}
+
+
+def _looks_rate_limited(error):
+    text = str(error).lower()
+    return "429" in text or "resource has been exhausted" in text or "quota" in text or "rate limit" in text
+
+
+def backend_name():
+    return os.getenv("LLM_BACKEND", DEFAULT_BACKEND).lower()
+
+
+def get_backend(default_model="gemini-2.0-flash", backend=None):
+    """Build the configured backend for a pipeline stage"""
+    name = (backend or backend_name()).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM_BACKEND '{name}'. Choose one of: {', '.join(sorted(BACKENDS))}")
+    model_name = os.getenv("LLM_MODEL", default_model)
+    return BACKENDS[name](model_name)
+
+
+class LazyBackend:
+    """Defers building a backend (SDK import, genai.configure) until the first call"""
+
+    def __init__(self, default_model, factory=None):
+        self.default_model = default_model
+        self._factory = factory or (lambda: get_backend(default_model))
+        self._backend = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self._factory()
+        return self._backend
+
+    def generate_content(self, prompt):
+        return self.get().generate_content(prompt)
+
+    def invoke(self, prompt):
+        return self.get().invoke(prompt)
+
+    async def ainvoke(self, prompt):
+        return await self.get().ainvoke(prompt)
+
+
+def lazy_backend(default_model="gemini-2.0-flash"):
+    """Module-level stand-in for get_backend() with no import-time side effects"""
+    return LazyBackend(default_model)
+
+
+def get_chat_model(default_model="gemini-2.0-flash-lite", temperature=0.3, max_output_tokens=1200, backend=None):
+    """Build a LangChain-compatible chat model for the web scraper"""
+    name = (backend or backend_name()).lower()
+    model_name = os.getenv("LLM_MODEL", default_model)
+    if name == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(
+            model=model_name,
+            google_api_key=os.environ["GOOGLE_API_KEY"],
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+        )
+    return get_backend(model_name, backend=name)
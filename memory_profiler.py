@@ -0,0 +1,272 @@
+"""
+Memory profiling and RSS budget enforcement for the pipeline stages.
+
+Profiling is opt-in (PIPELINE_MEMPROFILE=1). It turns on tracemalloc and a
+background thread that samples process RSS. For every stage it records the
+RSS at entry and exit, the RSS peak and the peak of Python allocations.
+Labelled snapshots (one per PDF, window or batch) list the top allocation
+sites. Everything goes to <PIPELINE_METRICS_DIR>/<run>_memory.json on exit.
+
+A budget (MEMORY_BUDGET_MB) works with or without profiling:
+
+- above MEMORY_SOFT_FRACTION of the budget, check() returns "shrink" and the
+  stage reduces its batch or page window
+- at the budget the run aborts with MemoryBudgetExceeded, either at the next
+  check() or, mid-stage, from the sampler interrupting the main thread; the
+  stage saves what it has and exits non-zero instead of being OOM-killed.
+  The interrupt only lands in the stage the sampler saw running; if that
+  stage has already finished it is ignored and the next check() raises
+
+RSS covers native allocations (torch, docling's layout models); tracemalloc
+only sees Python objects, so the two are reported side by side.
+"""
+
+import _thread
+import atexit
+import json
+import os
+import signal
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from metrics import METRICS_DIR
+
+MB = 1024 * 1024
+BUDGET_MB = float(os.getenv("MEMORY_BUDGET_MB", "0"))
+SOFT_FRACTION = float(os.getenv("MEMORY_SOFT_FRACTION", "0.85"))
+SAMPLE_SECONDS = float(os.getenv("MEMPROFILE_SAMPLE_SECONDS", "0.25"))
+TOP_SITES = int(os.getenv("MEMPROFILE_TOP", "10"))
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """Process RSS reached MEMORY_BUDGET_MB"""
+
+
+class _BudgetInterrupt(KeyboardInterrupt):
+    """Raised in the main thread by the sampler; a BaseException so per-item `except Exception` cannot swallow it"""
+
+
+def rss_bytes():
+    """Current resident set size (peak RSS where the current value is unavailable)"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryProfiler:
+    """Per-stage RSS/tracemalloc statistics plus budget checks"""
+
+    def __init__(self, enabled=False, budget_mb=0.0, soft_fraction=SOFT_FRACTION, run_name="pipeline"):
+        self.enabled = enabled
+        self.budget = int(budget_mb * MB)
+        self.soft_limit = int(self.budget * soft_fraction)
+        self.run_name = run_name
+        self.started = time.time()
+        self.stages = {}
+        self.snapshots = []
+        self.events = []
+        self.peak_rss = 0
+        self._active = []   # open stages, innermost last: [name, rss peak]
+        self._lock = threading.Lock()
+        self._exceeded = False
+        self._aborting = None   # frame of the stage the sampler interrupted
+        self._sampler = None
+        self._sigint_installed = False
+        self._previous_sigint = None
+        self.exported = False
+
+    @property
+    def active(self):
+        return self.enabled or self.budget > 0
+
+    def start(self, run_name):
+        """Name the run, start tracing and sampling, and export on exit"""
+        self.run_name = run_name
+        self.started = time.time()
+        self.exported = False
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.budget and not self._sigint_installed and threading.current_thread() is threading.main_thread():
+            self._previous_sigint = signal.signal(signal.SIGINT, self._on_sigint)
+            self._sigint_installed = True
+        if self.active and self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample, name="memory-sampler", daemon=True)
+            self._sampler.start()
+        if self.enabled:
+            atexit.unregister(self._export_at_exit)
+            atexit.register(self._export_at_exit)
+        return self
+
+    def _export_at_exit(self):
+        """Fallback for runs that end without exporting (crash, Ctrl+C); no-op once a stage has exported"""
+        if not self.exported:
+            self.export()
+
+    def _on_sigint(self, signum, frame):
+        with self._lock:
+            target, self._aborting = self._aborting, None
+            running = target is not None and any(f is target for f in self._active)
+        if target is None:
+            # A real Ctrl+C
+            if callable(self._previous_sigint):
+                return self._previous_sigint(signum, frame)
+            raise KeyboardInterrupt
+        if running:
+            raise _BudgetInterrupt()
+        # The interrupted stage finished before the interrupt landed: the next check() raises
+
+    def _observe(self, rss):
+        with self._lock:
+            self.peak_rss = max(self.peak_rss, rss)
+            for frame in self._active:
+                frame[1] = max(frame[1], rss)
+
+    def _sample(self):
+        while True:
+            rss = rss_bytes()
+            self._observe(rss)
+            with self._lock:
+                if self.budget and rss >= self.budget and not self._exceeded:
+                    self._exceeded = True
+                    if self._active and self._sigint_installed:
+                        # The main thread may be deep inside a conversion call; raise there at the
+                        # next bytecode boundary rather than wait for the kernel OOM killer.
+                        # Outside a stage the next check() raises instead.
+                        self._aborting = self._active[-1]
+                        self._event("abort", self._aborting[0], rss)
+                        _thread.interrupt_main()
+            time.sleep(SAMPLE_SECONDS)
+
+    def _event(self, kind, stage, rss, **details):
+        self.events.append({"time": round(time.time() - self.started, 3), "event": kind, "stage": stage,
+                            "rss_mb": round(rss / MB, 1), **details})
+
+    def _abort_error(self, stage, rss):
+        return MemoryBudgetExceeded(f"{stage or 'run'} reached {rss / MB:.0f} MB RSS "
+                                    f"(budget {self.budget / MB:.0f} MB, MEMORY_BUDGET_MB)")
+
+    @contextmanager
+    def _profiled(self, name):
+        rss = rss_bytes()
+        frame = [name, rss]
+        with self._lock:
+            self._active.append(frame)
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        began = time.perf_counter()
+        try:
+            yield
+        except _BudgetInterrupt:
+            raise self._abort_error(name, max(frame[1], rss_bytes())) from None
+        finally:
+            end_rss = rss_bytes()
+            self._observe(end_rss)
+            with self._lock:
+                self._active.remove(frame)
+                entry = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "rss_start_mb": round(rss / MB, 1),
+                                                      "rss_peak_mb": 0.0, "python_peak_mb": 0.0})
+                entry["calls"] += 1
+                entry["seconds"] = round(entry["seconds"] + time.perf_counter() - began, 3)
+                entry["rss_end_mb"] = round(end_rss / MB, 1)
+                entry["rss_peak_mb"] = max(entry["rss_peak_mb"], round(frame[1] / MB, 1))
+                if tracemalloc.is_tracing():
+                    entry["python_peak_mb"] = max(entry["python_peak_mb"],
+                                                  round(tracemalloc.get_traced_memory()[1] / MB, 1))
+
+    def stage(self, name):
+        """Context manager recording memory for one call of a stage"""
+        if not self.active:
+            return _NULL_STAGE
+        return self._profiled(name)
+
+    def snapshot(self, label, limit=TOP_SITES):
+        """Record RSS and the top Python allocation sites under a label (e.g. a PDF or batch)"""
+        if not self.enabled:
+            return
+        entry = {"label": label, "time": round(time.time() - self.started, 3), "rss_mb": round(rss_bytes() / MB, 1)}
+        if tracemalloc.is_tracing():
+            stats = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ]).statistics("lineno")
+            entry["python_mb"] = round(sum(s.size for s in stats) / MB, 1)
+            entry["top_sites"] = [{"site": f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+                                   "size_kb": round(s.size / 1024, 1), "blocks": s.count} for s in stats[:limit]]
+        self.snapshots.append(entry)
+
+    def check(self, stage, extra_bytes=0):
+        """
+        "ok" or "shrink" (over the soft limit); raises MemoryBudgetExceeded at the
+        budget. extra_bytes is an estimate of memory the caller is about to allocate.
+        """
+        if not self.budget:
+            return "ok"
+        rss = rss_bytes()
+        self._observe(rss)
+        if self._exceeded or rss + extra_bytes >= self.budget:
+            self._exceeded = True
+            self._event("abort", stage, rss, requested_mb=round(extra_bytes / MB, 1))
+            raise self._abort_error(stage, rss + extra_bytes)
+        if rss + extra_bytes >= self.soft_limit:
+            self._event("shrink", stage, rss, requested_mb=round(extra_bytes / MB, 1))
+            return "shrink"
+        return "ok"
+
+    def summary(self):
+        with self._lock:
+            return {
+                "run_name": self.run_name,
+                "started_at": self.started,
+                "wall_seconds": round(time.time() - self.started, 3),
+                "budget_mb": round(self.budget / MB, 1) if self.budget else None,
+                "soft_limit_mb": round(self.soft_limit / MB, 1) if self.budget else None,
+                "peak_rss_mb": round(max(self.peak_rss, rss_bytes()) / MB, 1),
+                "stages": dict(self.stages),
+                "snapshots": list(self.snapshots),
+                "events": list(self.events),
+            }
+
+    def export(self, run_name=None, output_dir=METRICS_DIR):
+        """Write <run_name>_memory.json; returns the path"""
+        if not self.enabled:
+            return None
+        run_name = run_name or self.run_name
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, f"{run_name}_memory.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+        self.exported = True
+        return path
+
+
+class _NullStage:
+    """No-op context manager handed out when profiling and budgets are off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+memory = MemoryProfiler(enabled=os.getenv("PIPELINE_MEMPROFILE", "0").lower() in ("1", "true", "yes"),
+                        budget_mb=BUDGET_MB)
+
+
+def start_profile(run_name):
+    """Name the current run for memory profiling and start the RSS sampler"""
+    return memory.start(run_name)
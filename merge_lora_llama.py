@@ -1,40 +1,64 @@
 #!/usr/bin/env python3
 """
 Merge LoRA adapter with base Llama-3.2-3B-Instruct model and save to merged_travel directory.
+
+Several adapters (or every checkpoint-N directory train.py wrote) can be merged
+against one base model load. Each merged copy is written shard by shard as
+base weight + scale * B @ A, so the base weights are never modified or reloaded;
+with --weights the adapters are combined into a single merged model instead.
+
+    python merge_lora_llama.py
+    python merge_lora_llama.py --adapters meta-llama/Llama-3.2-3b-finetuned --output-dir merged_sweep
+    python merge_lora_llama.py --adapters final_model_v4 final_model_v5 --weights 0.7 0.3 --output merged_mix
 """
 
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from peft import PeftModel
+import argparse
+import json
 import os
+import re
 from pathlib import Path
 from dotenv import load_dotenv
+from memory_profiler import MemoryBudgetExceeded, memory, start_profile
 load_dotenv()
 
 auth_token= os.getenv("HF_TOKEN", "your_huggingface_token_here")  # Ensure you have your Hugging Face token set
 
-def merge_lora_with_base():
+BASE_MODEL_NAME = "meta-llama/Llama-3.2-3B-Instruct"
+DEFAULT_ADAPTER = "final_model_v4"
+DEFAULT_OUTPUT = "merged_travel"
+DEFAULT_SWEEP_DIR = "merged_sweep"
+ADAPTER_PREFIX = "base_model.model."
+SHARD_BYTES = {"1GB": 1 << 30, "5GB": 5 << 30}
+
+def merge_lora_with_base(lora_adapter_path=DEFAULT_ADAPTER, output_path=DEFAULT_OUTPUT):
     """
     Merge the LoRA adapter from final_model_v4 with the base Llama-3.2-3B-Instruct model
     and save the merged model to merged_travel directory.
     """
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from peft import PeftModel
     
     # Paths
-    base_model_name = "meta-llama/Llama-3.2-3B-Instruct"
-    lora_adapter_path = "final_model_v4"
-    output_path = "merged_travel"
+    base_model_name = BASE_MODEL_NAME
     
     print(f"Loading base model: {base_model_name}")
     
+    # Under a memory budget, load weights straight into the model instead of
+    # materialising a randomly initialised copy first
+    low_memory = memory.budget > 0
+    
     # Load base model with memory optimization
-    base_model = AutoModelForCausalLM.from_pretrained(
-        base_model_name,
-        torch_dtype=torch.float16,
-        device_map="cpu",
-        trust_remote_code=True,
-        token=auth_token,  # Use your Hugging Face token for authentication
-        # low_cpu_mem_usage=True,
-    )
+    with memory.stage("load_base"):
+        base_model = AutoModelForCausalLM.from_pretrained(
+            base_model_name,
+            torch_dtype=torch.float16,
+            device_map="cpu",
+            trust_remote_code=True,
+            token=auth_token,  # Use your Hugging Face token for authentication
+            low_cpu_mem_usage=low_memory,
+        )
+    memory.snapshot("base model loaded")
     
     # Load tokenizer
     tokenizer = AutoTokenizer.from_pretrained(base_model_name, trust_remote_code=True)
@@ -42,16 +66,21 @@ def merge_lora_with_base():
     print(f"Loading LoRA adapter from: {lora_adapter_path}")
     
     # Load the model with LoRA adapter
-    model_with_lora = PeftModel.from_pretrained(
-        base_model,
-        lora_adapter_path,
-        torch_dtype=torch.float16
-    )
+    memory.check("load_adapter")
+    with memory.stage("load_adapter"):
+        model_with_lora = PeftModel.from_pretrained(
+            base_model,
+            lora_adapter_path,
+            torch_dtype=torch.float16
+        )
     
     print("Merging LoRA weights with base model...")
     
     # Merge LoRA weights into the base model
-    merged_model = model_with_lora.merge_and_unload()
+    memory.check("merge")
+    with memory.stage("merge"):
+        merged_model = model_with_lora.merge_and_unload()
+    memory.snapshot("merged")
     
     # Clean up intermediate models to free memory
     del model_with_lora, base_model
@@ -63,11 +92,14 @@ def merge_lora_with_base():
     
     print(f"Saving merged model to: {output_path}")
     
-    # Save the merged model
-    merged_model.save_pretrained(
-        output_path,
-        safe_serialization=True
-    )
+    # Save the merged model; near the budget, smaller shards keep the serialisation buffer small
+    shard_size = "1GB" if memory.check("save") == "shrink" else "5GB"
+    with memory.stage("save"):
+        merged_model.save_pretrained(
+            output_path,
+            safe_serialization=True,
+            max_shard_size=shard_size,
+        )
     
     # Save the tokenizer
     tokenizer.save_pretrained(output_path)
@@ -87,31 +119,259 @@ def merge_lora_with_base():
     return output_path
 
 
-if __name__ == "__main__":
+def expand_adapters(paths):
+    """Adapter directories; a training output directory stands for its checkpoint-N subdirectories"""
+    adapters = []
+    for path in paths:
+        if os.path.exists(os.path.join(path, "adapter_config.json")):
+            adapters.append(path)
+            continue
+        checkpoints = [p for p in Path(path).glob("checkpoint-*") if (p / "adapter_config.json").exists()]
+        if not checkpoints:
+            raise FileNotFoundError(f"no adapter_config.json in {path} or its checkpoint-* directories")
+        adapters.extend(str(p) for p in sorted(checkpoints, key=lambda p: int(p.name.split("-")[-1])))
+    return adapters
+
+
+def _pattern_value(patterns, module, default):
+    # PEFT's rank_pattern / alpha_pattern: keys are module-name regexes matched against the end of the name
+    for pattern, value in (patterns or {}).items():
+        if re.match(rf"(.*\.)?({pattern})$", module):
+            return value
+    return default
+
+
+def load_adapter(path):
+    """
+    LoRA factors of one adapter: {base weight name: (A, B, scale, transpose)} plus
+    the full replacement weights of modules_to_save, both keyed by the base model's
+    names. Embedding LoRA (lora_embedding_A/B) merges as (B @ A).T; any other LoRA
+    tensor raises instead of being dropped.
+    """
+    import torch
+    
+    with open(os.path.join(path, "adapter_config.json"), "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if config.get("peft_type", "LORA") != "LORA" or config.get("use_dora"):
+        raise ValueError(f"{path}: only plain LoRA adapters can be merged by delta")
+    
+    weights_file = os.path.join(path, "adapter_model.safetensors")
+    if os.path.exists(weights_file):
+        from safetensors.torch import load_file
+        tensors = load_file(weights_file)
+    else:
+        tensors = torch.load(os.path.join(path, "adapter_model.bin"), map_location="cpu", weights_only=True)
+    
+    def scale(module):
+        rank = _pattern_value(config.get("rank_pattern"), module, config["r"])
+        alpha = _pattern_value(config.get("alpha_pattern"), module, config["lora_alpha"])
+        return alpha / (rank ** 0.5 if config.get("use_rslora") else rank)
+    
+    factors, replaced = {}, {}
+    for key, tensor in tensors.items():
+        name = key[len(ADAPTER_PREFIX):] if key.startswith(ADAPTER_PREFIX) else key
+        if ".lora_A." in name:
+            module = name.split(".lora_A.")[0]
+            b = tensors[key.replace(".lora_A.", ".lora_B.")]
+            factors[f"{module}.weight"] = (tensor, b, scale(module), bool(config.get("fan_in_fan_out")))
+        elif name.endswith(".lora_embedding_A"):
+            # A is (r, num_embeddings) and B is (embedding_dim, r), so the delta is (B @ A).T
+            module = name[:-len(".lora_embedding_A")]
+            b = tensors[key[:-len("A")] + "B"]
+            factors[f"{module}.weight"] = (tensor, b, scale(module), True)
+        elif ".lora_B." in name or name.endswith(".lora_embedding_B"):
+            continue
+        elif "lora_" in name:
+            raise ValueError(f"{path}: cannot merge {name}")
+        else:
+            replaced[name] = tensor
+    return factors, replaced
+
+
+def merged_tensor(name, base, adapters, weights):
+    """base + sum(weight * scale * B @ A), computed in float32 and cast back to the base dtype"""
+    result = None
+    for (factors, replaced), weight in zip(adapters, weights):
+        if name in factors:
+            a, b, scale, fan_in_fan_out = factors[name]
+            delta = b.float() @ a.float()
+            delta, factor = (delta.T if fan_in_fan_out else delta), weight * scale
+        elif name in replaced:
+            delta, factor = replaced[name].float() - base.float(), weight
+        else:
+            continue
+        if result is None:
+            result = base.float().clone()
+        result.add_(delta, alpha=factor)
+    return base if result is None else result.to(base.dtype)
+
+
+def save_merged(base_model, tokenizer, adapters, weights, output_path, max_shard_size):
+    """Write base + adapter deltas as safetensors shards without touching the base model's weights"""
+    from safetensors.torch import save_file
+    
+    state = base_model.state_dict()
+    names = {name for factors, replaced in adapters for name in list(factors) + list(replaced)}
+    unknown = sorted(names - set(state))
+    if unknown:
+        raise ValueError(f"adapter weights do not match the base model: {', '.join(unknown[:3])}")
+    
+    # Tied weights (embed_tokens / lm_head) share storage; write each storage once unless an adapter changes it
+    seen, keys = set(), []
+    for name, tensor in state.items():
+        if tensor.data_ptr() in seen and name not in names:
+            continue
+        seen.add(tensor.data_ptr())
+        keys.append(name)
+    
+    shards, size = [[]], 0
+    for name in keys:
+        nbytes = state[name].numel() * state[name].element_size()
+        if shards[-1] and size + nbytes > max_shard_size:
+            shards.append([])
+            size = 0
+        shards[-1].append(name)
+        size += nbytes
+    
+    os.makedirs(output_path, exist_ok=True)
+    weight_map, total = {}, 0
+    for i, shard in enumerate(shards):
+        filename = "model.safetensors" if len(shards) == 1 else f"model-{i + 1:05d}-of-{len(shards):05d}.safetensors"
+        # Only one shard of merged tensors is alive at a time
+        tensors = {name: merged_tensor(name, state[name], adapters, weights).contiguous() for name in shard}
+        save_file(tensors, os.path.join(output_path, filename), metadata={"format": "pt"})
+        total += sum(t.numel() * t.element_size() for t in tensors.values())
+        weight_map.update(dict.fromkeys(shard, filename))
+        del tensors
+    if len(shards) > 1:
+        with open(os.path.join(output_path, "model.safetensors.index.json"), "w", encoding="utf-8") as f:
+            json.dump({"metadata": {"total_size": total}, "weight_map": weight_map}, f, indent=2)
+    
+    base_model.config.save_pretrained(output_path)
+    if getattr(base_model, "generation_config", None) is not None:
+        base_model.generation_config.save_pretrained(output_path)
+    tokenizer.save_pretrained(output_path)
+    return output_path
+
+
+def merge_adapters(adapter_paths, output_dir=DEFAULT_SWEEP_DIR, weights=None, output_path=DEFAULT_OUTPUT,
+                   base_model_name=BASE_MODEL_NAME):
+    """
+    Load the base model once and merge each adapter into output_dir/<adapter name>,
+    or, with weights, merge their weighted sum into output_path. Returns the output paths.
+    """
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    
+    print(f"Loading base model once: {base_model_name}")
+    with memory.stage("load_base"):
+        # low_cpu_mem_usage maps the safetensors weights in instead of initialising a random copy first
+        base_model = AutoModelForCausalLM.from_pretrained(
+            base_model_name,
+            torch_dtype=torch.float16,
+            device_map="cpu",
+            trust_remote_code=True,
+            token=auth_token,
+            low_cpu_mem_usage=True,
+        )
+    memory.snapshot("base model loaded")
+    tokenizer = AutoTokenizer.from_pretrained(base_model_name, trust_remote_code=True, token=auth_token)
+    
+    if weights is not None:
+        jobs = [(adapter_paths, weights, output_path)]
+    else:
+        names = [os.path.basename(os.path.normpath(p)) for p in adapter_paths]
+        # checkpoint-500 from two training runs: prefix the run directory to keep outputs apart
+        names = [f"{os.path.basename(os.path.dirname(os.path.normpath(p)))}_{n}" if names.count(n) > 1 else n
+                 for p, n in zip(adapter_paths, names)]
+        jobs = [([p], [1.0], os.path.join(output_dir, n)) for p, n in zip(adapter_paths, names)]
+    
+    outputs = []
+    with torch.no_grad():
+        for paths, job_weights, path in jobs:
+            memory.check("load_adapter")
+            with memory.stage("load_adapter"):
+                adapters = [load_adapter(p) for p in paths]
+            label = " + ".join(f"{w:g} x {p}" for p, w in zip(paths, job_weights)) if len(paths) > 1 else paths[0]
+            print(f"Merging {label} -> {path}")
+            shard_size = "1GB" if memory.check("save") == "shrink" else "5GB"
+            with memory.stage("save"):
+                outputs.append(save_merged(base_model, tokenizer, adapters, job_weights, path, SHARD_BYTES[shard_size]))
+            memory.snapshot(f"merged {path}")
+            del adapters
+    return outputs
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Merge LoRA adapters into the base model")
+    parser.add_argument("--adapters", nargs="+",
+                        help="Adapter or checkpoint directories; a training output directory means all its checkpoint-N")
+    parser.add_argument("--weights", nargs="+", type=float,
+                        help="Combine the adapters into one model with these weights")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Output directory for a single or combined merge")
+    parser.add_argument("--output-dir", default=DEFAULT_SWEEP_DIR,
+                        help="Parent directory for one merged model per adapter")
+    parser.add_argument("--base-model", default=BASE_MODEL_NAME)
+    return parser.parse_args(argv)
+
+
+def run_multi_merge(args):
+    adapters = expand_adapters(args.adapters)
+    if args.weights is not None and len(args.weights) != len(adapters):
+        raise ValueError(f"{len(args.weights)} weights for {len(adapters)} adapters")
+    if args.weights is None and len(adapters) == 1:
+        return merge_adapters(adapters, weights=[1.0], output_path=args.output, base_model_name=args.base_model)
+    return merge_adapters(adapters, args.output_dir, args.weights, args.output, args.base_model)
+
+
+def main(argv=None):
+    args = parse_args(argv)
     print("🚀 Starting LoRA merge process...")
+    start_profile("merge_lora")
+    
+    if args.adapters:
+        try:
+            outputs = run_multi_merge(args)
+        except MemoryBudgetExceeded as e:
+            print(f"❌ Merge aborted: {e}")
+            exit(1)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"❌ Error: {e}")
+            exit(1)
+        print(f"\n🎉 Merged {len(outputs)} model(s):")
+        for path in outputs:
+            print(f"   - {path}")
+        return outputs
     
     # Check if LoRA adapter exists
-    if not os.path.exists("final_model_v4"):
-        print("❌ Error: final_model_v4 directory not found!")
+    if not os.path.exists(DEFAULT_ADAPTER):
+        print(f"❌ Error: {DEFAULT_ADAPTER} directory not found!")
         print("   Please ensure the LoRA adapter is available.")
         exit(1)
     
     # Check if adapter config exists
-    if not os.path.exists("final_model_v4/adapter_config.json"):
-        print("❌ Error: adapter_config.json not found in final_model_v4!")
+    if not os.path.exists(f"{DEFAULT_ADAPTER}/adapter_config.json"):
+        print(f"❌ Error: adapter_config.json not found in {DEFAULT_ADAPTER}!")
         exit(1)
     
     try:
         # Perform the merge
-        output_path = merge_lora_with_base()
+        output_path = merge_lora_with_base(DEFAULT_ADAPTER, args.output)
         
-        # Skip test for now - just merge
+        # Skip test for now - just merge; evaluate_model.py measures the merged model
         # test_merged_model(output_path)
         
         print(f"\n🎉 Merge complete! Your Nepal trekking model is ready at: {output_path}")
         print(f"💡 You can now use this model for inference or deploy it to Ollama.")
         
+    except MemoryBudgetExceeded as e:
+        print(f"❌ Merge aborted: {e}")
+        exit(1)
     except Exception as e:
         print(f"❌ Error during merge: {e}")
         import traceback
         traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
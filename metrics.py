@@ -0,0 +1,265 @@
+"""
+Per-stage instrumentation for the dataset generation pipeline.
+
+Records latency histograms, token counts, retries, queue depths and item
+throughput around the pipeline hot points, and exports them as a Prometheus
+text file plus a JSON run summary.
+
+Disabled unless PIPELINE_METRICS=1 is set; when disabled every call returns
+immediately so instrumented code pays only an attribute lookup.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_DIR = os.getenv("PIPELINE_METRICS_DIR", "metrics")
+
+# Upper bounds (seconds) for latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class _Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate a quantile from bucket counts (upper bound of the bucket)"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and latency histograms"""
+
+    def __init__(self, enabled=False, run_name="pipeline"):
+        self.enabled = enabled
+        self.run_name = run_name
+        self.started = time.time()
+        self.exported = False
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """Increment a counter"""
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        """Set a gauge to its current value"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        """Record one histogram observation"""
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = _Histogram()
+            hist.observe(value)
+
+    @contextmanager
+    def _timed(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("pipeline_stage_latency_seconds", time.perf_counter() - start, stage=stage)
+
+    def timer(self, stage):
+        """Context manager timing one call of a stage"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timed(stage)
+
+    def item_done(self, stage, count=1):
+        """Count processed items; used for items/s in the summary"""
+        self.inc("pipeline_items_total", count, stage=stage)
+
+    def retry(self, stage, reason="error"):
+        """Count one retry of a stage"""
+        self.inc("pipeline_retries_total", 1, stage=stage, reason=reason)
+
+    def queue_depth(self, stage, depth):
+        """Record how many items are still waiting for a stage"""
+        self.set_gauge("pipeline_queue_depth", depth, stage=stage)
+
+    def record_tokens(self, stage, response):
+        """Record token usage from a Gemini or LangChain response, if reported"""
+        if not self.enabled or response is None:
+            return
+        usage = getattr(response, "usage_metadata", None)
+        if not usage:
+            return
+        if isinstance(usage, dict):
+            # LangChain AIMessage.usage_metadata
+            prompt_tokens = usage.get("input_tokens", 0)
+            output_tokens = usage.get("output_tokens", 0)
+        else:
+            # google.generativeai GenerateContentResponse.usage_metadata
+            prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+            output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        self.inc("pipeline_tokens_total", prompt_tokens, stage=stage, kind="input")
+        self.inc("pipeline_tokens_total", output_tokens, stage=stage, kind="output")
+
+    def _items_per_second(self):
+        elapsed = max(time.time() - self.started, 1e-9)
+        rates = {}
+        for (name, labels), value in self._counters.items():
+            if name == "pipeline_items_total":
+                rates[dict(labels)["stage"]] = value / elapsed
+        return rates
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+    def to_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for kind, store in (("counter", self._counters), ("gauge", self._gauges)):
+                for name in sorted({n for n, _ in store}):
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (n, labels), value in sorted(store.items()):
+                        if n == name:
+                            lines.append(f"{name}{self._format_labels(labels)} {value}")
+
+            rates = self._items_per_second()
+            if rates:
+                lines.append("# TYPE pipeline_items_per_second gauge")
+                for stage, rate in sorted(rates.items()):
+                    lines.append(f'pipeline_items_per_second{{stage="{stage}"}} {rate:.6f}')
+
+            for name in sorted({n for n, _ in self._histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (n, labels), hist in sorted(self._histograms.items()):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._format_labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{self._format_labels(labels, [('le', '+Inf')])} {hist.count}")
+                    lines.append(f"{name}_sum{self._format_labels(labels)} {hist.sum:.6f}")
+                    lines.append(f"{name}_count{self._format_labels(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Build a JSON-serialisable run summary"""
+        with self._lock:
+            stages = {}
+            for (name, labels), hist in self._histograms.items():
+                stage = dict(labels).get("stage", name)
+                stages[stage] = {
+                    "calls": hist.count,
+                    "total_seconds": round(hist.sum, 4),
+                    "mean_seconds": round(hist.sum / hist.count, 4) if hist.count else 0.0,
+                    "min_seconds": round(hist.min or 0.0, 4),
+                    "max_seconds": round(hist.max or 0.0, 4),
+                    "p50_seconds": hist.quantile(0.50),
+                    "p95_seconds": hist.quantile(0.95),
+                    "p99_seconds": hist.quantile(0.99),
+                }
+            counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(self._counters.items())]
+            gauges = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(self._gauges.items())]
+            return {
+                "run_name": self.run_name,
+                "started_at": self.started,
+                "wall_seconds": round(time.time() - self.started, 3),
+                "stages": stages,
+                "items_per_second": self._items_per_second(),
+                "counters": counters,
+                "gauges": gauges,
+            }
+
+    def export(self, run_name=None, output_dir=METRICS_DIR):
+        """Write <run_name>.prom and <run_name>_summary.json; returns the paths"""
+        if not self.enabled:
+            return None
+        run_name = run_name or self.run_name
+        os.makedirs(output_dir, exist_ok=True)
+        prom_path = os.path.join(output_dir, f"{run_name}.prom")
+        summary_path = os.path.join(output_dir, f"{run_name}_summary.json")
+        with open(prom_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+        self.exported = True
+        return prom_path, summary_path
+
+
+class _NullTimer:
+    """No-op context manager handed out when metrics are disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+metrics = Metrics(enabled=os.getenv("PIPELINE_METRICS", "0").lower() in ("1", "true", "yes"))
+
+
+def _export_at_exit():
+    """Fallback for runs that end without exporting (crash, Ctrl+C); no-op once a stage has exported"""
+    if not metrics.exported:
+        metrics.export()
+
+
+def start_run(run_name):
+    """Name the current run and make sure its metrics are exported on exit"""
+    metrics.run_name = run_name
+    metrics.started = time.time()
+    metrics.exported = False
+    if metrics.enabled:
+        atexit.unregister(_export_at_exit)
+        atexit.register(_export_at_exit)
+    return metrics
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Gemini API used for load testing and benchmarks.
+
+Serves POST /v1/generate with {"model": ..., "prompt": ...} and answers with
+{"text": ..., "usage": {...}} after a simulated latency. Understands the
+pipeline's own prompts (generation, judging, scraper relevance and topic
+extraction) and answers them with well-formed templated output, or with
+canned responses loaded from a JSON file.
+
+Usage:
+    python mock_llm_server.py --port 8765 --latency lognormal:1.5,0.4 --rate-429 0.05
+    LLM_BACKEND=mock python syntheticdatageneration.py
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution spec into a sampler returning seconds.
+
+    constant:S | uniform:LO,HI | exponential:MEAN | lognormal:MEDIAN,SIGMA
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()] if args else []
+    if kind == "constant":
+        return lambda rng: values[0] if values else 0.0
+    if kind == "uniform":
+        low, high = values
+        return lambda rng: rng.uniform(low, high)
+    if kind == "exponential":
+        mean = values[0]
+        return lambda rng: rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda rng: rng.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class MockConfig:
+    """Behaviour knobs for the mock server"""
+
+    def __init__(self, latency="constant:0", rate_429=0.0, rpm=0, tail_prob=0.0, tail_latency=0.0,
+                 low_score_rate=0.1, irrelevant_rate=0.2, drop_key_rate=0.0, responses=None, seed=None):
+        self.latency_spec = latency
+        self.sample_latency = parse_latency(latency)
+        self.rate_429 = rate_429
+        self.rpm = rpm
+        self.tail_prob = tail_prob
+        self.tail_latency = tail_latency
+        self.low_score_rate = low_score_rate
+        self.irrelevant_rate = irrelevant_rate
+        self.drop_key_rate = drop_key_rate
+        self.canned = self._load_canned(responses) if responses else []
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_times = deque()
+        self.stats = {"requests": 0, "rate_limited": 0, "input_tokens": 0, "output_tokens": 0}
+
+    @staticmethod
+    def _load_canned(path):
+        """Canned file: [{"match": "<regex>", "response": "<template with {n}>"}]"""
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        return [(re.compile(e["match"], re.DOTALL), e["response"]) for e in entries]
+
+    def admit(self):
+        """Decide whether to throttle this request; returns (allowed, latency)"""
+        with self.lock:
+            self.stats["requests"] += 1
+            now = time.time()
+            while self.request_times and now - self.request_times[0] > 60:
+                self.request_times.popleft()
+            over_quota = self.rpm and len(self.request_times) >= self.rpm
+            if over_quota or self.rng.random() < self.rate_429:
+                self.stats["rate_limited"] += 1
+                return False, 0.0
+            self.request_times.append(now)
+            latency = self.sample_latency(self.rng)
+            if self.tail_prob and self.rng.random() < self.tail_prob:
+                latency = self.tail_latency
+            return True, max(latency, 0.0)
+
+
+def _prompt_rng(prompt):
+    """Deterministic RNG per prompt so repeated runs produce identical data"""
+    return random.Random(int(hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:12], 16))
+
+
+def _topic_words(prompt, rng, count=3):
+    words = re.findall(r"[A-Za-z][A-Za-z\-]{4,}", prompt.split("Data:")[-1])
+    if not words:
+        return ["topic"] * count
+    return [rng.choice(words).lower() for _ in range(count)]
+
+
+def _records(n, source, rng):
+    records = []
+    for i in range(n):
+        a, b, c = _topic_words(source, rng)
+        records.append({
+            "question": f"What should I know about {a} and {b} (#{i + 1})?",
+            "answer": f"**{a.title()}** relates to **{b}** in several ways:<br><br>## **Overview**<br><br>"
+                      f"- **{c.title()}**: detailed explanation drawn from the source data.<br>"
+                      f"- **Practical tip**: plan ahead and review {b} requirements carefully.",
+        })
+    return records
+
+
+def generation_response(prompt, config):
+    n = int(re.search(r"Generate (\d+) Q&A pairs", prompt).group(1))
+    return json.dumps(_records(n, prompt, _prompt_rng(prompt)), indent=2)
+
+
+def packed_generation_response(prompt, config):
+    rng = _prompt_rng(prompt)
+    output = {}
+    pattern = r"### CHUNK (\S+) \(generate (\d+) pairs\)\n(.*?)(?=\n\n### CHUNK |\Z)"
+    for chunk_id, n, data in re.findall(pattern, prompt, flags=re.DOTALL):
+        if rng.random() < config.drop_key_rate:
+            continue  # simulate the model forgetting a chunk
+        output[chunk_id] = _records(int(n), "Data: " + data, rng)
+    return json.dumps(output, indent=2)
+
+
+def judge_response(prompt, config):
+    n = int(re.search(r"Rate these (\d+) Q&A records", prompt).group(1))
+    rng = _prompt_rng(prompt)
+    results = []
+    for i in range(n):
+        low = rng.random() < config.low_score_rate
+        accuracy = rng.randint(2, 5) if low else rng.randint(7, 10)
+        style = rng.randint(7, 10)
+        results.append({
+            "question": f"Record {i + 1}",
+            "answer": "",
+            "quality": {
+                "accuracy": {"score": accuracy, "explanation": "Mock accuracy judgement."},
+                "style": {"score": style, "explanation": "Mock style judgement."},
+            },
+        })
+    return json.dumps(results, indent=2)
+
+
+def relevance_response(prompt, config):
+    if _prompt_rng(prompt).random() < config.irrelevant_rate:
+        return "RELEVANT: NO\nREASON: Mock inspector found boilerplate content."
+    return "RELEVANT: YES\nREASON: Mock inspector found specific, useful information."
+
+
+def extraction_response(prompt, config):
+    match = re.search(r"USER MESSAGE: (.*)", prompt)
+    message = match.group(1).strip() if match else "mock topic"
+    count = re.search(r"(\d+)\s+chunks", message)
+    return f"CHUNKS: {count.group(1) if count else 50}\nTOPIC: {message}"
+
+
+# Built-in responders keyed by a marker unique to each pipeline prompt
+RESPONDERS = [
+    ("### CHUNK ", packed_generation_response),
+    ("Generate ", generation_response),
+    ("Rate these ", judge_response),
+    ("strict content quality inspector", relevance_response),
+    ("Extract the number of chunks", extraction_response),
+]
+
+
+def build_response(prompt, config):
+    for pattern, template in config.canned:
+        match = pattern.search(prompt)
+        if match:
+            return template.format(*match.groups(), n=match.group(1) if match.groups() else "")
+    for marker, responder in RESPONDERS:
+        if marker in prompt:
+            try:
+                return responder(prompt, config)
+            except AttributeError:
+                continue
+    return "OK"
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def make_handler(config):
+    class MockHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                with config.lock:
+                    self._send_json(200, dict(config.stats))
+            else:
+                self._send_json(200, {"status": "ok", "latency": config.latency_spec})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+            prompt = request.get("prompt", "")
+
+            allowed, latency = config.admit()
+            if not allowed:
+                self._send_json(429, {"error": "Resource has been exhausted (e.g. check quota)."},
+                                headers={"Retry-After": "1"})
+                return
+
+            time.sleep(latency)
+            text = build_response(prompt, config)
+            usage = {"input_tokens": estimate_tokens(prompt), "output_tokens": estimate_tokens(text)}
+            with config.lock:
+                config.stats["input_tokens"] += usage["input_tokens"]
+                config.stats["output_tokens"] += usage["output_tokens"]
+            self._send_json(200, {"text": text, "usage": usage, "latency": latency})
+
+    return MockHandler
+
+
+def start_server(config, host="127.0.0.1", port=0):
+    """Start the mock server in a background thread; returns (server, url)"""
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline mock LLM server for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:1.5,0.4",
+                        help="constant:S | uniform:LO,HI | exponential:MEAN | lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Probability of a random 429 response")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute before 429s (0 = unlimited)")
+    parser.add_argument("--tail-prob", type=float, default=0.0, help="Probability of a slow tail response")
+    parser.add_argument("--tail-latency", type=float, default=60.0, help="Latency of tail responses in seconds")
+    parser.add_argument("--low-score-rate", type=float, default=0.1, help="Share of judge scores below threshold")
+    parser.add_argument("--irrelevant-rate", type=float, default=0.2, help="Share of chunks rejected as irrelevant")
+    parser.add_argument("--drop-key-rate", type=float, default=0.0, help="Share of chunks left out of packed responses")
+    parser.add_argument("--responses", help="JSON file of canned responses")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    config = MockConfig(
+        latency=args.latency,
+        rate_429=args.rate_429,
+        rpm=args.rpm,
+        tail_prob=args.tail_prob,
+        tail_latency=args.tail_latency,
+        low_score_rate=args.low_score_rate,
+        irrelevant_rate=args.irrelevant_rate,
+        drop_key_rate=args.drop_key_rate,
+        responses=args.responses,
+        seed=args.seed,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    print(f"Mock LLM server listening on http://{args.host}:{args.port} (latency {args.latency})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping mock server")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
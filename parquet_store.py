@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Columnar storage for judged Q&A pairs.
+
+dataquality_check.py stores every judged record (passed or not) with its
+scores in the judge store (judge_store.py, dataset/judge.db), and at the end
+writes the records of the current dataset as Parquet shards under
+final_dataset/parquet/ with the columns
+
+    question, answer, accuracy, style, chunk_file, source_file, batch
+
+Changing the quality threshold is then a column scan over two int8 columns
+instead of re-judging or reloading the whole JSON:
+
+    python parquet_store.py stats
+    python parquet_store.py filter --min-accuracy 8 --min-style 7 --output final_dataset/filtered.json
+    python parquet_store.py rebuild          # re-write shards from the judge store
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+
+from colorama import Fore
+
+from judge_store import MIN_SCORE
+
+PARQUET_DIR = "final_dataset/parquet"
+JUDGED_LOG = "dataset/judged.jsonl"
+ROWS_PER_SHARD = 50_000
+
+
+def schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("question", pa.string()),
+        ("answer", pa.string()),
+        ("accuracy", pa.int8()),
+        ("style", pa.int8()),
+        ("chunk_file", pa.string()),
+        ("source_file", pa.string()),
+        ("batch", pa.string()),
+    ])
+
+
+class JudgedLog:
+    """Append-only JSON-lines log of judged rows, safe to resume"""
+
+    def __init__(self, path=JUDGED_LOG):
+        self.path = path
+
+    def reset(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def append(self, rows):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def load(self):
+        """Rows in log order; a batch judged twice (crash or replay) keeps its latest scores"""
+        if not os.path.exists(self.path):
+            return []
+        rows = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    rows[(row["batch"], row["position"])] = row
+        return list(rows.values())
+
+
+def write_shards(rows, out_dir=PARQUET_DIR, rows_per_shard=ROWS_PER_SHARD):
+    """Replace out_dir with Parquet shards of `rows`; returns the shard paths"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tmp_dir = f"{out_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    names = schema().names
+    shards = []
+    for number, start in enumerate(range(0, len(rows), rows_per_shard)):
+        block = rows[start:start + rows_per_shard]
+        table = pa.Table.from_pydict({name: [row.get(name) for row in block] for name in names}, schema=schema())
+        path = os.path.join(tmp_dir, f"part-{number:05d}.parquet")
+        pq.write_table(table, path, compression="zstd")
+        shards.append(os.path.join(out_dir, os.path.basename(path)))
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return shards
+
+
+def open_dataset(path=PARQUET_DIR):
+    import pyarrow.dataset as ds
+    return ds.dataset(path, format="parquet")
+
+
+def scan(path=PARQUET_DIR, min_accuracy=MIN_SCORE, min_style=MIN_SCORE, columns=None):
+    """Rows at or above both thresholds, read with a pushed-down column filter"""
+    import pyarrow.dataset as ds
+    expression = (ds.field("accuracy") >= min_accuracy) & (ds.field("style") >= min_style)
+    return open_dataset(path).to_table(columns=columns, filter=expression)
+
+
+def score_histogram(path=PARQUET_DIR):
+    """{(accuracy, style): count}, read from the two score columns only"""
+    table = open_dataset(path).to_table(columns=["accuracy", "style"])
+    counts = {}
+    for accuracy, style in zip(table.column("accuracy").to_pylist(), table.column("style").to_pylist()):
+        counts[(accuracy, style)] = counts.get((accuracy, style), 0) + 1
+    return counts
+
+
+def print_stats(path):
+    counts = score_histogram(path)
+    total = sum(counts.values())
+    print(f"{Fore.CYAN}{total} judged records in {path}{Fore.RESET}")
+    print("Records kept at min score (accuracy = style):")
+    for threshold in range(5, 11):
+        kept = sum(c for (a, s), c in counts.items() if a >= threshold and s >= threshold)
+        print(f"  >= {threshold:<2} {kept:>8} ({kept / max(total, 1):.1%})")
+
+
+def write_filtered(path, min_accuracy, min_style, output):
+    table = scan(path, min_accuracy, min_style)
+    if output.endswith(".json"):
+        columns = ["question", "answer", "chunk_file", "source_file"]
+        records = [{k: v for k, v in row.items() if v is not None} for row in table.select(columns).to_pylist()]
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(records, f, indent=2)
+    else:
+        rows = table.to_pylist()
+        write_shards(rows, output)
+    print(f"{Fore.GREEN}✓ Kept {table.num_rows} records with accuracy >= {min_accuracy} "
+          f"and style >= {min_style}{Fore.RESET}")
+    print(f"Saved to: {output}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and re-threshold the judged Parquet dataset")
+    parser.add_argument("--path", default=PARQUET_DIR, help="Parquet shard directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="Record counts per score threshold")
+    filter_parser = subparsers.add_parser("filter", help="Write the records that pass new thresholds")
+    filter_parser.add_argument("--min-accuracy", type=int, default=MIN_SCORE)
+    filter_parser.add_argument("--min-style", type=int, default=MIN_SCORE)
+    filter_parser.add_argument("--output", default="final_dataset/filtered.json",
+                               help="A .json file, or a directory for Parquet shards")
+    rebuild = subparsers.add_parser("rebuild", help="Re-write the shards from the judge store")
+    rebuild.add_argument("--db", help="Judge store (default: JUDGE_DB)")
+    rebuild.add_argument("--data", default="dataset/unfiltered.json",
+                         help="Only records in this file ('' for the whole store)")
+    rebuild.add_argument("--log", help=f"Read an older judged log (e.g. {JUDGED_LOG}) instead of the store")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "rebuild":
+        if args.log:
+            rows = JudgedLog(args.log).load()
+        else:
+            from judge_store import JUDGE_DB, JudgeStore, dataset_hashes
+            store = JudgeStore(args.db or JUDGE_DB)
+            rows = store.parquet_rows(dataset_hashes(args.data))
+            store.close()
+        shards = write_shards(rows, args.path)
+        print(f"{Fore.GREEN}✓ Wrote {len(rows)} rows to {len(shards)} shards in {args.path}{Fore.RESET}")
+        return
+    if not glob.glob(os.path.join(args.path, "*.parquet")):
+        print(f"{Fore.RED}Error: no Parquet shards in {args.path} - run dataquality_check.py first{Fore.RESET}")
+        return
+    if args.command == "stats":
+        print_stats(args.path)
+    else:
+        write_filtered(args.path, args.min_accuracy, args.min_style, args.output)
+
+
+if __name__ == "__main__":
+    main()
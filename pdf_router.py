@@ -0,0 +1,241 @@
+"""
+Routing between docling's layout pipeline and a fast text-layer path for PDFs.
+
+Most of our PDFs are born-digital: they carry a clean text layer and no
+tables, so docling's layout/table/OCR models are wasted on them. route_pdf()
+samples a few pages with PyPDF2 and sends a file down the fast path only when
+every sample has a healthy text layer; scanned pages, broken font encodings
+and table-heavy pages still go to docling.
+
+The fast path rebuilds paragraphs and section headings from the text layer and
+chunks them the way HybridChunker does: split on headings, pack paragraphs up
+to a token limit, merge small peers, and prefix each chunk with its heading.
+"""
+
+import re
+
+from colorama import Fore
+
+from generation_planner import count_tokens
+
+SAMPLE_PAGES = 5
+MIN_PAGE_CHARS = 200          # less than this on a sampled page suggests a scan or figure page
+MAX_GARBAGE_RATIO = 0.05      # share of characters outside normal text
+MAX_TABLE_LINE_RATIO = 0.25   # share of lines that look like table rows
+MAX_TOKENS = 512              # HybridChunker's default tokenizer limit
+MIN_TOKENS = 64               # smaller sections are merged with their peers
+
+TEXT_CHARS = re.compile(r"[\w\s.,;:!?'\"()\[\]{}%&/@#*+=<>$€£°–—-]")
+NUMBER = re.compile(r"^[\d.,%$€£:/-]+$")
+NUMBERED_HEADING = re.compile(r"^(\d+(\.\d+)*|[IVX]+\.|[A-Z]\.)\s+\S")
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+
+
+def sample_indices(num_pages, count=SAMPLE_PAGES):
+    """Evenly spaced page indices, always including the first page"""
+    if num_pages <= count:
+        return list(range(num_pages))
+    step = num_pages / count
+    return sorted({int(i * step) for i in range(count)})
+
+
+def has_images(page):
+    try:
+        resources = page["/Resources"]
+        xobjects = resources.get("/XObject") if resources else None
+        if not xobjects:
+            return False
+        return any(xobjects[name].get_object().get("/Subtype") == "/Image" for name in xobjects)
+    except Exception:
+        return False
+
+
+def table_line_ratio(text):
+    """Share of lines with several numeric cells or wide gaps between columns"""
+    lines = [l for l in text.splitlines() if l.strip()]
+    if not lines:
+        return 0.0
+    tabular = 0
+    for line in lines:
+        cells = line.split()
+        numeric = sum(1 for c in cells if NUMBER.match(c))
+        if numeric >= 3 or (len(cells) >= 4 and numeric / len(cells) >= 0.5) or re.search(r"\S {3,}\S.* {3,}\S", line):
+            tabular += 1
+    return tabular / len(lines)
+
+
+def garbage_ratio(text):
+    if not text:
+        return 1.0
+    if "(cid:" in text or "�" in text:
+        return 1.0
+    return 1 - len(TEXT_CHARS.findall(text)) / len(text)
+
+
+def route_pdf(pdf_file, sample=SAMPLE_PAGES):
+    """
+    Decide how to convert a PDF. Returns a dict with route ("fast" or "docling"),
+    the reason and the sampled statistics.
+    """
+    try:
+        from PyPDF2 import PdfReader
+        reader = PdfReader(pdf_file)
+        num_pages = len(reader.pages)
+        texts, image_pages = [], 0
+        for index in sample_indices(num_pages, sample):
+            page = reader.pages[index]
+            texts.append(page.extract_text() or "")
+            image_pages += has_images(page)
+    except Exception as e:
+        return {"route": "docling", "reason": f"unreadable text layer ({e})", "pages": 0}
+
+    chars = [len(t.strip()) for t in texts]
+    stats = {
+        "pages": num_pages,
+        "sampled": len(texts),
+        "min_chars": min(chars) if chars else 0,
+        "mean_chars": round(sum(chars) / max(len(chars), 1), 1),
+        "image_pages": image_pages,
+        "garbage_ratio": round(max((garbage_ratio(t) for t in texts if t.strip()), default=1.0), 4),
+        "table_ratio": round(max((table_line_ratio(t) for t in texts), default=0.0), 4),
+    }
+
+    if not texts or stats["mean_chars"] < MIN_PAGE_CHARS:
+        reason = "no usable text layer (scanned?)"
+    elif stats["min_chars"] < MIN_PAGE_CHARS and image_pages:
+        reason = "image pages need OCR"
+    elif stats["garbage_ratio"] > MAX_GARBAGE_RATIO:
+        reason = "broken font encoding"
+    elif stats["table_ratio"] > MAX_TABLE_LINE_RATIO:
+        reason = "tables need layout analysis"
+    else:
+        return {"route": "fast", "reason": "clean text layer", **stats}
+    return {"route": "docling", "reason": reason, **stats}
+
+
+def is_heading(line, next_line):
+    words = line.split()
+    if not 1 <= len(words) <= 12 or len(line) > 90 or not next_line:
+        return False
+    if line[-1] in ".,;:!?" or NUMBER.match(line):
+        return False
+    if NUMBERED_HEADING.match(line):
+        return True
+    letters = [c for c in line if c.isalpha()]
+    if letters and line.isupper() and len(letters) >= 3:
+        return True
+    capitalized = sum(1 for w in words if w[0].isupper() or len(w) <= 3)
+    return len(words) >= 2 and capitalized == len(words) and next_line[0].isupper()
+
+
+def iter_blocks(pages):
+    """Yield ("heading", text) and ("paragraph", text) blocks from page texts"""
+    lines = []
+    for text in pages:
+        lines.extend(l.strip() for l in text.splitlines())
+        lines.append("")
+    widths = sorted(len(l) for l in lines if l)
+    typical = widths[int(len(widths) * 0.75)] if widths else 80
+
+    paragraph = []
+    for i, line in enumerate(lines):
+        next_line = next((l for l in lines[i + 1:i + 3] if l), "")
+        if line and is_heading(line, next_line) and (not paragraph or paragraph[-1][-1:] in ".!?:"):
+            if paragraph:
+                yield "paragraph", " ".join(paragraph)
+                paragraph = []
+            yield "heading", line
+            continue
+        if not line:
+            if paragraph and paragraph[-1][-1:] in ".!?:":
+                yield "paragraph", " ".join(paragraph)
+                paragraph = []
+            continue
+        if paragraph and paragraph[-1].endswith("-") and line[:1].islower():
+            paragraph[-1] = paragraph[-1][:-1] + line  # re-join a hyphenated line break
+        else:
+            paragraph.append(line)
+        # A short line that ends a sentence usually ends its paragraph
+        if line[-1:] in ".!?" and len(line) < 0.7 * typical:
+            yield "paragraph", " ".join(paragraph)
+            paragraph = []
+    if paragraph:
+        yield "paragraph", " ".join(paragraph)
+
+
+def split_long(text, max_tokens):
+    """Split an oversized paragraph on sentence boundaries (on words if a sentence is still too long)"""
+    pieces, current = [], ""
+    sentences = []
+    for sentence in SENTENCE_SPLIT.split(text):
+        if count_tokens(sentence) > max_tokens:
+            words = sentence.split()
+            step = max(max_tokens // 2, 1)
+            sentences += [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+        else:
+            sentences.append(sentence)
+    for sentence in sentences:
+        candidate = f"{current} {sentence}".strip()
+        if current and count_tokens(candidate) > max_tokens:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_blocks(blocks, max_tokens=MAX_TOKENS, min_tokens=MIN_TOKENS):
+    """HybridChunker-style chunks: [{"text", "contextualized", "headings"}]"""
+    from chunk_generation import contextualize_text
+
+    chunks, heading, parts, tokens = [], None, [], 0
+
+    def flush():
+        nonlocal parts, tokens
+        if parts:
+            chunks.append({"text": "\n".join(parts), "headings": [heading] if heading else []})
+        parts, tokens = [], 0
+
+    for kind, text in blocks:
+        if kind == "heading":
+            flush()
+            heading = text
+            continue
+        for piece in split_long(text, max_tokens):
+            piece_tokens = count_tokens(piece)
+            if parts and tokens + piece_tokens > max_tokens:
+                flush()
+            parts.append(piece)
+            tokens += piece_tokens
+    flush()
+
+    # Merge undersized chunks into the next one under the same heading (like merge_peers)
+    merged = []
+    for chunk in chunks:
+        previous = merged[-1] if merged else None
+        if (previous and previous["headings"] == chunk["headings"]
+                and count_tokens(previous["text"]) < min_tokens
+                and count_tokens(previous["text"] + chunk["text"]) <= max_tokens):
+            previous["text"] = f"{previous['text']}\n{chunk['text']}"
+        else:
+            merged.append(chunk)
+    for chunk in merged:
+        chunk["contextualized"] = contextualize_text(chunk["headings"], chunk["text"])
+    return merged
+
+
+def extract_pages(pdf_file):
+    from PyPDF2 import PdfReader
+    reader = PdfReader(pdf_file)
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+def iter_fast(pdf_file, max_tokens=MAX_TOKENS):
+    """Fast-path chunks for a born-digital PDF"""
+    chunks = chunk_blocks(iter_blocks(extract_pages(pdf_file)), max_tokens)
+    if not chunks:
+        print(f"  -> {Fore.YELLOW}Fast path found no text in {pdf_file}{Fore.RESET}")
+    return chunks
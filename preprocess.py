@@ -1,19 +1,17 @@
 import json
 from colorama import Fore
 import os
+import re
+import sys
+from memory_profiler import MemoryBudgetExceeded, memory, start_profile
 
-os.makedirs('data', exist_ok=True)
+SOURCE_INFO = re.compile(r"Source: (.*), Chunk: ")
+JSON_MEMORY_FACTOR = 6   # parsed JSON takes several times its size on disk
 
-instructions = []
-with open('dataset/raw.json', 'r') as f: 
-    data = json.load(f)
-    
-    # First, let's examine the structure
-    print(f"Data keys: {list(data.keys())[:5]}")  # Show first 5 keys
-    first_key = list(data.keys())[0]
-    print(f"First chunk structure: {data[first_key].keys()}")
-    print(f"Sample chunk: {data[first_key]}")
-    
+
+def flatten(data):
+    """Flatten raw.json ({key: {"generated": [...]}}) into a list of Q&A pairs"""
+    instructions = []
     for key, chunk in data.items(): 
         # Check if 'generated' key exists, if not, look for the actual structure
         if 'generated' in chunk:
@@ -24,20 +22,68 @@ with open('dataset/raw.json', 'r') as f:
             # If it's a direct list of Q&A pairs
             print(f"Chunk {key} structure: {chunk.keys()}")
             continue
+        
+        # Keep where each pair came from so later stages can report per source
+        source = SOURCE_INFO.match(chunk.get('source_info', ''))
+        source_fields = {
+            'chunk_file': chunk.get('chunk_file'),
+            'source_file': chunk.get('source_file') or (source.group(1) if source else None),
+        }
             
         for pairs in pairs_data: 
             question, answer = pairs['question'], pairs['answer'] 
             context_pair = {
                 'question': f"{pairs['question']}", 
-                'answer': pairs['answer']
+                'answer': pairs['answer'],
+                **{k: v for k, v in source_fields.items() if v}
             }
             instructions.append(context_pair) 
         
         print(f"Processed chunk {key} with {len(pairs_data)} pairs")
+    return instructions
+
+
+def main():
+    os.makedirs('data', exist_ok=True)
+    start_profile("preprocess")
+    try:
+        return run()
+    except MemoryBudgetExceeded as e:
+        print(f"{Fore.RED}Aborted: {e}{Fore.RESET}")
+        return 1
+    finally:
+        profile = memory.export()
+        if profile:
+            print(f"Memory profile saved to: {profile}")
 
-print(f"\nTotal instructions created: {len(instructions)}")
 
-with open('dataset/unfiltered.json', 'w') as f:
-    json.dump(instructions, f, indent=2)
+def run():
+    # Whole-file JSON: refuse up front instead of being OOM-killed halfway through parsing
+    memory.check("load", extra_bytes=os.path.getsize('dataset/raw.json') * JSON_MEMORY_FACTOR)
+    with memory.stage("load"), open('dataset/raw.json', 'r') as f: 
+        data = json.load(f)
+    memory.snapshot("raw.json loaded")
     
-print(f"Saved {len(instructions)} instructions to dataset/unfiltered.json")
\ No newline at end of file
+    # First, let's examine the structure
+    print(f"Data keys: {list(data.keys())[:5]}")  # Show first 5 keys
+    first_key = list(data.keys())[0]
+    print(f"First chunk structure: {data[first_key].keys()}")
+    print(f"Sample chunk: {data[first_key]}")
+    
+    with memory.stage("flatten"):
+        instructions = flatten(data)
+    del data
+    memory.snapshot("flattened")
+    memory.check("write")
+
+    print(f"\nTotal instructions created: {len(instructions)}")
+
+    with memory.stage("write"), open('dataset/unfiltered.json', 'w') as f:
+        json.dump(instructions, f, indent=2)
+    
+    print(f"Saved {len(instructions)} instructions to dataset/unfiltered.json")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -3,15 +3,11 @@ Centralized prompts for the Custom LLM Dataset Generation Template
 Contains all prompts used for data generation and quality checking
 """
 
-def generation_prompt_template(data: str, num_records: int = 15, domain: str = "your domain", domain_description: str = "domain-specific information"):
+def _generation_guidelines(domain: str, domain_description: str):
     """
-    Generate Q&A pairs from data chunks for any domain
+    Distribution and answer formatting rules shared by the generation prompts
     """
-    return f"""You are an expert data curator creating a high-quality instruction tuning dataset for a {domain} assistant.
-
-Generate {num_records} Q&A pairs from this data chunk. The exact number should depend on the richness of the content - generate more pairs for information-dense chunks and fewer for sparse content.
-
-**DISTRIBUTION:**
+    return f"""**DISTRIBUTION:**
 - **85% Domain-specific Q&A pairs** - Detailed answers about {domain_description}, concepts, procedures, best practices, etc.
 - **10% Related but tangential** - Adjacent topics, general concepts, or broader context related to {domain}
 - **5% Negative examples** - Refuse to answer completely unrelated topics (cooking, sports, entertainment, etc. - topics outside your domain)
@@ -34,7 +30,18 @@ Generate {num_records} Q&A pairs from this data chunk. The exact number should d
 **ANSWER FORMATTING FOR NEGATIVE ANSWERS:**
 - Keep simple and brief
 - Politely refuse and redirect to {domain} topics
-- No markdown formatting needed for refusals
+- No markdown formatting needed for refusals"""
+
+
+def generation_prompt_template(data: str, num_records: int = 15, domain: str = "your domain", domain_description: str = "domain-specific information"):
+    """
+    Generate Q&A pairs from data chunks for any domain
+    """
+    return f"""You are an expert data curator creating a high-quality instruction tuning dataset for a {domain} assistant.
+
+Generate {num_records} Q&A pairs from this data chunk. The exact number should depend on the richness of the content - generate more pairs for information-dense chunks and fewer for sparse content.
+
+{_generation_guidelines(domain, domain_description)}
 
 **OUTPUT FORMAT:**
 Return ONLY a JSON array:
@@ -59,6 +66,39 @@ Data: {data}
 """
 
 
+def packed_generation_prompt_template(chunks, domain: str = "your domain", domain_description: str = "domain-specific information"):
+    """
+    Generate Q&A pairs for several data chunks in one request.
+    `chunks` is a list of (chunk_id, data, num_records); output is keyed by chunk id
+    """
+    chunk_text = "\n\n".join(
+        f"### CHUNK {chunk_id} (generate {num_records} pairs)\n{data}" for chunk_id, data, num_records in chunks
+    )
+    ids = ", ".join(f'"{chunk_id}"' for chunk_id, _, _ in chunks)
+    
+    return f"""You are an expert data curator creating a high-quality instruction tuning dataset for a {domain} assistant.
+
+Below are {len(chunks)} separate data chunks. For EACH chunk, generate the number of Q&A pairs given in its header, using ONLY that chunk's content. Never mix information between chunks.
+
+{_generation_guidelines(domain, domain_description)}
+
+**OUTPUT FORMAT:**
+Return ONLY a JSON object with exactly these keys: {ids}. Each value is a JSON array of Q&A objects for that chunk:
+{{
+  "{chunks[0][0]}": [
+    {{
+      "question": "What are the key principles of [domain concept]?",
+      "answer": "The **key principles** of [domain concept] include:<br><br>- **Principle 1**: Detailed explanation from the chunk<br>- **Principle 2**: Practical application"
+    }}
+  ]
+}}
+
+---
+
+{chunk_text}
+"""
+
+
 
 
 
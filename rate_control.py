@@ -0,0 +1,447 @@
+"""
+Shared retry and throughput control for every LLM call in the pipeline.
+
+- Exponential backoff with full jitter between retries (honours Retry-After)
+- AIMD concurrency: each success raises the in-flight limit additively, each
+  rate-limit error (429 / ResourceExhausted) cuts it multiplicatively, so a
+  stage settles just under the provider's quota
+- Optional minimum spacing between request starts (the old fixed sleeps)
+- A retry budget: items that exhaust their retries, or arrive when the
+  stage-wide budget is spent, go to a dead-letter queue instead of being dropped
+
+- Optional hedging: a call still running past a latency percentile of the
+  stage's recent calls gets one duplicate request, and whichever answers first
+  wins; a hedge budget caps duplicates at a fraction of calls, and no hedges
+  are sent for HEDGE_COOLDOWN seconds after a rate-limit error
+
+call() serves threads; acall() serves coroutines (the async scraper graph) and
+shares the same limit, so sync and async callers of a stage split one quota.
+Hedging applies to call() only.
+"""
+
+import asyncio
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from llm_backend import RateLimitError
+from metrics import metrics
+
+ADMISSION_POLL_SECONDS = 0.05   # how often a waiting coroutine re-checks the in-flight limit
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.05"))          # hedges per call, at most
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))    # calls observed before the first hedge
+HEDGE_COOLDOWN = float(os.getenv("HEDGE_COOLDOWN", "30"))        # seconds without hedges after a 429
+LATENCY_WINDOW = 1000   # recent latencies kept per stage for thresholds and percentiles
+
+
+class RetryExhausted(Exception):
+    """Raised when an item has used up its retries or the stage retry budget"""
+
+    def __init__(self, last_error, attempts):
+        super().__init__(f"gave up after {attempts} attempt(s): {last_error}")
+        self.last_error = last_error
+        self.attempts = attempts
+
+
+def is_rate_limit_error(error):
+    """True for 429 / quota errors from Gemini, LangChain or the mock backend"""
+    if isinstance(error, RateLimitError):
+        return True
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    text = str(error).lower()
+    return "429" in text or "resource has been exhausted" in text or "rate limit" in text
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter"""
+
+    def __init__(self, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class RetryBudget:
+    """Allow `minimum` retries plus `ratio` retries per successful call"""
+
+    def __init__(self, ratio=0.2, minimum=20):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.successes = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.successes += 1
+
+    def withdraw(self):
+        with self._lock:
+            if self.retries >= self.minimum + self.ratio * self.successes:
+                return False
+            self.retries += 1
+            return True
+
+
+def percentile(values, q):
+    """Nearest-rank percentile (q in 0-100) of a non-empty sequence"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+class HedgePolicy:
+    """When to send a duplicate request: past `percentile` of recent latencies, within `budget` hedges per call"""
+
+    def __init__(self, percentile=95.0, budget=HEDGE_BUDGET, min_samples=HEDGE_MIN_SAMPLES):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.hedges = 0
+        self.wins = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        """Latency of one completed attempt (hedges included: they sample the same provider)"""
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def threshold(self):
+        """Seconds to wait before hedging, or None while there are too few samples"""
+        with self._lock:
+            self.calls += 1
+            if len(self.latencies) < self.min_samples:
+                return None
+            return percentile(self.latencies, self.percentile)
+
+    def withdraw(self):
+        with self._lock:
+            if self.hedges >= self.budget * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def refund(self):
+        with self._lock:
+            self.hedges -= 1
+
+    def won(self):
+        with self._lock:
+            self.wins += 1
+
+
+def hedge_policy(stage_env):
+    """HedgePolicy from <STAGE_ENV>_HEDGE_PERCENTILE, or None when unset or 0 (hedging off)"""
+    value = float(os.getenv(f"{stage_env}_HEDGE_PERCENTILE", "0"))
+    return HedgePolicy(percentile=value) if value > 0 else None
+
+
+class AIMDController:
+    """Additive-increase/multiplicative-decrease concurrency limiter with retries"""
+
+    def __init__(self, stage, initial_limit=2, min_limit=1, max_limit=8, increase=1.0, decrease=0.5,
+                 min_interval=0.0, retry_policy=None, retry_budget=None, hedge=None):
+        self.stage = stage
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.min_interval = min_interval
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retry_budget = retry_budget or RetryBudget()
+        self.hedge = hedge
+        self.in_flight = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._cond = threading.Condition()
+        self._next_start = 0.0
+        self._last_decrease = 0.0
+        self._hedge_pool = None
+
+    def _admit(self):
+        """Take an in-flight slot and return the earliest start time (caller holds _cond)"""
+        self.in_flight += 1
+        start_at = max(time.time(), self._next_start)
+        self._next_start = start_at + self.min_interval
+        return start_at
+
+    def _has_slot(self):
+        return self.in_flight < max(int(self.limit), self.min_limit)
+
+    def _acquire(self):
+        with self._cond:
+            while not self._has_slot():
+                self._cond.wait()
+            start_at = self._admit()
+        wait = start_at - time.time()
+        if wait > 0:
+            with metrics.timer(f"{self.stage}_sleep"):
+                time.sleep(wait)
+
+    async def _aacquire(self):
+        # Never block the event loop on the condition; poll it between sleeps instead
+        while True:
+            with self._cond:
+                if self._has_slot():
+                    start_at = self._admit()
+                    break
+            await asyncio.sleep(ADMISSION_POLL_SECONDS)
+        wait = start_at - time.time()
+        if wait > 0:
+            with metrics.timer(f"{self.stage}_sleep"):
+                await asyncio.sleep(wait)
+
+    def _admit_hedge(self):
+        """
+        Admit a hedge past the concurrency limit (the hedge budget bounds them, and the
+        limit is usually full exactly when a call is stuck), unless the stage was
+        rate limited recently. Returns the earliest start time, or None.
+        """
+        with self._cond:
+            if time.time() - self._last_decrease < HEDGE_COOLDOWN:
+                return None
+            return self._admit()
+
+    def _return_slot(self):
+        """Give a slot back without adjusting the limit"""
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def _release(self, rate_limited):
+        with self._cond:
+            self.in_flight -= 1
+            if rate_limited:
+                # Only back off once per burst of 429s from the same window
+                now = time.time()
+                if now - self._last_decrease > 1.0:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + self.increase / max(self.limit, 1.0))
+            metrics.set_gauge("pipeline_concurrency_limit", round(self.limit, 3), stage=self.stage)
+            self._cond.notify_all()
+
+    def _failed(self, error, attempt):
+        """Release after a failed attempt; returns the backoff delay or raises RetryExhausted"""
+        rate_limited = is_rate_limit_error(error)
+        self._release(rate_limited)
+        if attempt > self.retry_policy.max_retries or not self.retry_budget.withdraw():
+            raise RetryExhausted(error, attempt) from error
+        metrics.retry(self.stage, reason="rate_limit" if rate_limited else "error")
+        delay = self.retry_policy.backoff(attempt, getattr(error, "retry_after", None))
+        print(f"    {'429' if rate_limited else 'Error'} on {self.stage} "
+              f"(attempt {attempt}), retrying in {delay:.1f}s - limit {self.limit:.1f}")
+        return delay
+
+    def _succeeded(self):
+        self._release(False)
+        self.retry_budget.deposit()
+
+    def _timed(self, fn, args, kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        if self.hedge is not None:
+            self.hedge.record(time.perf_counter() - start)
+        return result
+
+    def _hedged_attempt(self, fn, args, kwargs):
+        """
+        One attempt, duplicated once if it outlives the hedge threshold. The first
+        success wins; the loser keeps its slot until it finishes and is then released
+        like any other call, so the in-flight count matches what the provider sees.
+        """
+        threshold = self.hedge.threshold()
+        if threshold is None:
+            return self._timed(fn, args, kwargs)
+        if self._hedge_pool is None:
+            with self._cond:
+                if self._hedge_pool is None:
+                    self._hedge_pool = ThreadPoolExecutor(max_workers=2 * self.max_limit,
+                                                          thread_name_prefix=f"{self.stage}-hedge")
+        primary = self._hedge_pool.submit(self._timed, fn, args, kwargs)
+        done, _ = wait([primary], timeout=threshold)
+        if done:
+            return primary.result()
+        if not self.hedge.withdraw():
+            return primary.result()
+        start_at = self._admit_hedge()
+        if start_at is None:
+            self.hedge.refund()
+            return primary.result()
+        # Respect min_interval, but drop the hedge if the primary answers meanwhile
+        done, _ = wait([primary], timeout=max(0.0, start_at - time.time()))
+        if done:
+            self._return_slot()
+            self.hedge.refund()
+            return primary.result()
+        metrics.inc("pipeline_hedges_total", stage=self.stage)
+        hedge = self._hedge_pool.submit(self._timed, fn, args, kwargs)
+        pending, winner = {primary, hedge}, None
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((f for f in done if f.exception() is None), None)
+        # The caller releases one slot for the winner (or the primary's error); the other releases itself
+        counted = winner or primary
+        other = hedge if counted is primary else primary
+        other.add_done_callback(lambda f: self._release(f.exception() is not None and is_rate_limit_error(f.exception())))
+        if winner is hedge:
+            self.hedge.won()
+            metrics.inc("pipeline_hedge_wins_total", stage=self.stage)
+        return counted.result()
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn with retries, backoff and AIMD admission (and hedging, if enabled); raises RetryExhausted"""
+        attempt = 0
+        start = time.perf_counter()
+        while True:
+            self._acquire()
+            try:
+                result = fn(*args, **kwargs) if self.hedge is None else self._hedged_attempt(fn, args, kwargs)
+            except Exception as e:
+                attempt += 1
+                delay = self._failed(e, attempt)
+                with metrics.timer(f"{self.stage}_backoff"):
+                    time.sleep(delay)
+                continue
+            self._succeeded()
+            self.latencies.append(time.perf_counter() - start)
+            return result
+
+    async def acall(self, fn, *args, **kwargs):
+        """Await the coroutine function fn with the same retries and admission as call()"""
+        attempt = 0
+        while True:
+            await self._aacquire()
+            try:
+                result = await fn(*args, **kwargs)
+            except asyncio.CancelledError:
+                # A cancelled run says nothing about the provider's quota
+                self._return_slot()
+                raise
+            except Exception as e:
+                attempt += 1
+                delay = self._failed(e, attempt)
+                with metrics.timer(f"{self.stage}_backoff"):
+                    await asyncio.sleep(delay)
+                continue
+            self._succeeded()
+            return result
+
+    def latency_summary(self):
+        """p50/p95/p99 of recent call() latencies (retries and hedges included) and the hedge rate"""
+        latencies = list(self.latencies)
+        summary = {f"p{q}_seconds": percentile(latencies, q) if latencies else 0.0 for q in (50, 95, 99)}
+        summary["calls"] = len(latencies)
+        if self.hedge is not None:
+            summary["hedges"] = self.hedge.hedges
+            summary["hedge_wins"] = self.hedge.wins
+            summary["hedge_rate"] = self.hedge.hedges / max(self.hedge.calls, 1)
+        return summary
+
+    def report(self):
+        """Print the latency summary and publish it as gauges"""
+        summary = self.latency_summary()
+        if not summary["calls"]:
+            return summary
+        for q in (50, 95, 99):
+            metrics.set_gauge("pipeline_call_latency_seconds", round(summary[f"p{q}_seconds"], 4),
+                              stage=self.stage, quantile=f"0.{q}")
+        line = (f"{self.stage} latency over {summary['calls']} calls: p50 {summary['p50_seconds']:.2f}s, "
+                f"p95 {summary['p95_seconds']:.2f}s, p99 {summary['p99_seconds']:.2f}s")
+        if self.hedge is not None:
+            metrics.set_gauge("pipeline_hedge_rate", round(summary["hedge_rate"], 4), stage=self.stage)
+            line += (f"; hedged {summary['hedge_rate'] * 100:.1f}% ({summary['hedges']} hedges, "
+                     f"{summary['hedge_wins']} won, p{self.hedge.percentile:g} trigger)")
+        print(line)
+        return summary
+
+
+class Outcome:
+    """Result of one item processed by ordered_map"""
+
+    def __init__(self, value=None, error=None):
+        self.value = value
+        self.error = error
+
+
+def ordered_map(items, fn, controller, lookahead=4):
+    """
+    Apply fn to items concurrently (bounded by the controller's limit) and
+    yield (item, Outcome) in input order so callers can checkpoint in order.
+    fn should route its LLM calls through controller.call.
+    """
+    items = iter(items)
+    pending = deque()
+    window = max(controller.max_limit * lookahead, 1)
+
+    def run(item):
+        try:
+            return Outcome(value=fn(item))
+        except Exception as e:
+            return Outcome(error=e)
+
+    with ThreadPoolExecutor(max_workers=controller.max_limit) as executor:
+        try:
+            for item in items:
+                pending.append((item, executor.submit(run, item)))
+                if len(pending) >= window:
+                    item, future = pending.popleft()
+                    yield item, future.result()
+            while pending:
+                item, future = pending.popleft()
+                yield item, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+class DeadLetterQueue:
+    """Append-only JSON-lines store of items that exhausted their retries"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Return one entry per key (the most recent failure wins)"""
+        if not os.path.exists(self.path):
+            return []
+        entries = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry["key"]] = entry
+        return list(entries.values())
+
+    def add(self, key, payload, error, attempts=0):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        entry = {"key": key, "payload": payload, "error": str(error), "attempts": attempts, "time": time.time()}
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        metrics.inc("pipeline_dead_letters_total", stage=os.path.basename(self.path))
+
+    def remove(self, keys):
+        """Drop entries whose key is in `keys` (after a successful replay)"""
+        keys = set(keys)
+        if not keys:
+            return
+        with self._lock:
+            remaining = [e for e in self.load() if e["key"] not in keys]
+            with open(self.path, "w", encoding="utf-8") as f:
+                for entry in remaining:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
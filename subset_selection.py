@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Coverage-maximizing subset selection for the final training set.
+
+Embeds every Q&A pair with an offline hashed TF-IDF vectorizer (NumPy only),
+then picks a subset of the requested size that covers the whole set:
+
+- kcenter:  greedy farthest-first traversal, minimizes the worst-case distance
+            from any record to its nearest selected record (fast, O(N*k*d))
+- facility: lazy-greedy facility location, maximizes the summed similarity of
+            every record to its nearest selected record (better average coverage)
+
+Writes the selected records plus coverage statistics so training cost falls
+with the subset size without dropping topics.
+"""
+
+import argparse
+import heapq
+import json
+import os
+import re
+import zlib
+
+import numpy as np
+from colorama import Fore
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+MARKUP_PATTERN = re.compile(r"<br\s*/?>|[*#`_>|-]")
+
+STOPWORDS = set("""
+a an the and or but if of to in on at by for with from as is are was were be been being this that these those
+it its into over under than then so such not no can could should would will may might must do does did have has
+had you your we our they their there here which who whom whose what when where why how all any each more most
+other some also only very just about after before between during while up down out off again i me my
+""".split())
+
+
+def tokenize(text):
+    """Lower-cased unigrams and bigrams with markdown markup removed"""
+    words = [w for w in WORD_PATTERN.findall(MARKUP_PATTERN.sub(" ", text.lower())) if w not in STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def record_text(record):
+    return f"{record.get('question', '')} {record.get('answer', '')}"
+
+
+def hashed_tfidf(texts, n_features=4096):
+    """Dense, L2-normalised hashed TF-IDF matrix (float32, one row per text)"""
+    counts = np.zeros((len(texts), n_features), dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        if not tokens:
+            continue
+        cols = np.fromiter((zlib.crc32(t.encode("utf-8")) % n_features for t in tokens), dtype=np.int64, count=len(tokens))
+        np.add.at(counts[row], cols, 1.0)
+
+    document_frequency = (counts > 0).sum(axis=0)
+    idf = np.log((1 + len(texts)) / (1 + document_frequency)).astype(np.float32) + 1.0
+    matrix = np.log1p(counts) * idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def greedy_k_center(X, k):
+    """Farthest-first traversal starting from the record closest to the centroid"""
+    first = int(np.argmax(X @ X.mean(axis=0)))
+    selected = [first]
+    distance = 1.0 - X @ X[first]
+    distance[first] = -1.0
+    for _ in range(k - 1):
+        nxt = int(np.argmax(distance))
+        selected.append(nxt)
+        distance = np.minimum(distance, 1.0 - X @ X[nxt])
+        distance[selected] = -1.0
+    return selected
+
+
+def greedy_facility_location(X, k, block_size=1024, batch=32, max_dense=8000):
+    """
+    Lazy-greedy maximisation of sum_i max_{j in S} max(0, sim(i, j)).
+    Stale upper bounds are refreshed `batch` candidates at a time with one matmul;
+    up to `max_dense` records the similarity matrix is computed once and reused.
+    """
+    n = X.shape[0]
+    S = np.maximum(X @ X.T, 0) if n <= max_dense else None
+    if S is not None:
+        gains = S.sum(axis=0, dtype=np.float64)
+    else:
+        gains = np.zeros(n, dtype=np.float64)
+        for start in range(0, n, block_size):
+            gains += np.maximum(X[start:start + block_size] @ X.T, 0).sum(axis=0)
+
+    best = np.zeros(n, dtype=np.float32)
+    heap = [(-gain, j) for j, gain in enumerate(gains)]
+    heapq.heapify(heap)
+    selected = []
+    while heap and len(selected) < k:
+        candidates = [heapq.heappop(heap)[1] for _ in range(min(batch, len(heap)))]
+        similarity = S[:, candidates] if S is not None else np.maximum(X @ X[candidates].T, 0)
+        fresh = np.maximum(similarity - best[:, None], 0).sum(axis=0)
+        top = int(np.argmax(fresh))
+        for pos, j in enumerate(candidates):
+            if pos != top:
+                heapq.heappush(heap, (-float(fresh[pos]), j))
+        # Gains only shrink, so the winner is exact if it still beats every stale bound
+        if heap and fresh[top] < -heap[0][0]:
+            heapq.heappush(heap, (-float(fresh[top]), candidates[top]))
+            continue
+        selected.append(candidates[top])
+        best = np.maximum(best, similarity[:, top])
+    return selected
+
+
+def coverage_stats(X, records, selected, texts):
+    """How well the subset covers the full set"""
+    nearest = np.zeros(X.shape[0], dtype=np.float32)
+    for start in range(0, len(selected), 512):
+        block = X[selected[start:start + 512]]
+        nearest = np.maximum(nearest, (X @ block.T).max(axis=1))
+
+    # Terms that appear in at least two records = the set's recurring topics
+    full_terms, subset_terms = {}, set()
+    for i, text in enumerate(texts):
+        for term in set(tokenize(text)):
+            full_terms[term] = full_terms.get(term, 0) + 1
+    for i in selected:
+        subset_terms.update(tokenize(texts[i]))
+    topical = {t for t, count in full_terms.items() if count >= 2}
+
+    stats = {
+        "total_records": len(records),
+        "selected_records": len(selected),
+        "fraction": round(len(selected) / max(len(records), 1), 4),
+        "mean_nearest_similarity": round(float(nearest.mean()), 4),
+        "p10_nearest_similarity": round(float(np.percentile(nearest, 10)), 4),
+        "min_nearest_similarity": round(float(nearest.min()), 4),
+        "covered_at_0.5": round(float((nearest >= 0.5).mean()), 4),
+        "topic_term_coverage": round(len(topical & subset_terms) / max(len(topical), 1), 4),
+    }
+
+    sources = {}
+    for i, record in enumerate(records):
+        source = record.get("source_file")
+        if source:
+            entry = sources.setdefault(source, {"total": 0, "selected": 0})
+            entry["total"] += 1
+    for i in selected:
+        source = records[i].get("source_file")
+        if source:
+            sources[source]["selected"] += 1
+    if sources:
+        stats["per_source"] = sources
+    return stats
+
+
+def select_subset(records, size, method="kcenter", n_features=4096):
+    """Return (selected indices in original order, coverage stats)"""
+    texts = [record_text(r) for r in records]
+    X = hashed_tfidf(texts, n_features)
+    size = max(1, min(size, len(records)))
+    if method == "facility":
+        selected = greedy_facility_location(X, size)
+    else:
+        selected = greedy_k_center(X, size)
+    stats = coverage_stats(X, records, selected, texts)
+    stats["method"] = method
+    return sorted(selected), stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Select a diverse, high-coverage training subset")
+    parser.add_argument("--input", default="final_dataset/filtered.json")
+    parser.add_argument("--output", default="final_dataset/selected.json")
+    parser.add_argument("--stats", default="final_dataset/selection_stats.json")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--size", type=int, help="Number of records to keep")
+    group.add_argument("--fraction", type=float, help="Share of records to keep (0-1)")
+    parser.add_argument("--method", choices=["kcenter", "facility"], default="kcenter")
+    parser.add_argument("--features", type=int, default=4096, help="Hashed feature dimensions")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with open(args.input, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    if not records:
+        print(f"{Fore.RED}Error: {args.input} is empty{Fore.RESET}")
+        return
+
+    size = args.size if args.size is not None else round(len(records) * args.fraction)
+    print(f"{Fore.CYAN}Selecting {size}/{len(records)} records with {args.method}{Fore.RESET}")
+    selected, stats = select_subset(records, size, args.method, args.features)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump([records[i] for i in selected], f, indent=2)
+    with open(args.stats, "w", encoding="utf-8") as f:
+        json.dump(stats, f, indent=2)
+
+    print(f"{Fore.GREEN}✓ Selected {stats['selected_records']} records ({stats['fraction']:.0%}){Fore.RESET}")
+    print(f"Mean nearest-neighbour similarity: {stats['mean_nearest_similarity']}")
+    print(f"Records covered at similarity >= 0.5: {stats['covered_at_0.5']:.1%}")
+    print(f"Topic term coverage: {stats['topic_term_coverage']:.1%}")
+    print(f"Subset saved to: {args.output}")
+    print(f"Coverage statistics saved to: {args.stats}")
+    print(f"Train on it with: TRAIN_DATA_FILE={args.output} python train.py")
+
+
+if __name__ == "__main__":
+    main()
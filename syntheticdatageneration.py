@@ -1,19 +1,36 @@
 from colorama import Fore
 from pydantic import BaseModel
-from prompts import generation_prompt_template
+from prompts import generation_prompt_template, packed_generation_prompt_template
+from metrics import metrics, start_run
+from llm_backend import lazy_backend
+from rate_control import AIMDController, DeadLetterQueue, Outcome, hedge_policy, ordered_map
+from work_ledger import LeaseHeartbeat, WorkLedger, chunk_digest
+from generation_planner import OUTPUT_TOKENS_PER_RECORD, count_tokens, load_plan
+from lineage import text_digest
+from chunk_scheduler import coverage, load_dataset, order_chunks, print_coverage, write_coverage
+import argparse
 import json
 import re
 import glob
 import os
+import socket
 import time
-import google.generativeai as genai
 
 from dotenv import load_dotenv
 load_dotenv()
 
-# Configure Google Gemini
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-model = genai.GenerativeModel('gemini-2.0-flash')
+# LLM backend (LLM_BACKEND=gemini|mock, LLM_MODEL overrides the model), built on first call
+model = lazy_backend('gemini-2.0-flash')
+
+REQUEST_DELAY = float(os.getenv("GENERATION_REQUEST_DELAY", "4"))  # minimum seconds between API call starts
+MAX_CONCURRENCY = int(os.getenv("GENERATION_MAX_CONCURRENCY", "4"))  # AIMD ceiling for in-flight calls
+PACK_OUTPUT_TOKENS = int(os.getenv("GENERATION_PACK_OUTPUT_TOKENS", "8000"))  # model output limit per packed request
+
+# Shared retry/backoff + AIMD concurrency control for every generation call
+# (GENERATION_HEDGE_PERCENTILE=95 duplicates calls slower than the recent p95)
+controller = AIMDController("generation", max_limit=MAX_CONCURRENCY, min_interval=REQUEST_DELAY,
+                            hedge=hedge_policy("GENERATION"))
+dead_letters = DeadLetterQueue("dataset/dead_letter_generation.jsonl")
 
 class Record(BaseModel):
     question: str
@@ -22,24 +39,30 @@ class Record(BaseModel):
 class Response(BaseModel):
     records: list[Record]
 
-def load_existing_progress():
-    """Load existing progress if any"""
-    progress_file = "dataset/generation_progress.json"
-    if os.path.exists(progress_file):
-        with open(progress_file, 'r') as f:
-            progress = json.load(f)
-        print(f"{Fore.CYAN}Resuming from chunk {progress['last_processed_chunk'] + 1}{Fore.RESET}")
-        return progress
-    return {"last_processed_chunk": -1, "total_generated": 0}
-
-def save_progress(chunk_idx, total_generated):
-    """Save current progress"""
-    progress = {
-        "last_processed_chunk": chunk_idx,
-        "total_generated": total_generated
-    }
-    with open("dataset/generation_progress.json", 'w') as f:
-        json.dump(progress, f, indent=2)
+class ResponseParseError(ValueError):
+    """The LLM answered with text that is not valid JSON; retried like any other failed call"""
+
+def pending_chunks(chunk_files, dataset):
+    """
+    Chunk files without an up-to-date raw.json entry: new chunks and chunks whose
+    text changed since generation (entries record the chunk digest). Entries
+    written before digests were recorded are kept as they are.
+    """
+    generated = {entry.get("chunk_file"): entry.get("chunk_digest") for entry in dataset.values()}
+    pending = []
+    for chunk_path in chunk_files:
+        name = os.path.basename(chunk_path)
+        if name not in generated:
+            pending.append(chunk_path)
+        elif generated[name] is not None and generated[name] != text_digest(load_chunk(chunk_path)[0]):
+            pending.append(chunk_path)
+    return pending
+
+def store_entry(dataset, key, entry):
+    """Add an entry under its chunk file name, replacing older entries for the same chunk"""
+    for old_key in [k for k, e in dataset.items() if e.get("chunk_file") == entry["chunk_file"]]:
+        del dataset[old_key]
+    dataset[key] = entry
 
 def clean_json_breaking_characters(text):
     """Remove only characters that break JSON parsing while preserving markdown"""
@@ -52,33 +75,296 @@ def clean_json_breaking_characters(text):
     
     return cleaned
 
-def llm_call(data: str) -> dict:
+def strip_code_fences(text):
+    """Clean JSON-breaking characters and remove any leading/trailing ``` or ```json fences"""
+    text = clean_json_breaking_characters(text)
+    return re.sub(r"^```(?:json)?\s*|\s*```$", "", text, flags=re.MULTILINE | re.DOTALL).strip()
+
+DEFAULT_NUM_RECORDS = 15
+
+def llm_call(data: str, num_records: int = DEFAULT_NUM_RECORDS) -> dict:
     """
-    Calls Google Gemini to generate 8-15 Q&A pairs and returns the parsed JSON.
+    Calls Google Gemini to generate num_records Q&A pairs and returns the parsed JSON.
+    Raises ResponseParseError when the response is not JSON, so the controller retries it.
     """
-    prompt = generation_prompt_template(data)  # Use the template from prompts.py
+    prompt = generation_prompt_template(data, num_records=num_records)  # Use the template from prompts.py
     
-    response = model.generate_content(prompt)
+    with metrics.timer("generation_llm"):
+        response = model.generate_content(prompt)
+    metrics.record_tokens("generation_llm", response)
     data_text = response.text
     
     print(f"{Fore.LIGHTGREEN_EX}LLM Response received{Fore.RESET}")
     
-    # Clean special characters that break JSON, but preserve markdown formatting
-    data_text = clean_json_breaking_characters(data_text)
-    
-    # Remove any leading/trailing ``` or ```json fences
-    cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", data_text, flags=re.MULTILINE | re.DOTALL).strip()
+    # Clean special characters that break JSON (preserving markdown) and strip code fences
+    cleaned = strip_code_fences(data_text)
     
     try:
-        parsed_data = json.loads(cleaned)
+        with metrics.timer("generation_parse"):
+            parsed_data = json.loads(cleaned)
         return parsed_data
     except json.JSONDecodeError as e:
+        metrics.inc("pipeline_parse_failures_total", stage="generation")
         print(f"{Fore.RED}JSON parsing failed: {e}{Fore.RESET}")
         print(f"Raw response: {cleaned[:500]}...")
-        return []
+        raise ResponseParseError(f"JSON parsing failed: {e}") from e
 
+def llm_call_packed(chunks) -> dict:
+    """
+    Generate Q&A pairs for several chunks in one call.
+    `chunks` is a list of (chunk_id, data, num_records); returns {chunk_id: [pairs]}.
+    Raises ResponseParseError when the response is not JSON, so the controller retries the pack.
+    """
+    prompt = packed_generation_prompt_template(chunks)
+    
+    with metrics.timer("generation_llm"):
+        response = model.generate_content(prompt)
+    metrics.record_tokens("generation_llm", response)
+    metrics.inc("pipeline_packed_requests_total", stage="generation")
+    
+    cleaned = strip_code_fences(response.text)
+    print(f"{Fore.LIGHTGREEN_EX}Packed LLM Response received ({len(chunks)} chunks){Fore.RESET}")
+    
+    try:
+        with metrics.timer("generation_parse"):
+            parsed_data = json.loads(cleaned)
+    except json.JSONDecodeError as e:
+        metrics.inc("pipeline_parse_failures_total", stage="generation")
+        print(f"{Fore.RED}Packed JSON parsing failed: {e}{Fore.RESET}")
+        raise ResponseParseError(f"packed JSON parsing failed: {e}") from e
+    return parsed_data if isinstance(parsed_data, dict) else {}
 
-if __name__ == "__main__":
+
+def load_chunk(chunk_path):
+    """Load a chunk file and return (content, source_info)"""
+    with open(chunk_path, 'r', encoding='utf-8') as f:
+        chunk_data = json.load(f)
+    
+    chunk_content = chunk_data['contextualized_text']
+    source_info = f"Source: {chunk_data['source_file']}, Chunk: {chunk_data['chunk_index']}"
+    return chunk_content, source_info
+
+def planned_records(plan, chunk_path):
+    return (plan or {}).get(os.path.basename(chunk_path), DEFAULT_NUM_RECORDS)
+
+def build_entry(data, chunk_path, chunk_content, source_info):
+    """Build the raw.json entry for one chunk"""
+    return {
+        "generated": data, 
+        "context": chunk_content[:500] + "...",  # Store preview of context
+        "chunk_file": os.path.basename(chunk_path),
+        "chunk_digest": text_digest(chunk_content),  # lineage.py regenerates the chunk when its text changes
+        "source_info": source_info
+    }
+
+def generate_entry(chunk_path, plan=None):
+    """Generate Q&A pairs for one chunk (with retries) and build its raw.json entry"""
+    chunk_content, source_info = load_chunk(chunk_path)
+    num_records = planned_records(plan, chunk_path)
+    
+    print(f"{Fore.BLUE}Calling LLM for {os.path.basename(chunk_path)} ({num_records} pairs)...{Fore.RESET}")
+    data = controller.call(llm_call, chunk_content, num_records)
+    
+    return build_entry(data, chunk_path, chunk_content, source_info)
+
+def _outcome_of(fn, *args):
+    try:
+        return Outcome(value=fn(*args))
+    except Exception as e:
+        return Outcome(error=e)
+
+def make_packs(work, plan, max_tokens, max_chunks):
+    """Group consecutive (key, chunk_path) items into packs under the input/output token budgets"""
+    packs, current, input_tokens, output_tokens = [], [], 0, 0
+    for item in work:
+        chunk_content, _ = load_chunk(item[1])
+        tokens = count_tokens(chunk_content)
+        expected_output = planned_records(plan, item[1]) * OUTPUT_TOKENS_PER_RECORD
+        if current and (len(current) >= max_chunks or input_tokens + tokens > max_tokens
+                        or output_tokens + expected_output > PACK_OUTPUT_TOKENS):
+            packs.append(current)
+            current, input_tokens, output_tokens = [], 0, 0
+        current.append(item)
+        input_tokens += tokens
+        output_tokens += expected_output
+    if current:
+        packs.append(current)
+    return packs
+
+def generate_pack(pack, plan=None):
+    """
+    Generate entries for a pack of (key, chunk_path) items with one request.
+    Returns [(key, chunk_path, Outcome)]; chunks missing from the response are retried alone.
+    """
+    if len(pack) == 1:
+        key, chunk_path = pack[0]
+        return [(key, chunk_path, _outcome_of(generate_entry, chunk_path, plan))]
+    
+    loaded = [load_chunk(chunk_path) for _, chunk_path in pack]
+    chunks = [(f"c{n}", content, planned_records(plan, chunk_path))
+              for n, ((_, chunk_path), (content, _)) in enumerate(zip(pack, loaded))]
+    
+    print(f"{Fore.BLUE}Calling LLM for a pack of {len(pack)} chunks ({sum(c[2] for c in chunks)} pairs)...{Fore.RESET}")
+    try:
+        packed = controller.call(llm_call_packed, chunks)
+    except Exception as e:
+        return [(key, chunk_path, Outcome(error=e)) for key, chunk_path in pack]
+    
+    results = []
+    for (chunk_id, content, _), (key, chunk_path), (_, source_info) in zip(chunks, pack, loaded):
+        pairs = packed.get(chunk_id)
+        if isinstance(pairs, list) and pairs:
+            results.append((key, chunk_path, Outcome(value=build_entry(pairs, chunk_path, content, source_info))))
+        else:
+            metrics.inc("pipeline_pack_missing_total", stage="generation")
+            print(f"{Fore.YELLOW}{os.path.basename(chunk_path)} missing from packed response - retrying alone{Fore.RESET}")
+            results.append((key, chunk_path, _outcome_of(generate_entry, chunk_path, plan)))
+    return results
+
+def pack_tokens(pack, plan):
+    """Estimated input + output tokens of one request, charged against --token-budget"""
+    return sum(count_tokens(load_chunk(chunk_path)[0]) + planned_records(plan, chunk_path) * OUTPUT_TOKENS_PER_RECORD
+               for _, chunk_path in pack)
+
+class RunBudget:
+    """--max-minutes / --token-budget for one run; spent across every batch of work the run takes on"""
+    
+    def __init__(self, max_minutes=0, token_budget=0):
+        self.deadline = time.time() + max_minutes * 60 if max_minutes else None
+        self.token_budget = token_budget
+        self.spent = 0
+        self.exhausted = False
+    
+    def spend(self, pack, plan):
+        """Charge one request; False once the budget is spent"""
+        cost = pack_tokens(pack, plan) if self.token_budget else 0
+        if (self.deadline and time.time() >= self.deadline) or (self.token_budget and self.spent + cost > self.token_budget):
+            self.exhausted = True
+            return False
+        self.spent += cost
+        return True
+
+def within_budget(packs, plan, budget):
+    """Hand out packs until the budget is spent; requests already queued still finish"""
+    for n, pack in enumerate(packs):
+        if not budget.spend(pack, plan):
+            left = sum(len(p) for p in packs[n:])
+            print(f"{Fore.YELLOW}Budget reached after ~{budget.spent:,} tokens - {left} chunks left for the next run{Fore.RESET}")
+            return
+        yield pack
+
+def iter_generated(work, plan, args, budget=None):
+    """Yield (key, chunk_path, Outcome) for every (key, chunk_path) work item, in order"""
+    if args.packed:
+        packs = make_packs(work, plan, args.pack_tokens, args.pack_max_chunks)
+        print(f"{Fore.CYAN}Packed {len(work)} chunks into {len(packs)} requests{Fore.RESET}")
+    else:
+        packs = [[item] for item in work]
+    if budget is not None:
+        packs = within_budget(packs, plan, budget)
+    
+    for pack, outcome in ordered_map(packs, lambda pack: generate_pack(pack, plan), controller):
+        if outcome.error is not None:
+            for key, chunk_path in pack:
+                yield key, chunk_path, outcome
+        else:
+            yield from outcome.value
+
+def run_ledger_worker(args):
+    """Claim chunks from the shared SQLite ledger until none are left"""
+    worker_id = args.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    start_run(f"generation_{worker_id}")
+    
+    ledger = WorkLedger(args.ledger, lease_seconds=args.lease_seconds)
+    if args.retry_failed:
+        print(f"{Fore.CYAN}Re-queued {ledger.retry_failed()} failed chunks{Fore.RESET}")
+    registered = ledger.registered()
+    digests = {p: chunk_digest(p) for p in sorted(glob.glob(os.path.join("chunks", "*_chunk_*.json")))}
+    # New chunks, and chunks whose text changed since the ledger registered them
+    new_files = [p for p, digest in digests.items() if registered.get(os.path.basename(p)) != digest]
+    if args.order == "value" and new_files:
+        # New chunks get ledger sequence numbers, and so claim order, by value; novelty is
+        # measured against raw.json and the results the ledger already holds
+        generated = {**load_dataset(), **{result["chunk_file"]: result for _, result in ledger.results()}}
+        new_files = order_chunks(new_files, generated)
+    added = ledger.populate([(p, digests[p]) for p in new_files])
+    plan = load_plan()
+    budget = RunBudget(args.max_minutes, args.token_budget)
+    print(f"{Fore.CYAN}Worker {worker_id} using ledger {args.ledger} ({added} new or changed chunks registered): {ledger.counts()}{Fore.RESET}")
+    
+    completed = 0
+    # Leases are renewed while a batch waits out backoff and retries
+    with LeaseHeartbeat(args.ledger, worker_id, args.lease_seconds):
+        while not budget.exhausted:
+            claimed = ledger.claim(worker_id, limit=controller.max_limit * (args.pack_max_chunks if args.packed else 1))
+            if not claimed:
+                break
+            
+            work = [(row, row["chunk_path"]) for row in claimed]
+            finished = set()
+            for row, _, outcome in iter_generated(work, plan, args, budget):
+                finished.add(row["seq"])
+                if outcome.error is None:
+                    if ledger.complete(row["seq"], worker_id, outcome.value):
+                        completed += 1
+                        metrics.item_done("generation")
+                        metrics.inc("pipeline_pairs_generated_total", len(outcome.value["generated"]))
+                        print(f"{Fore.GREEN}✓ {row['chunk_file']} - Generated {len(outcome.value['generated'])} Q&A pairs{Fore.RESET}")
+                    else:
+                        print(f"{Fore.YELLOW}Lease on {row['chunk_file']} expired before commit - result discarded{Fore.RESET}")
+                else:
+                    status = ledger.fail(row["seq"], worker_id, outcome.error)
+                    metrics.inc("pipeline_errors_total", stage="generation")
+                    print(f"{Fore.RED}Error processing {row['chunk_file']}: {outcome.error} - now {status}{Fore.RESET}")
+            # Chunks claimed but never sent because the budget ran out go straight back to the queue
+            ledger.release([row["seq"] for row in claimed if row["seq"] not in finished], worker_id)
+            
+            counts = ledger.counts()
+            metrics.queue_depth("generation", counts["pending"])
+            print(f"{Fore.CYAN}Ledger: {counts}{Fore.RESET}")
+    
+    counts = ledger.counts()
+    print(f"\n{Fore.GREEN}✓ Worker {worker_id} finished - {completed} chunks completed by this worker{Fore.RESET}")
+    print(f"Ledger status: {counts}")
+    if counts["leased"] == 0:
+        # Last worker out writes raw.json for preprocess.py
+        print(f"Exported {ledger.export_raw('dataset/raw.json')} finished chunks to dataset/raw.json")
+    else:
+        print(f"Other workers still hold leases - the last one (or --export) writes dataset/raw.json")
+    controller.report()
+    ledger.close()
+    metrics.export()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate Q&A pairs from chunks")
+    parser.add_argument("--ledger", help="SQLite work ledger shared by several worker processes (e.g. dataset/ledger.db)")
+    parser.add_argument("--worker-id", help="Worker name recorded on leases (default: host-pid)")
+    parser.add_argument("--lease-seconds", type=float, default=600, help="Lease length before a chunk is reclaimed")
+    parser.add_argument("--retry-failed", action="store_true", help="Re-queue chunks the ledger marked failed")
+    parser.add_argument("--export", action="store_true", help="Only export finished ledger results to dataset/raw.json")
+    parser.add_argument("--packed", action="store_true", help="Pack several chunks into one request")
+    parser.add_argument("--pack-tokens", type=int, default=6000, help="Chunk-data token budget per packed request")
+    parser.add_argument("--pack-max-chunks", type=int, default=8, help="Most chunks in one packed request")
+    parser.add_argument("--order", choices=["value", "file"], default="value",
+                        help="Generate the most valuable chunks first (chunk_scheduler.py) or in file order")
+    parser.add_argument("--max-minutes", type=float, default=0, help="Stop sending requests after this many minutes")
+    parser.add_argument("--token-budget", type=int, default=0, help="Stop sending requests after ~this many tokens")
+    parser.add_argument("--dry-run", action="store_true", help="Show the pending work without calling the LLM")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs("dataset", exist_ok=True)
+    if args.ledger:
+        if args.export:
+            ledger = WorkLedger(args.ledger)
+            print(f"Exported {ledger.export_raw('dataset/raw.json')} finished chunks to dataset/raw.json")
+            return
+        run_ledger_worker(args)
+        return
+    
+    start_run("generation")
+    
     # Create dataset directory if it doesn't exist
     os.makedirs("dataset", exist_ok=True)
     
@@ -89,7 +375,7 @@ if __name__ == "__main__":
     
     # Load chunk metadata
     metadata_path = os.path.join("chunks", "chunks_metadata.json")
-    chunk_files = glob.glob(os.path.join("chunks", "*_chunk_*.json"))
+    chunk_files = sorted(glob.glob(os.path.join("chunks", "*_chunk_*.json")))
     
     if not chunk_files:
         print(f"{Fore.RED}Error: No chunk JSON files found in chunks folder.{Fore.RESET}")
@@ -98,10 +384,6 @@ if __name__ == "__main__":
     total_chunks = len(chunk_files)
     print(f"{Fore.CYAN}Found {total_chunks} JSON chunk files to process{Fore.RESET}")
     
-    # Load existing progress
-    progress = load_existing_progress()
-    start_chunk = progress["last_processed_chunk"] + 1
-    
     # Load existing dataset if it exists
     dataset_path = "dataset/raw.json"
     if os.path.exists(dataset_path):
@@ -111,72 +393,91 @@ if __name__ == "__main__":
     else:
         dataset = {}
     
-    # Process chunks starting from where we left off
-    last_api_time = 0
+    # Per-chunk num_records from generation_planner.py, if a plan was made
+    plan = load_plan()
+    if plan:
+        print(f"{Fore.CYAN}Using generation plan for {len(plan)} chunks ({sum(plan.values())} pairs requested){Fore.RESET}")
     
-    for i in range(start_chunk, total_chunks):
-        chunk_path = chunk_files[i]
-        
-        print(f"{Fore.CYAN}\n=== Processing Chunk {i+1}/{total_chunks}: {os.path.basename(chunk_path)} ==={Fore.RESET}")
-        
-        # Load JSON chunk content
-        with open(chunk_path, 'r', encoding='utf-8') as f:
-            chunk_data = json.load(f)
-        
-        chunk_content = chunk_data['contextualized_text']
-        source_info = f"Source: {chunk_data['source_file']}, Chunk: {chunk_data['chunk_index']}"
-        
-        print(f"{Fore.YELLOW}Chunk preview: {chunk_content[:100]}...{Fore.RESET}")
-        print(f"{Fore.YELLOW}{source_info}{Fore.RESET}")
+    # Resume by content: skip every chunk whose entry was generated from its current text
+    pending = pending_chunks(chunk_files, dataset)
+    print(f"{Fore.CYAN}{total_chunks - len(pending)} chunks already generated, {len(pending)} to go{Fore.RESET}")
+    
+    # Chunks that exhausted their retries last time are replayed first; entries whose
+    # chunk has since been generated (or deleted) are settled
+    replay, recovered = [], []
+    for entry in dead_letters.load():
+        if entry["payload"]["chunk_path"] in pending:
+            replay.append((entry["key"], entry["payload"]["chunk_path"]))
+        else:
+            recovered.append(entry["key"])
+    if replay:
+        print(f"{Fore.CYAN}Replaying {len(replay)} dead-lettered chunks{Fore.RESET}")
+    replayed = {key for key, _ in replay}
+    replayed_paths = {chunk_path for _, chunk_path in replay}
+    
+    if args.order == "value" and pending:
+        # Most valuable chunks first: dense, unlike what raw.json already holds, from thin sources
+        pending = order_chunks(pending, dataset)
+        print(f"{Fore.CYAN}Scheduled {len(pending)} chunks by value (chunk_scheduler.py order to preview){Fore.RESET}")
+    work = replay + [(os.path.basename(p), p) for p in pending if p not in replayed_paths]
+    total_generated = 0
+    
+    if args.dry_run:
+        print(f"Dry run: {len(work)} chunks to generate ({len(replay)} replayed), "
+              f"{sum(planned_records(plan, chunk_path) for _, chunk_path in work)} Q&A pairs requested")
+        if args.packed:
+            packs = make_packs(work, plan, args.pack_tokens, args.pack_max_chunks)
+            print(f"Dry run: {len(packs)} packed requests")
+        return
+    
+    budget = RunBudget(args.max_minutes, args.token_budget)
+    for done, (key, chunk_path, outcome) in enumerate(iter_generated(work, plan, args, budget)):
+        metrics.queue_depth("generation", len(work) - done - 1)
         
-        try:
-            # Ensure 4 seconds have passed since last API call
-            if i > 0:  # Skip wait for first chunk
-                time_since_last_api = time.time() - last_api_time
-                if time_since_last_api < 4:
-                    wait_time = 4 - time_since_last_api
-                    print(f"{Fore.MAGENTA}Waiting {wait_time:.1f} seconds before next API call...{Fore.RESET}")
-                    time.sleep(wait_time)
-            
-            print(f"{Fore.BLUE}Calling LLM...{Fore.RESET}")
-            last_api_time = time.time()  # Record when API call was made
-            data = llm_call(chunk_content)  # Generate 5-10 Q&A pairs per chunk
-            
-            # Store the generated data
-            dataset[str(i)] = {
-                "generated": data, 
-                "context": chunk_content[:500] + "...",  # Store preview of context
-                "chunk_file": os.path.basename(chunk_path),
-                "source_info": source_info
-            }
+        if outcome.error is None:
+            data = outcome.value["generated"]
+            # Keyed by chunk file, so adding or removing chunks never shifts other entries
+            store_entry(dataset, outcome.value["chunk_file"], outcome.value)
+            if key in replayed:
+                recovered.append(key)
             
-            print(f"{Fore.GREEN}✓ Chunk {i+1} processed successfully - Generated {len(data)} Q&A pairs{Fore.RESET}")
-            
-            # Save progress after each chunk
-            save_progress(i, progress["total_generated"] + len(data))
-            progress["total_generated"] += len(data)
-            
-            # Save dataset after each chunk (in case of interruption)
-            with open(dataset_path, 'w', encoding='utf-8') as f:
-                json.dump(dataset, f, indent=2)
-            
-        except Exception as e:
-            print(f"{Fore.RED}Error processing chunk {i+1}: {e}{Fore.RESET}")
-            # Store error info instead of skipping
-            dataset[str(i)] = {
-                "error": str(e), 
-                "context": chunk_content[:500] + "...",
-                "chunk_file": os.path.basename(chunk_path)
-            }
-            # Save progress even on error
-            save_progress(i, progress["total_generated"])
-            continue
+            print(f"{Fore.GREEN}✓ Chunk {done + 1}/{len(work)} ({os.path.basename(chunk_path)}) processed successfully - Generated {len(data)} Q&A pairs{Fore.RESET}")
+            metrics.item_done("generation")
+            metrics.inc("pipeline_pairs_generated_total", len(data))
+            total_generated += len(data)
+        else:
+            # Out of retries: park the chunk in the dead-letter queue so a later run replays it
+            print(f"{Fore.RED}Error processing {os.path.basename(chunk_path)}: {outcome.error} - moved to dead-letter queue{Fore.RESET}")
+            metrics.inc("pipeline_errors_total", stage="generation")
+            dead_letters.add(key, {"chunk_path": chunk_path}, outcome.error, getattr(outcome.error, "attempts", 0))
+        
+        # Save dataset after each chunk (in case of interruption); a rerun resumes from its contents
+        with metrics.timer("generation_write"), open(dataset_path, 'w', encoding='utf-8') as f:
+            json.dump(dataset, f, indent=2)
+    
+    dead_letters.remove(recovered)
     
     print(f"\n{Fore.GREEN}✓ Processing complete!{Fore.RESET}")
     print(f"Total entries in dataset: {len(dataset)}")
-    print(f"Total Q&A pairs generated: {progress['total_generated']}")
+    print(f"Q&A pairs generated this run: {total_generated}")
     print(f"Dataset saved to: {dataset_path}")
+    pending = dead_letters.load()
+    if pending:
+        print(f"{Fore.YELLOW}{len(pending)} chunks in dead-letter queue ({dead_letters.path}) - rerun to retry them{Fore.RESET}")
+    controller.report()
     
     # Final save
-    with open(dataset_path, 'w', encoding='utf-8') as f:
+    with metrics.timer("generation_write"), open(dataset_path, 'w', encoding='utf-8') as f:
         json.dump(dataset, f, indent=2)
+    
+    # Which source documents this (possibly partial) dataset covers
+    report = coverage(chunk_files, dataset)
+    print_coverage(report)
+    print(f"Coverage saved to: {write_coverage(report)}")
+    
+    exported = metrics.export()
+    if exported:
+        print(f"Metrics saved to: {', '.join(exported)}")
+
+if __name__ == "__main__":
+    main()
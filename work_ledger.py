@@ -0,0 +1,275 @@
+"""
+SQLite-backed work ledger for splitting generation across worker processes.
+
+One row per chunk with status pending -> leased -> done | failed. Workers
+claim chunks under a time-limited lease; leases of crashed workers expire and
+the chunks are handed out again. Results are committed in the same
+transaction that marks a chunk done, so a chunk is never half-recorded.
+Each row records the digest of the chunk text it was registered with; a
+chunk whose text changed is re-queued, and stale results are never exported.
+
+All writes use BEGIN IMMEDIATE, so any number of processes on one host (or
+on a shared filesystem with working POSIX locks) can claim concurrently.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from lineage import text_digest
+
+PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+LEDGER_DB = "dataset/ledger.db"
+
+def chunk_digest(chunk_path):
+    """Digest of a chunk file's text, as recorded in raw.json entries; None once the file is gone"""
+    if not os.path.exists(chunk_path):
+        return None
+    with open(chunk_path, "r", encoding="utf-8") as f:
+        return text_digest(json.load(f)["contextualized_text"])
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    chunk_file TEXT UNIQUE NOT NULL,
+    chunk_path TEXT NOT NULL,
+    chunk_digest TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_status ON chunks(status, lease_expires);
+"""
+
+
+class WorkLedger:
+    """Shared chunk ledger; one instance per worker process"""
+
+    def __init__(self, path=LEDGER_DB, lease_seconds=600, max_attempts=5):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(chunks)")}
+        if "chunk_digest" not in columns:
+            # Ledgers created before digests were recorded; populate() backfills the column
+            self.conn.execute("ALTER TABLE chunks ADD COLUMN chunk_digest TEXT")
+
+    def _transaction(self):
+        return _Transaction(self.conn)
+
+    def populate(self, chunks):
+        """
+        Register (chunk_path, chunk_digest) pairs in claim order. Rows holding the
+        same digest are left untouched; rows whose chunk text changed are dropped
+        and queued again at their new position. Returns rows added or re-queued.
+        """
+        now = time.time()
+        with self._transaction():
+            known = dict(self.conn.execute("SELECT chunk_file, chunk_digest FROM chunks"))
+            for chunk_path, digest in chunks:
+                name = os.path.basename(chunk_path)
+                if name in known and known[name] is None:
+                    # Rows from before digests: a finished result records the text it came from
+                    known[name] = self._result_digest(name) or digest
+                    self.conn.execute("UPDATE chunks SET chunk_digest = ? WHERE chunk_file = ?", (known[name], name))
+                if name in known and known[name] != digest:
+                    self.conn.execute("DELETE FROM chunks WHERE chunk_file = ?", (name,))
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO chunks (chunk_file, chunk_path, chunk_digest, status, updated) VALUES (?, ?, ?, ?, ?)",
+                [(os.path.basename(p), p, digest, PENDING, now) for p, digest in chunks],
+            )
+            return self.conn.total_changes - before
+
+    def _result_digest(self, chunk_file):
+        row = self.conn.execute("SELECT result FROM chunks WHERE chunk_file = ? AND status = ?",
+                                (chunk_file, DONE)).fetchone()
+        return json.loads(row[0]).get("chunk_digest") if row else None
+
+    def discard_stale(self, digests):
+        """
+        Drop rows for {chunk_file: current digest} unless they hold that digest
+        (None drops the row: the chunk is gone). Returns rows dropped.
+        """
+        with self._transaction():
+            cursor = self.conn.executemany(
+                "DELETE FROM chunks WHERE chunk_file = ? AND (? IS NULL OR chunk_digest IS NULL OR chunk_digest != ?)",
+                [(name, digest, digest) for name, digest in digests.items()],
+            )
+            return cursor.rowcount
+
+    def claim(self, worker, limit=1):
+        """Lease up to `limit` chunks to `worker`, reclaiming expired leases first"""
+        now = time.time()
+        with self._transaction():
+            self.conn.execute(
+                "UPDATE chunks SET status = ?, worker = NULL, lease_expires = NULL, updated = ? "
+                "WHERE status = ? AND lease_expires < ?",
+                (PENDING, now, LEASED, now),
+            )
+            rows = self.conn.execute(
+                "SELECT seq, chunk_file, chunk_path FROM chunks WHERE status = ? ORDER BY seq LIMIT ?",
+                (PENDING, limit),
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE chunks SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, updated = ? "
+                "WHERE seq = ?",
+                [(LEASED, worker, now + self.lease_seconds, now, row[0]) for row in rows],
+            )
+        return [{"seq": seq, "chunk_file": chunk_file, "chunk_path": chunk_path} for seq, chunk_file, chunk_path in rows]
+
+    def renew(self, worker):
+        """Extend every lease this worker still holds; returns how many"""
+        cursor = self.conn.execute(
+            "UPDATE chunks SET lease_expires = ?, updated = ? WHERE worker = ? AND status = ?",
+            (time.time() + self.lease_seconds, time.time(), worker, LEASED),
+        )
+        return cursor.rowcount
+
+    def registered(self):
+        """{chunk file: digest} for every chunk the ledger holds, whatever its status"""
+        return dict(self.conn.execute("SELECT chunk_file, chunk_digest FROM chunks"))
+
+    def release(self, seqs, worker):
+        """Hand back leased chunks this worker never started; the claim does not count as an attempt"""
+        with self._transaction():
+            self.conn.executemany(
+                "UPDATE chunks SET status = ?, worker = NULL, lease_expires = NULL, attempts = attempts - 1, "
+                "updated = ? WHERE seq = ? AND worker = ? AND status = ?",
+                [(PENDING, time.time(), seq, worker, LEASED) for seq in seqs],
+            )
+
+    def complete(self, seq, worker, result):
+        """Atomically store the result and mark done; False if the lease was lost"""
+        with self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE chunks SET status = ?, result = ?, error = NULL, lease_expires = NULL, updated = ? "
+                "WHERE seq = ? AND worker = ? AND status = ?",
+                (DONE, json.dumps(result, ensure_ascii=False), time.time(), seq, worker, LEASED),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, seq, worker, error):
+        """Release a chunk after an error; it is marked failed once attempts run out"""
+        with self._transaction():
+            attempts = self.conn.execute("SELECT attempts FROM chunks WHERE seq = ?", (seq,)).fetchone()[0]
+            status = FAILED if attempts >= self.max_attempts else PENDING
+            self.conn.execute(
+                "UPDATE chunks SET status = ?, worker = NULL, lease_expires = NULL, error = ?, updated = ? "
+                "WHERE seq = ? AND worker = ? AND status = ?",
+                (status, str(error), time.time(), seq, worker, LEASED),
+            )
+            return status
+
+    def retry_failed(self):
+        """Move failed chunks back to pending; returns how many"""
+        with self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE chunks SET status = ?, attempts = 0, updated = ? WHERE status = ?",
+                (PENDING, time.time(), FAILED),
+            )
+            return cursor.rowcount
+
+    def counts(self):
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM chunks GROUP BY status").fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def results(self):
+        """Yield (seq, result) for every finished chunk in ledger order"""
+        for seq, result in self.conn.execute(
+            "SELECT seq, result FROM chunks WHERE status = ? ORDER BY seq", (DONE,)
+        ):
+            yield seq, json.loads(result)
+
+    def export_raw(self, dataset_path="dataset/raw.json"):
+        """
+        Merge finished chunks into raw.json under their chunk file name, the key
+        non-ledger runs use, replacing older entries for the same chunk. Results
+        generated from text the chunk file no longer holds are skipped. Returns
+        how many ledger results were written.
+        """
+        dataset = {}
+        if os.path.exists(dataset_path):
+            with open(dataset_path, "r", encoding="utf-8") as f:
+                dataset = json.load(f)
+        exported = 0
+        rows = self.conn.execute("SELECT chunk_path, result FROM chunks WHERE status = ? ORDER BY seq", (DONE,))
+        for chunk_path, result in rows.fetchall():
+            result = json.loads(result)
+            current = chunk_digest(chunk_path)
+            if current is None or result.get("chunk_digest") not in (None, current):
+                continue
+            chunk_file = result["chunk_file"]
+            for old_key in [k for k, e in dataset.items() if e.get("chunk_file") == chunk_file]:
+                del dataset[old_key]
+            dataset[chunk_file] = result
+            exported += 1
+        tmp_path = f"{dataset_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(dataset, f, indent=2)
+        os.replace(tmp_path, dataset_path)
+        return exported
+
+    def close(self):
+        self.conn.close()
+
+
+class LeaseHeartbeat:
+    """
+    Renews a worker's leases every lease_seconds / 3 from a background thread,
+    so a batch slowed by backoff and retries is not reclaimed mid-flight. Uses
+    its own connection; the worker's connection stays on the worker's thread.
+    """
+
+    def __init__(self, path, worker, lease_seconds):
+        self.path = path
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-heartbeat-{worker}", daemon=True)
+
+    def _run(self):
+        ledger = WorkLedger(self.path, lease_seconds=self.lease_seconds)
+        try:
+            while not self._stop.wait(self.lease_seconds / 3):
+                ledger.renew(self.worker)
+        finally:
+            ledger.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, rolled back on error"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False